@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Przeładowywanie konfiguracji email pipeline w trakcie działania.
+Śledzi czas modyfikacji pliku konfiguracyjnego i buduje z niego skompilowaną konfigurację
+(dopasowania słów kluczowych, zbiory domen, gotowe treści odpowiedzi, mapowanie przepływów),
+którą procesor podmienia w całości między partiami emaili.
+"""
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Pattern, Tuple, Union
+
+from flow_dispatch import FlowRouter
+
+logger = logging.getLogger(__name__)
+
+# Słowa w temacie, dla których odpowiadamy szablonem "support"
+SUPPORT_KEYWORDS = ("support", "wsparcie")
+
+def keyword_matcher(keywords: Iterable[str]) -> Optional[Pattern]:
+    """
+    Kompiluje listę słów kluczowych do jednego wyrażenia dopasowującego podciągi.
+
+    Args:
+        keywords: Słowa kluczowe (porównywane bez rozróżniania wielkości liter)
+
+    Returns:
+        Skompilowane wyrażenie dla tekstu zamienionego na małe litery lub None dla pustej listy
+    """
+    keywords = sorted({keyword.lower() for keyword in keywords}, key=len, reverse=True)
+    if not keywords:
+        return None
+    return re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+class CompiledConfig:
+    """Konfiguracja wraz ze strukturami wyliczonymi z niej raz na wersję pliku."""
+
+    def __init__(self, raw: Dict[str, Any], version: Any = None):
+        """
+        Kompiluje konfigurację.
+
+        Args:
+            raw: Konfiguracja w postaci słownika (jak w email_config.json)
+            version: Identyfikator wersji pliku (czas modyfikacji i rozmiar)
+        """
+        self.raw = raw
+        self.version = version
+
+        auto_reply = raw["auto_reply"]
+        criteria = auto_reply["criteria"]
+        self.from_domains = frozenset(domain.lower() for domain in criteria["from_domains"])
+        self.subject_matcher = keyword_matcher(criteria["subject_contains"])
+        self.priority_matcher = keyword_matcher(criteria["priority_keywords"])
+        self.support_matcher = keyword_matcher(SUPPORT_KEYWORDS)
+
+        # Treści odpowiedzi z dołączonym podpisem
+        signature = auto_reply["signature"]
+        self.reply_bodies = {key: template + signature for key, template in auto_reply["templates"].items()}
+
+        flows = raw["flows"]
+        self.flow_mapping: Tuple[Tuple[str, str], ...] = tuple(flows["flow_mapping"].items())
+        self.flow_router = FlowRouter(flows["flow_mapping"])
+
+class ConfigWatcher:
+    """Wykrywa zmiany pliku konfiguracyjnego na podstawie czasu modyfikacji."""
+
+    def __init__(self, path: Union[str, Path], version: Any = None):
+        """
+        Inicjalizuje obserwatora.
+
+        Args:
+            path: Plik konfiguracyjny
+            version: Wersja pliku, z której pochodzi bieżąca konfiguracja
+        """
+        self.path = Path(path)
+        self.version = version
+
+    def stat_version(self) -> Optional[Tuple[int, int]]:
+        """Zwraca wersję pliku (czas modyfikacji w ns, rozmiar) lub None, jeśli plik nie istnieje."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self) -> Optional[CompiledConfig]:
+        """
+        Sprawdza, czy plik się zmienił, i jeśli tak - kompiluje nową konfigurację.
+
+        Błędny plik (np. zapisany w połowie) nie zastępuje bieżącej konfiguracji; zostanie
+        wczytany ponownie przy kolejnej zmianie.
+
+        Returns:
+            Nowa skompilowana konfiguracja lub None, jeśli nic się nie zmieniło
+        """
+        version = self.stat_version()
+        if version is None or version == self.version:
+            return None
+        self.version = version
+
+        try:
+            with open(self.path, "r") as f:
+                compiled = CompiledConfig(json.load(f), version)
+        except Exception as e:
+            logger.error(f"Nieprawidłowa konfiguracja w {self.path}, pozostaje poprzednia: {str(e)}")
+            return None
+
+        logger.info(f"Przeładowano konfigurację z {self.path}")
+        return compiled
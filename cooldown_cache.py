@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Pamięć podręczna okresów cooldown dla automatycznych odpowiedzi.
+Przechowuje czas ostatniej odpowiedzi jako epoch (float), usuwa wygasłe wpisy przy pomocy
+kopca minimalnego i ogranicza rozmiar, wyrzucając najdawniej używanych nadawców (LRU).
+"""
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+class CooldownCache:
+    """Nadawca -> czas ostatniej odpowiedzi, tylko dla nadawców w okresie cooldown."""
+
+    def __init__(self, cooldown_seconds: float, max_size: int = 100000):
+        """
+        Inicjalizuje pamięć podręczną.
+
+        Args:
+            cooldown_seconds: Długość okresu cooldown w sekundach
+            max_size: Maksymalna liczba nadawców; po przekroczeniu usuwany jest najdawniej używany
+        """
+        self.cooldown_seconds = cooldown_seconds
+        self.max_size = max_size
+
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._expiry: List[Tuple[float, str, float]] = []  # (wygasa, nadawca, czas odpowiedzi)
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def add(self, sender: str, replied_at: Optional[float] = None):
+        """
+        Zapisuje odpowiedź do nadawcy.
+
+        Args:
+            sender: Adres nadawcy
+            replied_at: Czas odpowiedzi (domyślnie teraz)
+        """
+        replied_at = time.time() if replied_at is None else replied_at
+        with self._lock:
+            if replied_at <= self._entries.get(sender, float("-inf")):
+                self._entries.move_to_end(sender)
+                return
+            self._entries[sender] = replied_at
+            self._entries.move_to_end(sender)
+            heapq.heappush(self._expiry, (replied_at + self.cooldown_seconds, sender, replied_at))
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+            # Kopiec zawiera też nieaktualne pozycje nadpisanych wpisów; odbuduj go, gdy urośnie
+            if len(self._expiry) > 2 * len(self._entries) + 64:
+                self._expiry = [(ts + self.cooldown_seconds, s, ts) for s, ts in self._entries.items()]
+                heapq.heapify(self._expiry)
+
+    def discard(self, sender: str, replied_at: float):
+        """
+        Usuwa odpowiedź do nadawcy, jeśli jest to ta zapisana z podanym czasem.
+
+        Args:
+            sender: Adres nadawcy
+            replied_at: Czas odpowiedzi przekazany do add()
+        """
+        with self._lock:
+            if self._entries.get(sender) == replied_at:
+                del self._entries[sender]
+
+    def get(self, sender: str, now: Optional[float] = None) -> Optional[float]:
+        """
+        Zwraca czas ostatniej odpowiedzi, jeśli nadawca jest w okresie cooldown.
+
+        Args:
+            sender: Adres nadawcy
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            Czas odpowiedzi (epoch) lub None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            replied_at = self._entries.get(sender)
+            if replied_at is not None:
+                self._entries.move_to_end(sender)
+            return replied_at
+
+    def in_cooldown(self, sender: str, now: Optional[float] = None) -> bool:
+        """
+        Sprawdza, czy nadawca jest w okresie cooldown.
+
+        Args:
+            sender: Adres nadawcy
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            True, jeśli odpowiedziano mu w ciągu ostatnich cooldown_seconds
+        """
+        return self.get(sender, now) is not None
+
+    def load(self, entries: Dict[str, float], now: Optional[float] = None) -> int:
+        """
+        Wczytuje wpisy, pomijając te, których okres cooldown już minął.
+
+        Args:
+            entries: Słownik nadawca -> czas odpowiedzi
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            Liczba wczytanych wpisów
+        """
+        now = time.time() if now is None else now
+        threshold = now - self.cooldown_seconds
+        active = sorted((replied_at, sender) for sender, replied_at in entries.items() if replied_at > threshold)
+        # Od najstarszych, aby przy limicie rozmiaru zostały najnowsze
+        for replied_at, sender in active:
+            self.add(sender, replied_at)
+        return len(active)
+
+    def reconfigure(self, cooldown_seconds: float, max_size: int, now: Optional[float] = None):
+        """
+        Zmienia długość okresu cooldown i limit rozmiaru dla wpisów już zapisanych.
+
+        Kopiec jest odbudowywany z nowymi czasami wygaśnięcia, a nadmiarowe wpisy
+        są od razu usuwane od najdawniej używanych.
+
+        Args:
+            cooldown_seconds: Nowa długość okresu cooldown w sekundach
+            max_size: Nowa maksymalna liczba nadawców
+            now: Bieżący czas (domyślnie teraz)
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self.cooldown_seconds = cooldown_seconds
+            self.max_size = max_size
+            self._expiry = [(ts + cooldown_seconds, s, ts) for s, ts in self._entries.items()]
+            heapq.heapify(self._expiry)
+            self._expire(now)
+
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(time.time())
+            return len(self._entries)
+
+    def __contains__(self, sender: str) -> bool:
+        return self.get(sender) is not None
+
+    def _expire(self, now: float):
+        """Usuwa wpisy z wierzchołka kopca, których okres cooldown minął (wymaga blokady)."""
+        while self._expiry and self._expiry[0][0] <= now:
+            _, sender, replied_at = heapq.heappop(self._expiry)
+            if self._entries.get(sender) == replied_at:
+                del self._entries[sender]
@@ -5,20 +5,30 @@ Monitoruje skrzynkę pocztową, analizuje przychodzące emaile i automatycznie o
 """
 import os
 import re
+import logging
 import time
 import json
 import email
 import imaplib
-import smtplib
 import sys
+import queue
+import functools
+from concurrent.futures import Future
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple, Callable, FrozenSet, Iterator
 import threading
 from dotenv import load_dotenv
 
+from config_watcher import CompiledConfig, ConfigWatcher
+from cooldown_cache import CooldownCache
+from flow_dispatch import FLOWS_DIR, FlowCache, FlowDispatcher, FlowTimeout, get_flow_runner
+from poll_scheduler import PollScheduler
+from inbound_ledger import InboundLedger, message_key, FETCHED, CLASSIFIED, REPLIED, TRIGGERED, ARCHIVED, STAGES
+from reply_history import ReplyHistory
+
 # Ładowanie zmiennych środowiskowych
 load_dotenv()
 
@@ -53,10 +63,43 @@ except ImportError:
     logger.add(sys.stderr, level="INFO")
     logger.add(LOG_FILE, rotation="1 day", retention="30 days", level="DEBUG")
     logger.warning("Moduł advanced_logging nie jest dostępny. Używam standardowego logowania.")
+    setup_logger = log_exception = log_dependency_check = log_config_check = log_performance = None
+
+# Moduły pomocnicze logują przez standardowe logging, którego ten proces nie konfiguruje
+_HELPER_LOGGERS = ("config_watcher", "cooldown_cache", "email_workers", "flow_dispatch",
+                   "inbound_ledger", "poll_scheduler", "reply_history")
+
+class _PipelineLogHandler(logging.Handler):
+    """Przekazuje wpisy standardowego logging do loggera pipeline'u."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record)
+            log = getattr(logger, record.levelname.lower(), logger.info)
+            log(f"[{record.name}] {message}")
+        except Exception:
+            self.handleError(record)
+
+def _bridge_helper_logging() -> None:
+    """Kieruje logi modułów pomocniczych do loggera pipeline'u (i pliku email_pipeline.log)."""
+    handler = _PipelineLogHandler()
+    for name in _HELPER_LOGGERS:
+        helper_logger = logging.getLogger(name)
+        if any(isinstance(h, _PipelineLogHandler) for h in helper_logger.handlers):
+            continue
+        helper_logger.addHandler(handler)
+        helper_logger.setLevel(logging.DEBUG)
+        # Bez propagacji wpisy nie trafiają drugi raz na stderr przez handler domyślny
+        helper_logger.propagate = False
+
+_bridge_helper_logging()
 
 # Konfiguracja email
 EMAIL_CONFIG_FILE = CONFIG_DIR / "email_config.json"
 
+# Znacznik końca partii w kolejkach między etapami przetwarzania
+_END_OF_BATCH = object()
+
 # Domyślna konfiguracja
 DEFAULT_EMAIL_CONFIG = {
     "imap": {
@@ -73,7 +116,8 @@ DEFAULT_EMAIL_CONFIG = {
         "username": os.getenv("SMTP_USERNAME", ""),
         "password": os.getenv("SMTP_PASSWORD", ""),
         "from_email": os.getenv("FROM_EMAIL", ""),
-        "use_tls": True
+        "use_tls": True,
+        "backend": os.getenv("SMTP_BACKEND", "smtplib")
     },
     "auto_reply": {
         "enabled": True,
@@ -90,11 +134,18 @@ DEFAULT_EMAIL_CONFIG = {
         "signature": "\n\nPozdrawiamy,\nZespół taskinity",
         "reply_to_all": False,
         "add_original_message": True,
-        "cooldown_hours": 24  # Nie odpowiadaj ponownie do tego samego nadawcy przez 24h
+        "cooldown_hours": 24,  # Nie odpowiadaj ponownie do tego samego nadawcy przez 24h
+        "cooldown_cache_size": 100000  # Maksymalna liczba nadawców w pamięci (najdawniej używani są usuwani)
     },
     "processing": {
         "check_interval_seconds": 60,
+        "max_check_interval_seconds": 600,  # Największy odstęp, gdy skrzynka jest bezczynna
+        "check_interval_jitter": 0.1,
         "max_emails_per_batch": 10,
+        "stage_queue_size": 4,  # Pojemność kolejek między etapami pobierania, odpowiedzi i przepływów
+        "workers": 1,  # Liczba procesów uruchamianych przez email_workers.py
+        "lease_seconds": 120,  # Po tym czasie bez odnowienia część skrzynki przejmuje nowy proces
+        "ledger_retention_days": 30,  # Po tym czasie zakończone wpisy rejestru wiadomości są usuwane
         "save_attachments": True,
         "attachments_folder": str(EMAILS_DIR / "attachments"),
         "archive_processed": True,
@@ -102,6 +153,11 @@ DEFAULT_EMAIL_CONFIG = {
     },
     "flows": {
         "trigger_flow_on_email": True,
+        "max_workers": 4,  # Wątki wykonujące przepływy
+        "max_pending": 64,  # Gdy tyle przepływów czeka lub działa, przetwarzanie poczty wstrzymuje się
+        "default_concurrency": 1,  # Równoległe uruchomienia tego samego przepływu
+        "concurrency": {},  # Limity dla wybranych przepływów, np. {"support": 2}
+        "timeout_seconds": 300,
         "flow_mapping": {
             "support": "support_flow.dsl",
             "order": "order_processing.dsl",
@@ -126,8 +182,9 @@ def ensure_config():
             logger.info(f"Tworzenie domyślnego pliku konfiguracyjnego: {EMAIL_CONFIG_FILE}")
             with open(EMAIL_CONFIG_FILE, 'w') as f:
                 json.dump(DEFAULT_EMAIL_CONFIG, f, indent=4)
-        
-        config = load_config()
+            config = DEFAULT_EMAIL_CONFIG
+        else:
+            config = load_config()
         
         # Sprawdź, czy konfiguracja zawiera wszystkie wymagane klucze
         required_sections = ["imap", "smtp", "auto_reply", "processing", "flows"]
@@ -241,36 +298,152 @@ class EmailProcessor:
     
     def __init__(self, config: Dict[str, Any] = None):
         """Inicjalizuje procesor emaili."""
-        self.config = config or ensure_config()
+        # Konfiguracja z pliku jest przeładowywana po jego zmianie
+        self.config_watcher = None
+        if config is None:
+            self.config_watcher = ConfigWatcher(EMAIL_CONFIG_FILE)
+            self.config_watcher.version = self.config_watcher.stat_version()
+            config = ensure_config()
+        self.settings = CompiledConfig(config, self.config_watcher and self.config_watcher.version)
         self.imap = None
-        self.smtp = None
-        self.replied_to = {}  # Słownik do śledzenia odpowiedzi (email -> timestamp)
+        cooldown_seconds = self.config["auto_reply"]["cooldown_hours"] * 3600
+        # Nadawcy w okresie cooldown (email -> epoch)
+        self.replied_to = CooldownCache(
+            cooldown_seconds,
+            max_size=self.config["auto_reply"].get("cooldown_cache_size", 100000)
+        )
+        self.reply_history = ReplyHistory(EMAILS_DIR / "replied_to.db", cooldown_seconds=cooldown_seconds)
         self.load_replied_to()
         
+        # Etapy przetwarzania wiadomości, aby po awarii wznowić pracę bez powtarzania kroków
+        self.ledger = InboundLedger(
+            EMAILS_DIR / "inbound.db",
+            retention_seconds=self.config["processing"].get("ledger_retention_days", 30) * 24 * 3600
+        )
+        unfinished = self.ledger.unfinished()
+        if unfinished:
+            logger.info(f"Przetwarzanie {len(unfinished)} wiadomości zostało przerwane; "
+                        f"zostaną wznowione, gdy pojawią się w skrzynce.")
+        
+        # Stan skrzynki (UIDNEXT, UNSEEN), przy którym ostatni cykl nie miał nic do zrobienia
+        self.idle_status = None
+        
+        # Przy pracy w kilku procesach: (przydzielone części, liczba części) przestrzeni UID
+        # oraz funkcja sprawdzająca przed każdą wiadomością, czy proces nadal ma dzierżawę
+        self.shards: Optional[Tuple[FrozenSet[int], int]] = None
+        self.lease_guard: Optional[Callable[[], bool]] = None
+        
+        # Definicje przepływów wczytane z dysku i pula wykonująca przepływy poza pętlą poczty
+        flows_config = self.config["flows"]
+        self.flow_cache = FlowCache()
+        self.flow_dispatcher = FlowDispatcher(
+            max_workers=flows_config.get("max_workers", 4),
+            max_pending=flows_config.get("max_pending", 64),
+            default_limit=flows_config.get("default_concurrency", 1),
+            limits=flows_config.get("concurrency", {}),
+            timeout=flows_config.get("timeout_seconds", 300)
+        )
+        # Emaile, których przepływ trwa (klucz wiadomości -> email); archiwizowane dopiero po nim
+        self.flows_in_flight: Dict[str, Dict[str, Any]] = {}
+        self._flows_lock = threading.Lock()
+        # Klucze emaili przepływów, które przekroczyły czas, ale jeszcze działają
+        self._flows_overdue: Set[str] = set()
+        # Ustawiane po zakończeniu przepływu: kolejny cykl nie może zostać pominięty
+        self._flows_settled = threading.Event()
+        # Emaile po udanym przepływie, archiwizowane przez wątek pobierający bez ponownego pobrania;
+        # do archiwizacji pozostają w flows_in_flight
+        self._flows_finished: "queue.Queue" = queue.Queue()
+        
         # Tworzenie katalogu na załączniki
         attachments_folder = self.config["processing"]["attachments_folder"]
         os.makedirs(attachments_folder, exist_ok=True)
         
         logger.info("EmailProcessor zainicjalizowany.")
     
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Bieżąca konfiguracja."""
+        return self.settings.raw
+    
+    @config.setter
+    def config(self, config: Dict[str, Any]):
+        self.settings = CompiledConfig(config)
+    
+    def reload_config(self) -> bool:
+        """Podmienia konfigurację, jeśli plik się zmienił (wywoływane między partiami emaili)."""
+        if not self.config_watcher:
+            return False
+        
+        settings = self.config_watcher.poll()
+        if settings is None:
+            return False
+        
+        cooldown_seconds = settings.raw["auto_reply"]["cooldown_hours"] * 3600
+        self.replied_to.reconfigure(cooldown_seconds, settings.raw["auto_reply"].get("cooldown_cache_size", 100000))
+        self.reply_history.cooldown_seconds = cooldown_seconds
+        # Po wydłużeniu okresu wracają nadawcy, których wpisy już wygasły
+        self.replied_to.load(self.reply_history.active())
+        os.makedirs(settings.raw["processing"]["attachments_folder"], exist_ok=True)
+        flows_config = settings.raw["flows"]
+        self.flow_dispatcher.configure(flows_config.get("default_concurrency", 1),
+                                       flows_config.get("concurrency", {}),
+                                       flows_config.get("timeout_seconds", 300))
+        
+        # Jedno przypisanie: bieżące wywołania dokończą pracę na poprzedniej wersji
+        self.settings = settings
+        return True
+    
     def load_replied_to(self):
-        """Ładuje historię odpowiedzi z pliku."""
-        replied_to_file = EMAILS_DIR / "replied_to.json"
-        if replied_to_file.exists():
-            try:
-                with open(replied_to_file, 'r') as f:
-                    self.replied_to = json.load(f)
-                logger.debug(f"Załadowano historię odpowiedzi: {len(self.replied_to)} wpisów.")
-            except Exception as e:
-                logger.error(f"Błąd ładowania historii odpowiedzi: {str(e)}")
+        """Ładuje historię odpowiedzi w okresie cooldown."""
+        try:
+            # Jednorazowe przeniesienie dawnej historii z pliku JSON
+            self.reply_history.import_json(EMAILS_DIR / "replied_to.json")
+            
+            loaded = self.replied_to.load(self.reply_history.active())
+            logger.debug(f"Załadowano historię odpowiedzi: {loaded} wpisów.")
+        except Exception as e:
+            logger.error(f"Błąd ładowania historii odpowiedzi: {str(e)}")
     
-    def save_replied_to(self):
-        """Zapisuje historię odpowiedzi do pliku."""
-        replied_to_file = EMAILS_DIR / "replied_to.json"
+    def in_cooldown(self, sender: str) -> bool:
+        """Sprawdza, czy nadawcy odpowiedziano w okresie cooldown."""
+        if self.replied_to.in_cooldown(sender):
+            return True
+        
+        # Odpowiedź mogła zostać wysłana przez inny proces
+        last_reply = self.reply_history.last_reply(sender)
+        if last_reply is not None and time.time() - last_reply < self.replied_to.cooldown_seconds:
+            self.replied_to.add(sender, last_reply)
+            return True
+        return False
+    
+    def claim_reply(self, sender: str) -> Optional[float]:
+        """
+        Rezerwuje odpowiedź do nadawcy w pamięci i w historii współdzielonej przez procesy.
+        
+        Returns:
+            Czas rezerwacji (do release_reply) lub None, jeśli nadawca jest w okresie cooldown
+        """
+        if self.replied_to.in_cooldown(sender):
+            return None
+        
+        now = time.time()
+        try:
+            if not self.reply_history.claim(sender, now):
+                # Odpowiedź wysłał (lub właśnie wysyła) inny proces
+                last_reply = self.reply_history.last_reply(sender)
+                if last_reply is not None:
+                    self.replied_to.add(sender, last_reply)
+                return None
+        except Exception as e:
+            logger.error(f"Błąd zapisywania historii odpowiedzi: {str(e)}")
+        self.replied_to.add(sender, now)
+        return now
+    
+    def release_reply(self, sender: str, claimed_at: float):
+        """Zwalnia rezerwację z claim_reply, aby odpowiedź mogła zostać ponowiona."""
+        self.replied_to.discard(sender, claimed_at)
         try:
-            with open(replied_to_file, 'w') as f:
-                json.dump(self.replied_to, f, indent=4)
-            logger.debug(f"Zapisano historię odpowiedzi: {len(self.replied_to)} wpisów.")
+            self.reply_history.release(sender, claimed_at)
         except Exception as e:
             logger.error(f"Błąd zapisywania historii odpowiedzi: {str(e)}")
     
@@ -291,47 +464,80 @@ class EmailProcessor:
             logger.error(f"Błąd połączenia z serwerem IMAP: {str(e)}")
             return False
     
-    def connect_smtp(self) -> bool:
-        """Łączy się z serwerem SMTP."""
-        smtp_config = self.config["smtp"]
-        
-        try:
-            if smtp_config["use_tls"]:
-                self.smtp = smtplib.SMTP(smtp_config["server"], smtp_config["port"])
-                self.smtp.starttls()
-            else:
-                self.smtp = smtplib.SMTP(smtp_config["server"], smtp_config["port"])
-            
-            self.smtp.login(smtp_config["username"], smtp_config["password"])
-            logger.info(f"Połączono z serwerem SMTP: {smtp_config['server']}:{smtp_config['port']}")
-            return True
-        except Exception as e:
-            logger.error(f"Błąd połączenia z serwerem SMTP: {str(e)}")
-            return False
-    
     def disconnect(self):
-        """Rozłącza się z serwerami."""
+        """Rozłącza się z serwerem IMAP."""
         if self.imap:
             try:
                 self.imap.logout()
                 logger.info("Rozłączono z serwerem IMAP.")
             except Exception as e:
                 logger.error(f"Błąd rozłączania z serwerem IMAP: {str(e)}")
+            self.imap = None
+    
+    def probe_mailbox(self) -> Optional[Tuple[int, int]]:
+        """
+        Sprawdza stan skrzynki tanim poleceniem STATUS, bez SELECT i SEARCH.
         
-        if self.smtp:
-            try:
-                self.smtp.quit()
-                logger.info("Rozłączono z serwerem SMTP.")
-            except Exception as e:
-                logger.error(f"Błąd rozłączania z serwerem SMTP: {str(e)}")
+        Returns:
+            Krotka (UIDNEXT, UNSEEN) lub None, jeśli sprawdzenie się nie powiodło
+        """
+        if not self.imap:
+            if not self.connect_imap():
+                return None
+        
+        try:
+            status, data = self.imap.status(self.config["imap"]["folder"], "(UIDNEXT UNSEEN)")
+            if status != "OK":
+                return None
+            response = data[0].decode("utf-8", errors="ignore") if isinstance(data[0], bytes) else str(data[0])
+            uidnext = re.search(r"UIDNEXT (\d+)", response)
+            unseen = re.search(r"UNSEEN (\d+)", response)
+            if not uidnext or not unseen:
+                return None
+            return int(uidnext.group(1)), int(unseen.group(1))
+        except Exception as e:
+            # Serwer mógł zamknąć bezczynną sesję; kolejny cykl połączy się ponownie
+            logger.warning(f"Błąd sprawdzania stanu skrzynki: {str(e)}")
+            self.disconnect()
+            return None
+    
+    def poll(self) -> bool:
+        """
+        Wykonuje jeden cykl odpytywania: pełne przetwarzanie tylko, gdy stan skrzynki się zmienił.
+        
+        Returns:
+            True, jeśli przetworzono jakieś wiadomości
+        """
+        self.reload_config()
+        
+        status = self.probe_mailbox()
+        # Po zakończeniu przepływu jego emaile czekają w skrzynce na archiwizację lub ponowienie
+        if status is not None and status == self.idle_status and not self._flows_settled.is_set():
+            logger.debug("Brak zmian w skrzynce - pomijam cykl.")
+            return False
+        
+        self._flows_settled.clear()
+        processed = self.process_emails(keep_imap=True)
+        # Bez postępu nie ma sensu powtarzać cyklu, dopóki stan skrzynki się nie zmieni
+        self.idle_status = None if processed else status
+        return processed > 0
     
     def fetch_emails(self) -> List[Dict[str, Any]]:
         """Pobiera nieprzeczytane emaile."""
+        return list(self.iter_emails())
+    
+    def iter_emails(self) -> Iterator[Dict[str, Any]]:
+        """
+        Pobiera nieprzeczytane emaile po jednym, aby dalsze etapy mogły zacząć pracę od razu.
+        
+        Wiadomości są pobierane bez oznaczania jako przeczytane; flagę Seen i archiwizację
+        ustawia archive_email po zakończeniu przetwarzania, więc przerwane przetwarzanie
+        zostanie podjęte ponownie w kolejnym cyklu.
+        """
         if not self.imap:
             if not self.connect_imap():
-                return []
+                return
         
-        emails = []
         imap_config = self.config["imap"]
         processing_config = self.config["processing"]
         
@@ -339,23 +545,34 @@ class EmailProcessor:
             # Wybierz folder
             self.imap.select(imap_config["folder"])
             
-            # Szukaj nieprzeczytanych wiadomości
-            status, messages = self.imap.search(None, "UNSEEN")
+            # Szukaj nieprzeczytanych wiadomości (UID nie zmieniają się, gdy inne procesy usuwają wiadomości)
+            status, messages = self.imap.uid("SEARCH", None, "UNSEEN")
             
             if status != "OK":
                 logger.error(f"Błąd wyszukiwania wiadomości: {status}")
-                return []
+                return
             
-            # Pobierz ID wiadomości
+            # Pobierz UID wiadomości, tylko z części przydzielonych temu procesowi
             message_ids = messages[0].split()
+            if self.shards:
+                owned, count = self.shards
+                message_ids = [msg_id for msg_id in message_ids if int(msg_id) % count in owned]
             logger.info(f"Znaleziono {len(message_ids)} nieprzeczytanych wiadomości.")
             
-            # Ogranicz liczbę wiadomości do przetworzenia
-            message_ids = message_ids[:processing_config["max_emails_per_batch"]]
+            # Emaile z trwającym przepływem czekają w skrzynce; nie pobieraj ich ponownie
+            with self._flows_lock:
+                in_flight_ids = {email_data["id"] for email_data in self.flows_in_flight.values()}
             
+            # Ogranicz liczbę wiadomości do przetworzenia (bez tych, które są w trakcie)
+            fetched = 0
             for msg_id in message_ids:
+                if fetched >= processing_config["max_emails_per_batch"]:
+                    break
+                if msg_id.decode("utf-8") in in_flight_ids:
+                    continue
                 try:
-                    status, msg_data = self.imap.fetch(msg_id, "(RFC822)")
+                    # BODY.PEEK nie ustawia flagi Seen
+                    status, msg_data = self.imap.uid("FETCH", msg_id, "(BODY.PEEK[])")
                     
                     if status != "OK":
                         logger.error(f"Błąd pobierania wiadomości {msg_id}: {status}")
@@ -364,33 +581,50 @@ class EmailProcessor:
                     raw_email = msg_data[0][1]
                     email_message = email.message_from_bytes(raw_email)
                     
-                    # Przetwarzanie wiadomości
-                    email_data = self.process_email_message(email_message, msg_id)
-                    emails.append(email_data)
+                    # Ta sama wiadomość dostarczona ponownie, gdy trwa jej przepływ
+                    key = message_key(email_message.get("Message-ID"), raw_email)
+                    with self._flows_lock:
+                        if key in self.flows_in_flight:
+                            continue
+                    fetched += 1
                     
-                    # Oznacz jako przeczytane
-                    self.imap.store(msg_id, "+FLAGS", "\\Seen")
+                    # Wiadomość przetworzona wcześniej (np. przed awarią lub dostarczona ponownie)
+                    entry = self.ledger.get(key)
+                    if entry is not None and entry[0] == ARCHIVED:
+                        logger.info(f"Wiadomość {key} została już przetworzona, archiwizuję.")
+                        self.archive_email(msg_id)
+                        continue
                     
-                    # Archiwizuj, jeśli skonfigurowano
-                    if processing_config["archive_processed"]:
-                        self.imap.copy(msg_id, processing_config["archive_folder"])
-                        self.imap.store(msg_id, "+FLAGS", "\\Deleted")
+                    # Przetwarzanie wiadomości; załączniki i plik .eml zapisano już przy pierwszym pobraniu
+                    email_data = self.process_email_message(email_message, msg_id, raw_email,
+                                                            save=entry is None)
+                    email_data["message_id"] = key
+                    if entry is None:
+                        self.ledger.advance(key, FETCHED)
                 
                 except Exception as e:
                     logger.error(f"Błąd przetwarzania wiadomości {msg_id}: {str(e)}")
-            
-            # Wykonaj usunięcie oznaczonych wiadomości
-            if processing_config["archive_processed"]:
-                self.imap.expunge()
-            
-            return emails
+                    continue
+                
+                yield email_data
         
         except Exception as e:
             logger.error(f"Błąd pobierania wiadomości: {str(e)}")
-            return []
     
-    def process_email_message(self, email_message, msg_id) -> Dict[str, Any]:
-        """Przetwarza wiadomość email."""
+    def archive_email(self, msg_id):
+        """Oznacza wiadomość jako przeczytaną i archiwizuje ją, jeśli skonfigurowano."""
+        processing_config = self.config["processing"]
+        
+        # Oznacz jako przeczytane
+        self.imap.uid("STORE", msg_id, "+FLAGS", "\\Seen")
+        
+        # Archiwizuj, jeśli skonfigurowano (usunięcie przy expunge po zakończeniu partii)
+        if processing_config["archive_processed"]:
+            self.imap.uid("COPY", msg_id, processing_config["archive_folder"])
+            self.imap.uid("STORE", msg_id, "+FLAGS", "\\Deleted")
+    
+    def process_email_message(self, email_message, msg_id, raw_email: bytes, save: bool = True) -> Dict[str, Any]:
+        """Przetwarza wiadomość email (z zapisem załączników i pliku .eml, jeśli save=True)."""
         processing_config = self.config["processing"]
         
         # Pobierz podstawowe informacje
@@ -418,15 +652,16 @@ class EmailProcessor:
                     break
                 
                 # Zapisz załączniki
-                if processing_config["save_attachments"] and "attachment" in content_disposition:
+                if save and processing_config["save_attachments"] and "attachment" in content_disposition:
                     self.save_attachment(part)
         else:
             body = email_message.get_payload(decode=True).decode("utf-8", errors="ignore")
         
         # Zapisz pełną wiadomość do pliku
-        email_file = EMAILS_DIR / f"{msg_id.decode('utf-8')}.eml"
-        with open(email_file, "wb") as f:
-            f.write(raw_email)
+        if save:
+            email_file = EMAILS_DIR / f"{msg_id.decode('utf-8')}.eml"
+            with open(email_file, "wb") as f:
+                f.write(raw_email)
         
         logger.info(f"Przetworzono wiadomość: {subject} od {from_email}")
         
@@ -475,41 +710,35 @@ class EmailProcessor:
     
     def should_auto_reply(self, email_data: Dict[str, Any]) -> Tuple[bool, str]:
         """Sprawdza, czy należy automatycznie odpowiedzieć na email."""
-        auto_reply_config = self.config["auto_reply"]
+        settings = self.settings
+        auto_reply_config = settings.raw["auto_reply"]
         
         if not auto_reply_config["enabled"]:
             return False, "auto_reply disabled"
         
         from_email = email_data["from"]
-        subject = email_data["subject"]
-        body = email_data["body"]
+        subject = email_data["subject"].lower()
+        body = email_data["body"].lower()
         
-        # Sprawdź, czy już odpowiedziano
-        if from_email in self.replied_to:
-            last_reply_time = datetime.fromisoformat(self.replied_to[from_email])
-            cooldown = timedelta(hours=auto_reply_config["cooldown_hours"])
-            
-            if datetime.now() - last_reply_time < cooldown:
-                logger.info(f"Pomijanie odpowiedzi do {from_email} - w okresie cooldown.")
-                return False, "cooldown period"
-        
-        # Sprawdź kryteria
-        criteria = auto_reply_config["criteria"]
+        # Sprawdź, czy już odpowiedziano (także z innego procesu)
+        if self.in_cooldown(from_email):
+            logger.info(f"Pomijanie odpowiedzi do {from_email} - w okresie cooldown.")
+            return False, "cooldown period"
         
         # Sprawdź domenę nadawcy
-        from_domain = from_email.split("@")[-1] if "@" in from_email else ""
-        domain_match = any(domain == from_domain for domain in criteria["from_domains"])
+        from_domain = from_email.split("@")[-1].lower() if "@" in from_email else ""
+        domain_match = from_domain in settings.from_domains
         
         # Sprawdź temat
-        subject_match = any(keyword.lower() in subject.lower() for keyword in criteria["subject_contains"])
+        subject_match = bool(settings.subject_matcher and settings.subject_matcher.search(subject))
         
         # Sprawdź słowa kluczowe priorytetu
-        priority_match = any(keyword.lower() in subject.lower() or keyword.lower() in body.lower() 
-                             for keyword in criteria["priority_keywords"])
+        priority_match = bool(settings.priority_matcher and (settings.priority_matcher.search(subject)
+                                                             or settings.priority_matcher.search(body)))
         
         # Określ szablon odpowiedzi
         template_key = "default"
-        if "support" in subject.lower() or "wsparcie" in subject.lower():
+        if settings.support_matcher.search(subject):
             template_key = "support"
         elif priority_match:
             template_key = "priority"
@@ -522,13 +751,20 @@ class EmailProcessor:
         return False, "criteria not met"
     
     def send_auto_reply(self, email_data: Dict[str, Any], template_key: str) -> bool:
-        """Wysyła automatyczną odpowiedź."""
-        if not self.smtp:
-            if not self.connect_smtp():
-                return False
+        """
+        Wysyła automatyczną odpowiedź.
         
-        auto_reply_config = self.config["auto_reply"]
-        smtp_config = self.config["smtp"]
+        Odpowiedź jest najpierw rezerwowana w historii odpowiedzi; gdy nadawcy odpowiedział już
+        inny proces, wysyłka jest pomijana. Nieudana wysyłka zwalnia rezerwację.
+        """
+        settings = self.settings
+        auto_reply_config = settings.raw["auto_reply"]
+        smtp_config = settings.raw["smtp"]
+        
+        claimed_at = self.claim_reply(email_data["from"])
+        if claimed_at is None:
+            logger.info(f"Pomijanie odpowiedzi do {email_data['from']} - w okresie cooldown.")
+            return True
         
         try:
             # Przygotuj wiadomość
@@ -538,8 +774,7 @@ class EmailProcessor:
             msg["Subject"] = f"Re: {email_data['subject']}"
             
             # Treść wiadomości
-            template = auto_reply_config["templates"].get(template_key, auto_reply_config["templates"]["default"])
-            body = template + auto_reply_config["signature"]
+            body = settings.reply_bodies.get(template_key, settings.reply_bodies["default"])
             
             # Dodaj oryginalną wiadomość
             if auto_reply_config["add_original_message"]:
@@ -555,46 +790,142 @@ class EmailProcessor:
                     cc_emails = [email.utils.parseaddr(addr)[1] for addr in cc.split(",")]
                     recipients.extend(cc_emails)
             
-            self.smtp.sendmail(smtp_config["from_email"], recipients, msg.as_string())
-            
-            # Zapisz informację o odpowiedzi
-            self.replied_to[email_data["from"]] = datetime.now().isoformat()
-            self.save_replied_to()
+            # Wspólna ścieżka wysyłki: pula połączeń, przekaźniki z przełączaniem
+            # i adaptacyjny limit wysyłek (klient wg smtp.backend)
+            from tasks.send_emails import _deliver
+            _deliver(smtp_config["from_email"], recipients, msg.as_string(), smtp_config)
             
             logger.info(f"Wysłano automatyczną odpowiedź do {email_data['from']}")
             return True
         
         except Exception as e:
             logger.error(f"Błąd wysyłania automatycznej odpowiedzi: {str(e)}")
+            self.release_reply(email_data["from"], claimed_at)
             return False
     
     def trigger_flow(self, email_data: Dict[str, Any]):
         """Uruchamia przepływ na podstawie emaila."""
-        flows_config = self.config["flows"]
+        self.trigger_flows([email_data])
+    
+    def trigger_flows(self, emails: List[Dict[str, Any]]) -> Dict[str, Future]:
+        """
+        Zleca przepływy dla partii emaili, każdy przepływ raz dla wszystkich pasujących emaili.
+        
+        Przepływy wykonuje pula flow_dispatcher; metoda wraca zaraz po ich zleceniu. Emaile
+        z rejestru (z kluczem message_id) dostają w email_data["flow"] klucz przepływu i są
+        w flows_in_flight do jego zakończenia, a po udanym przepływie do archiwizacji.
+        
+        Args:
+            emails: Emaile z partii
+        
+        Returns:
+            Wyniki przepływów (Future) według klucza z flow_mapping
+        """
+        settings = self.settings
+        flows_config = settings.raw["flows"]
         
         if not flows_config["trigger_flow_on_email"]:
-            return
+            return {}
         
-        try:
-            # Określ, który przepływ uruchomić
-            flow_key = None
-            subject = email_data["subject"].lower()
-            body = email_data["body"].lower()
-            
-            for key in flows_config["flow_mapping"]:
-                if key in subject or key in body:
-                    flow_key = key
-                    break
-            
+        # Określ, który przepływ uruchomić dla każdego emaila
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for email_data in emails:
+            flow_key = settings.flow_router.route(email_data["subject"], email_data["body"])
             if not flow_key:
                 logger.debug(f"Nie znaleziono pasującego przepływu dla emaila: {email_data['subject']}")
-                return
-            
-            flow_file = flows_config["flow_mapping"][flow_key]
-            
-            # Przygotuj dane wejściowe dla przepływu
-            input_data = {
-                "email": {
+                continue
+            groups.setdefault(flow_key, []).append(email_data)
+        
+        results = {}
+        for flow_key, group in groups.items():
+            flow_file = settings.flow_router.files[flow_key]
+            tracked = [email_data for email_data in group if "message_id" in email_data]
+            returned = threading.Event()
+            with self._flows_lock:
+                for email_data in tracked:
+                    email_data["flow"] = flow_key
+                    self.flows_in_flight[email_data["message_id"]] = email_data
+            try:
+                results[flow_key] = self.flow_dispatcher.submit(
+                    flow_key, self._run_tracked_flow, flow_file, group, tracked, returned,
+                    callback=functools.partial(self._flow_finished, emails=tracked, returned=returned)
+                )
+            except Exception:
+                with self._flows_lock:
+                    for email_data in tracked:
+                        self.flows_in_flight.pop(email_data["message_id"], None)
+                raise
+        return results
+    
+    def _run_tracked_flow(self, flow_file: str, emails: List[Dict[str, Any]],
+                          tracked: List[Dict[str, Any]], returned: threading.Event) -> Any:
+        """
+        Uruchamia przepływ (w wątku puli), kończąc etap emaili przepływu, który przekroczył czas.
+        
+        Pula zgłasza przekroczenie czasu, gdy przepływ nadal działa; jego emaile zostają wtedy
+        w flows_in_flight do rzeczywistego zakończenia przepływu, aby nie został zlecony ponownie.
+        """
+        error = None
+        try:
+            return self.run_flow(flow_file, emails)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._flows_lock:
+                returned.set()
+                overdue = [email_data for email_data in tracked if email_data["message_id"] in self._flows_overdue]
+                for email_data in overdue:
+                    self._flows_overdue.discard(email_data["message_id"])
+            if overdue:
+                self._settle_flow(overdue, error)
+    
+    def _flow_finished(self, flow_key: str, result: Any, error: Optional[BaseException],
+                       emails: List[Dict[str, Any]] = (), returned: Optional[threading.Event] = None):
+        """
+        Kończy etap przepływu dla jego emaili (wywoływane przez pulę po wykonaniu przepływu).
+        
+        Po powodzeniu emaile przechodzą do etapu TRIGGERED i trafiają do kolejki archiwizacji,
+        którą w kolejnym cyklu opróżnia wątek pobierający; po błędzie zostają w skrzynce,
+        a przepływ zostanie zlecony ponownie. Po przekroczeniu czasu etap kończy się dopiero
+        wraz z przepływem (returned nie jest jeszcze ustawione).
+        """
+        if isinstance(error, FlowTimeout) and returned is not None:
+            with self._flows_lock:
+                if not returned.is_set():
+                    self._flows_overdue.update(email_data["message_id"] for email_data in emails)
+                    logger.warning(f"Przepływ {flow_key} przekroczył czas - jego emaile czekają na jego zakończenie")
+                    return
+        if error is not None:
+            logger.error(f"Błąd uruchamiania przepływu {flow_key}: {str(error)}")
+        self._settle_flow(emails, error)
+    
+    def _settle_flow(self, emails: List[Dict[str, Any]], error: Optional[BaseException]):
+        """Przekazuje emaile zakończonego przepływu do archiwizacji albo do ponowienia po błędzie."""
+        if error is not None:
+            with self._flows_lock:
+                for email_data in emails:
+                    self.flows_in_flight.pop(email_data["message_id"], None)
+        else:
+            for email_data in emails:
+                self.ledger.advance(email_data["message_id"], TRIGGERED)
+                self._flows_finished.put(email_data)
+        if emails:
+            self._flows_settled.set()
+    
+    def run_flow(self, flow_file: str, emails: List[Dict[str, Any]]) -> Any:
+        """Uruchamia przepływ z pliku dla listy emaili."""
+        # Definicja z pamięci, wczytywana ponownie tylko po zmianie pliku
+        flow_path = FLOWS_DIR / flow_file
+        dsl_content = self.flow_cache.load(flow_path)
+        if dsl_content is None:
+            logger.error(f"Plik przepływu nie istnieje: {flow_path}")
+            return None
+        
+        # Przygotuj dane wejściowe dla przepływu
+        input_data = {
+            "emails": [
+                {
                     "id": email_data["id"],
                     "subject": email_data["subject"],
                     "from": email_data["from"],
@@ -602,74 +933,303 @@ class EmailProcessor:
                     "body": email_data["body"],
                     "date": email_data["date"]
                 }
-            }
-            
-            # Uruchom przepływ
-            logger.info(f"Uruchamianie przepływu {flow_file} dla emaila: {email_data['subject']}")
+                for email_data in emails
+            ]
+        }
+        
+        # Uruchom przepływ
+        logger.info(f"Uruchamianie przepływu {flow_file} dla {len(emails)} emaili")
+        result = get_flow_runner()(dsl_content, input_data)
+        
+        logger.info(f"Przepływ {flow_file} zakończony: {result}")
+        return result
+    
+    def classify_and_reply(self, email_data: Dict[str, Any]):
+        """
+        Etap klasyfikacji i odpowiedzi, zapisywany w rejestrze.
+        
+        Po ponownym uruchomieniu decyzja o odpowiedzi jest odczytywana z rejestru,
+        a wysłana odpowiedź nie jest powtarzana. Nieudana wysyłka przerywa etap, więc
+        email zostaje w skrzynce i odpowiedź zostanie ponowiona w kolejnym cyklu.
+        
+        Raises:
+            RuntimeError: Jeśli nie udało się wysłać automatycznej odpowiedzi
+        """
+        key = email_data["message_id"]
+        entry = self.ledger.get(key)
+        stage = STAGES.index(entry[0]) if entry else -1
+        
+        if stage < STAGES.index(CLASSIFIED):
+            # Sprawdź, czy należy automatycznie odpowiedzieć
+            should_reply, template_key = self.should_auto_reply(email_data)
+            decision = template_key if should_reply else ""
+            self.ledger.advance(key, CLASSIFIED, decision)
+        elif stage < STAGES.index(REPLIED) and entry[1] and self.in_cooldown(email_data["from"]):
+            # Odpowiedź wysłano przed awarią (lub zrobił to inny proces), zanim zapisano etap
+            logger.info(f"Pomijanie ponownej odpowiedzi do {email_data['from']} - w okresie cooldown.")
+            decision = ""
+        else:
+            decision = entry[1]
+        
+        if stage < STAGES.index(REPLIED):
+            if decision and not self.send_auto_reply(email_data, decision):
+                raise RuntimeError(f"Nie wysłano automatycznej odpowiedzi do {email_data['from']}")
+            self.ledger.advance(key, REPLIED)
+    
+    def run_flow_stage(self, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Etap uruchamiania przepływów dla partii, z pominięciem emaili, dla których już go wykonano.
+        
+        Returns:
+            Emaile gotowe do archiwizacji; emaile ze zleconym przepływem wracają w kolejnym
+            cyklu, gdy przepływ się zakończy
+        """
+        pending = []
+        for email_data in emails:
+            with self._flows_lock:
+                if email_data["message_id"] in self.flows_in_flight:
+                    continue
+            entry = self.ledger.get(email_data["message_id"])
+            if entry is None or STAGES.index(entry[0]) < STAGES.index(TRIGGERED):
+                pending.append(email_data)
+        
+        # Zleć przepływy, jeśli skonfigurowano; etap emaili bez przepływu kończy się od razu
+        if pending:
+            self.trigger_flows(pending)
+        for email_data in pending:
+            if "flow" not in email_data:
+                self.ledger.advance(email_data["message_id"], TRIGGERED)
+        
+        with self._flows_lock:
+            return [email_data for email_data in emails
+                    if "flow" not in email_data and email_data["message_id"] not in self.flows_in_flight]
+    
+    def finish_email(self, email_data: Dict[str, Any]):
+        """Archiwizuje przetworzony email (wymaga sesji IMAP, więc tylko w wątku pobierającym)."""
+        self.archive_email(email_data["id"].encode("utf-8"))
+        self.ledger.advance(email_data["message_id"], ARCHIVED)
+    
+    def handle_email(self, email_data: Dict[str, Any]):
+        """Przetwarza email wszystkimi etapami w bieżącym wątku."""
+        self.classify_and_reply(email_data)
+        for finished in self.run_flow_stage([email_data]):
+            self.finish_email(finished)
+    
+    def process_emails(self, keep_imap: bool = False) -> int:
+        """
+        Przetwarza emaile w trzech etapach działających w osobnych wątkach.
+        
+        Bieżący wątek pobiera wiadomości z IMAP i archiwizuje przetworzone, wątek "email-reply"
+        klasyfikuje i wysyła odpowiedzi, a wątek "email-flow" zbiera emaile i po zakończeniu
+        partii zleca puli każdy przepływ raz dla wszystkich pasujących emaili. Etapy łączą
+        kolejki o ograniczonym rozmiarze, więc pobieranie zwalnia, gdy dalsze etapy nie nadążają.
+        Odpowiedzi wysyła jeden wątek, dzięki czemu sprawdzenie cooldown i zapis odpowiedzi
+        nie mogą się przeplatać.
+        
+        Args:
+            keep_imap: Pozostaw sesję IMAP otwartą dla kolejnego cyklu
+        
+        Returns:
+            Liczba przetworzonych emaili
+        """
+        processed = 0
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        queue_size = self.config["processing"].get("stage_queue_size", 4)
+        to_reply: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        to_trigger: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        done: "queue.Queue" = queue.Queue()
+        stages = [
+            threading.Thread(target=self._run_stage, args=(self.classify_and_reply, to_reply, to_trigger, stop, errors),
+                             name="email-reply", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self.run_flow_stage, to_trigger, done, stop, errors, True),
+                             name="email-flow", daemon=True)
+        ]
+        
+        try:
+            # Zmiany konfiguracji obowiązują od kolejnej partii
+            self.reload_config()
             
-            # Import tutaj, aby uniknąć cyklicznych importów
-            from flow_dsl import run_flow_from_dsl, load_dsl
+            for stage in stages:
+                stage.start()
             
-            # Sprawdź, czy plik przepływu istnieje
-            flow_path = Path(__file__).parent / "dsl_definitions" / flow_file
-            if not flow_path.exists():
-                logger.error(f"Plik przepływu nie istnieje: {flow_path}")
-                return
+            # Pobieraj emaile, archiwizując w międzyczasie te, które przeszły wszystkie etapy
+            try:
+                for email_data in self.iter_emails():
+                    processed += self._finish_ready(done)
+                    if self.lease_guard and not self.lease_guard():
+                        logger.warning("Utracono dzierżawę części skrzynki - przerywam partię.")
+                        break
+                    if not self._put(to_reply, email_data, stop):
+                        break
+            finally:
+                self._put(to_reply, _END_OF_BATCH, stop)
             
-            # Załaduj i uruchom przepływ
-            dsl_content = load_dsl(str(flow_path))
-            result = run_flow_from_dsl(dsl_content, input_data)
+            # Poczekaj na pozostałe emaile
+            while True:
+                try:
+                    email_data = done.get(timeout=0.1)
+                except queue.Empty:
+                    if stop.is_set() and not any(stage.is_alive() for stage in stages):
+                        break
+                    continue
+                if email_data is _END_OF_BATCH:
+                    break
+                processed += self._finish(email_data)
+            processed += self._finish_flows()
             
-            logger.info(f"Przepływ {flow_file} zakończony: {result}")
+            if not processed:
+                logger.debug("Brak nowych emaili do przetworzenia.")
         
         except Exception as e:
-            logger.error(f"Błąd uruchamiania przepływu: {str(e)}")
-    
-    def process_emails(self):
-        """Przetwarza emaile."""
-        try:
-            # Pobierz emaile
-            emails = self.fetch_emails()
+            logger.error(f"Błąd przetwarzania emaili: {str(e)}")
+        
+        finally:
+            stop.set()
+            for stage in stages:
+                if stage.ident is not None:
+                    stage.join()
             
-            if not emails:
-                logger.debug("Brak nowych emaili do przetworzenia.")
-                return
+            # Usuń zarchiwizowane wiadomości i rozłącz się z serwerami
+            if self.imap and self.config["processing"]["archive_processed"]:
+                try:
+                    self.imap.expunge()
+                except Exception as e:
+                    logger.error(f"Błąd usuwania zarchiwizowanych wiadomości: {str(e)}")
             
-            # Przetwórz każdy email
-            for email_data in emails:
-                # Sprawdź, czy należy automatycznie odpowiedzieć
-                should_reply, template_key = self.should_auto_reply(email_data)
-                
-                if should_reply:
-                    self.send_auto_reply(email_data, template_key)
-                
-                # Uruchom przepływ, jeśli skonfigurowano
-                self.trigger_flow(email_data)
+            if keep_imap and self.imap:
+                # STATUS nie powinien dotyczyć wybranego folderu, więc wróć do stanu po zalogowaniu
+                try:
+                    self.imap.close()
+                except Exception:
+                    self.disconnect()
+            elif not keep_imap:
+                self.disconnect()
         
-        except Exception as e:
-            logger.error(f"Błąd przetwarzania emaili: {str(e)}")
+        # Błąd krytyczny w etapie (np. przerwanie) kończy przetwarzanie jak w wątku głównym
+        if errors:
+            raise errors[0]
+        return processed
+    
+    def _run_stage(self, work: Callable, inbox: "queue.Queue", outbox: "queue.Queue",
+                   stop: threading.Event, errors: List[BaseException], batch: bool = False):
+        """
+        Wykonuje etap dla emaili z kolejki wejściowej i przekazuje je dalej.
         
+        Etap z batch=True zbiera emaile do końca partii i wywołuje work raz dla ich listy;
+        dalej przekazywane są emaile zwrócone przez work.
+        """
+        held: List[Dict[str, Any]] = []
+        try:
+            while not stop.is_set():
+                try:
+                    email_data = inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if email_data is _END_OF_BATCH:
+                    if held:
+                        try:
+                            finished = work(held)
+                        except Exception as e:
+                            logger.error(f"Błąd przetwarzania partii {len(held)} emaili: {str(e)}")
+                            finished = []
+                        for email_data in finished:
+                            self._put(outbox, email_data, stop)
+                    break
+                if batch:
+                    held.append(email_data)
+                    continue
+                
+                try:
+                    work(email_data)
+                except Exception as e:
+                    # Email zostaje w skrzynce i rejestrze na swoim etapie - wróci w kolejnym cyklu
+                    logger.error(f"Błąd przetwarzania emaila {email_data['message_id']}: {str(e)}")
+                    continue
+                self._put(outbox, email_data, stop)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
         finally:
-            # Rozłącz się z serwerami
-            self.disconnect()
+            self._put(outbox, _END_OF_BATCH, stop)
+    
+    def _finish(self, email_data: Dict[str, Any]) -> int:
+        """Archiwizuje email, zwraca 1 po powodzeniu."""
+        try:
+            self.finish_email(email_data)
+            return 1
+        except Exception as e:
+            logger.error(f"Błąd archiwizacji emaila {email_data['message_id']}: {str(e)}")
+            return 0
+    
+    def _finish_ready(self, done: "queue.Queue") -> int:
+        """Archiwizuje emaile, które już przeszły wszystkie etapy, bez czekania na kolejne."""
+        finished = self._finish_flows()
+        while True:
+            try:
+                email_data = done.get_nowait()
+            except queue.Empty:
+                return finished
+            if email_data is _END_OF_BATCH:
+                # Koniec partii odbierze pętla oczekująca na pozostałe emaile
+                done.put(email_data)
+                return finished
+            finished += self._finish(email_data)
+    
+    def _finish_flows(self) -> int:
+        """Archiwizuje emaile, których przepływ zakończył się po ich partii."""
+        finished = 0
+        while True:
+            try:
+                email_data = self._flows_finished.get_nowait()
+            except queue.Empty:
+                return finished
+            finished += self._finish(email_data)
+            # Email, którego nie udało się zarchiwizować, zostanie pobrany w kolejnym cyklu
+            with self._flows_lock:
+                self.flows_in_flight.pop(email_data["message_id"], None)
+    
+    @staticmethod
+    def _put(target: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+        """Wstawia element do ograniczonej kolejki, czekając na miejsce; False po zatrzymaniu."""
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
 def run_email_processor():
     """Uruchamia procesor emaili w pętli."""
     processor = EmailProcessor()
-    processing_config = processor.config["processing"]
+    
+    scheduler = PollScheduler()
     
     logger.info("Uruchomiono procesor emaili.")
     
     try:
         while True:
-            processor.process_emails()
-            time.sleep(processing_config["check_interval_seconds"])
+            busy = processor.poll()
+            
+            # Odstęp rośnie wykładniczo, gdy skrzynka jest bezczynna, i wraca do minimum przy ruchu
+            processing_config = processor.config["processing"]
+            scheduler.min_interval = processing_config["check_interval_seconds"]
+            scheduler.max_interval = processing_config.get("max_check_interval_seconds", scheduler.min_interval)
+            scheduler.jitter = processing_config.get("check_interval_jitter", 0.1)
+            time.sleep(scheduler.active() if busy else scheduler.idle())
     
     except KeyboardInterrupt:
         logger.info("Zatrzymano procesor emaili.")
     
     except Exception as e:
         logger.error(f"Błąd procesora emaili: {str(e)}")
+    
+    finally:
+        processor.disconnect()
+        # Dokończ zlecone przepływy - ich emaile zostają w skrzynce, a po udanym przepływie
+        # (etap TRIGGERED w rejestrze) zostaną zarchiwizowane po ponownym uruchomieniu
+        processor.flow_dispatcher.shutdown(wait=True)
 
 if __name__ == "__main__":
     run_email_processor()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Wieloprocesowe przetwarzanie poczty dla email pipeline.
+Nadzorca uruchamia N procesów EmailProcessor; każdy obsługuje swoją część przestrzeni UID
+skrzynki (UID mod N), którą dzierży na podstawie dzierżawy zapisanej w SQLite. Proces,
+który uległ awarii, jest uruchamiany ponownie, a jego dzierżawa przechodzi na następcę.
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    shard INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+def worker_name(pid: Optional[int] = None) -> str:
+    """Zwraca identyfikator właściciela dzierżaw dla procesu."""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+class ShardLeases:
+    """Dzierżawy części skrzynki: część -> właściciel i czas wygaśnięcia."""
+
+    def __init__(self, path: Union[str, Path], ttl: float = 120.0):
+        """
+        Otwiera (i w razie potrzeby tworzy) bazę dzierżaw.
+
+        Args:
+            path: Plik bazy SQLite współdzielony przez procesy
+            ttl: Czas ważności dzierżawy bez odnowienia (sekundy)
+        """
+        self.path = str(path)
+        self.ttl = ttl
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def acquire(self, owner: str, shards: Iterable[int]) -> List[int]:
+        """
+        Przejmuje wolne lub wygasłe dzierżawy i odnawia własne.
+
+        Args:
+            owner: Identyfikator procesu
+            shards: Części, o które proces się ubiega
+
+        Returns:
+            Części dzierżone przez proces
+        """
+        now = time.time()
+        db = self._connection()
+        for shard in shards:
+            # Jedno polecenie: dzierżawa zmienia właściciela tylko, jeśli wygasła
+            db.execute(
+                "INSERT INTO leases (shard, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(shard) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (shard, owner, now + self.ttl, now)
+            )
+        return self.held(owner)
+
+    def renew(self, owner: str) -> List[int]:
+        """
+        Odnawia wszystkie ważne dzierżawy procesu.
+
+        Args:
+            owner: Identyfikator procesu
+
+        Returns:
+            Części nadal dzierżone przez proces
+        """
+        now = time.time()
+        self._connection().execute("UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at > ?",
+                                   (now + self.ttl, owner, now))
+        return self.held(owner)
+
+    def held(self, owner: str) -> List[int]:
+        """Zwraca ważne dzierżawy procesu."""
+        rows = self._connection().execute("SELECT shard FROM leases WHERE owner = ? AND expires_at > ? "
+                                          "ORDER BY shard", (owner, time.time()))
+        return [row[0] for row in rows.fetchall()]
+
+    def release(self, owner: str) -> int:
+        """
+        Zwalnia dzierżawy procesu (np. po jego zakończeniu), aby następca nie czekał na wygaśnięcie.
+
+        Args:
+            owner: Identyfikator procesu
+
+        Returns:
+            Liczba zwolnionych dzierżaw
+        """
+        return self._connection().execute("DELETE FROM leases WHERE owner = ?", (owner,)).rowcount
+
+    def holders(self) -> Dict[int, Tuple[str, float]]:
+        """Zwraca wszystkie dzierżawy: część -> (właściciel, czas wygaśnięcia)."""
+        rows = self._connection().execute("SELECT shard, owner, expires_at FROM leases")
+        return {shard: (owner, expires_at) for shard, owner, expires_at in rows.fetchall()}
+
+    def _connection(self) -> sqlite3.Connection:
+        """Zwraca połączenie bieżącego wątku."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+def run_worker(index: int, count: int, lease_path: Union[str, Path], ttl: float = 120.0):
+    """
+    Przetwarza pocztę z jednej części przestrzeni UID.
+
+    Args:
+        index: Numer części (UID mod count)
+        count: Liczba części
+        lease_path: Plik bazy dzierżaw
+        ttl: Czas ważności dzierżawy
+    """
+    from email_pipeline import EmailProcessor
+    from poll_scheduler import PollScheduler
+
+    owner = worker_name()
+    leases = ShardLeases(lease_path, ttl)
+    processor = EmailProcessor()
+    scheduler = PollScheduler()
+
+    # Wiadomość jest przetwarzana tylko, gdy proces nadal dzierży swoją część
+    processor.lease_guard = lambda: index in leases.renew(owner)
+    logger.info(f"Proces {owner} obsługuje część {index}/{count}")
+
+    try:
+        while True:
+            if index not in leases.acquire(owner, [index]):
+                # Poprzedni właściciel jeszcze nie zwolnił dzierżawy i nie wygasła
+                time.sleep(min(ttl / 4, 5.0))
+                continue
+
+            processor.shards = (frozenset([index]), count)
+            busy = processor.poll()
+
+            processing_config = processor.config["processing"]
+            scheduler.min_interval = processing_config["check_interval_seconds"]
+            scheduler.max_interval = processing_config.get("max_check_interval_seconds", scheduler.min_interval)
+            scheduler.jitter = processing_config.get("check_interval_jitter", 0.1)
+            deadline = time.time() + (scheduler.active() if busy else scheduler.idle())
+
+            # Odnawiaj dzierżawę także podczas oczekiwania
+            while time.time() < deadline:
+                leases.renew(owner)
+                time.sleep(max(0.0, min(ttl / 3, deadline - time.time())))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processor.disconnect()
+        processor.flow_dispatcher.shutdown(wait=True)
+        leases.release(owner)
+
+def run_supervisor(workers: int, lease_path: Union[str, Path], ttl: float = 120.0,
+                   check_interval: float = 5.0):
+    """
+    Uruchamia procesy robocze i zastępuje te, które się zakończyły lub przestały odnawiać dzierżawę.
+
+    Args:
+        workers: Liczba procesów (i części przestrzeni UID)
+        lease_path: Plik bazy dzierżaw
+        ttl: Czas ważności dzierżawy
+        check_interval: Co ile sekund sprawdzać procesy
+    """
+    leases = ShardLeases(lease_path, ttl)
+
+    def start(index: int) -> multiprocessing.Process:
+        process = multiprocessing.Process(target=run_worker, args=(index, workers, lease_path, ttl),
+                                          name=f"email-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(workers)}
+    logger.info(f"Uruchomiono {workers} procesów przetwarzania poczty")
+
+    try:
+        while True:
+            time.sleep(check_interval)
+            holders = leases.holders()
+            for index, process in processes.items():
+                owner = worker_name(process.pid)
+                if process.is_alive():
+                    # Proces żyje, ale od dawna nie odnawia dzierżawy - zawiesił się
+                    holder = holders.get(index)
+                    if holder and holder[0] == owner and holder[1] < time.time() - ttl:
+                        logger.warning(f"Proces {owner} nie odnawia dzierżawy części {index}, zatrzymuję")
+                        process.terminate()
+                    continue
+
+                logger.warning(f"Proces części {index} zakończył się (kod {process.exitcode}), uruchamiam ponownie")
+                leases.release(owner)
+                processes[index] = start(index)
+    except KeyboardInterrupt:
+        logger.info("Zatrzymywanie procesów przetwarzania poczty")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+            leases.release(worker_name(process.pid))
+
+if __name__ == "__main__":
+    import argparse
+
+    from email_pipeline import EMAILS_DIR, ensure_config
+
+    processing_config = ensure_config()["processing"]
+    parser = argparse.ArgumentParser(description="Run EmailProcessor in several worker processes")
+    parser.add_argument("--workers", type=int, default=processing_config.get("workers", 1),
+                        help="Number of worker processes")
+    parser.add_argument("--lease-seconds", type=float, default=processing_config.get("lease_seconds", 120),
+                        help="Seconds after which a silent worker's share of the mailbox is taken over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    run_supervisor(max(1, args.workers), EMAILS_DIR / "leases.db", args.lease_seconds)
@@ -57,6 +57,8 @@ else:
 # Import tasks
 from tasks import (
     fetch_emails,
+    group_threads,
+    deduplicate_emails,
     classify_emails,
     process_urgent_emails,
     process_emails_with_attachments,
@@ -66,6 +68,9 @@ from tasks import (
     send_responses
 )
 
+from flow_runner import run_flow_locally, stream_email_flow
+from flow_planner import DURATIONS_FILE, format_plan, load_durations, plan_flow, record_durations
+
 # Load environment variables
 load_dotenv()
 
@@ -73,7 +78,9 @@ load_dotenv()
 EMAIL_PROCESSING_DSL = """
 flow EmailProcessing:
     description: "Email processing flow with categorization"
-    fetch_emails -> classify_emails
+    fetch_emails -> group_threads
+    group_threads -> deduplicate_emails
+    deduplicate_emails -> classify_emails
     classify_emails -> process_urgent_emails
     classify_emails -> process_emails_with_attachments
     classify_emails -> process_support_emails
@@ -96,7 +103,8 @@ def save_flow_definition(dsl_text, filename="email_processing.dsl"):
     save_dsl(dsl_text, filename)
     print(f"Flow definition saved to {dsl_dir / filename}")
 
-def run_email_flow(server=None, username=None, password=None, folder="INBOX", limit=10):
+def run_email_flow(server=None, username=None, password=None, folder="INBOX", limit=10,
+                   local=False, max_workers=None, stream=False, batch_size=None, batch_delay_ms=200):
     """Run the email processing flow."""
     # Get email server credentials from environment variables if not provided
     if not server:
@@ -120,7 +128,22 @@ def run_email_flow(server=None, username=None, password=None, folder="INBOX", li
     
     # Run the flow
     print(f"Running email processing flow for {username} on {server}...")
-    results = run_flow_from_dsl(EMAIL_PROCESSING_DSL, input_data)
+    if stream:
+        # Move every email through the whole flow as soon as it is fetched
+        results = {"send_responses": stream_email_flow(input_data, batch_size=batch_size,
+                                                       batch_delay_ms=batch_delay_ms)}
+        print(f"Streaming flow finished in {results['send_responses']['duration']:.2f}s "
+              f"(first reply after {results['send_responses']['first_reply_seconds'] or 0:.2f}s)")
+        if "batching" in results["send_responses"]:
+            print(f"Micro-batching: {results['send_responses']['batching']}")
+    elif local:
+        # Run in-process, with the category branches executed concurrently
+        results = run_flow_locally(EMAIL_PROCESSING_DSL, input_data, max_workers=max_workers)
+        print(f"Local flow finished in {results['duration']:.2f}s")
+        # Keep per-task durations for the planner (--plan)
+        record_durations(results["task_durations"])
+    else:
+        results = run_flow_from_dsl(EMAIL_PROCESSING_DSL, input_data)
     
     # Print results
     print("\nEmail Processing Results:")
@@ -128,6 +151,8 @@ def run_email_flow(server=None, username=None, password=None, folder="INBOX", li
         response_results = results["send_responses"]
         print(f"Total emails processed: {response_results.get('total_attempted', 0)}")
         print(f"Total emails sent: {response_results.get('total_sent', 0)}")
+        if response_results.get('total_spooled'):
+            print(f"Queued for retry: {response_results['total_spooled']} (drain with: python -m tasks.outbound_spool)")
         print(f"  - Urgent: {response_results.get('sent_urgent', 0)}")
         print(f"  - With attachments: {response_results.get('sent_attachments', 0)}")
         print(f"  - Support: {response_results.get('sent_support', 0)}")
@@ -138,6 +163,18 @@ def run_email_flow(server=None, username=None, password=None, folder="INBOX", li
     
     return results
 
+def print_flow_plan(dsl_file=None, durations_file=None):
+    """Print the execution plan of a flow (the email processing flow by default)."""
+    if dsl_file:
+        with open(dsl_file, "r") as f:
+            dsl_text = f.read()
+    else:
+        dsl_text = EMAIL_PROCESSING_DSL
+
+    plan = plan_flow(dsl_text, load_durations(durations_file or DURATIONS_FILE))
+    print(format_plan(plan))
+    return plan
+
 def main():
     """Main function to run the email processing flow."""
     # Parse command line arguments
@@ -150,6 +187,14 @@ def main():
     parser.add_argument("--limit", type=int, default=10, help="Maximum number of emails to process")
     parser.add_argument("--save-only", action="store_true", help="Only save the flow definition, don't run it")
     parser.add_argument("--mock", action="store_true", help="Use mock data instead of connecting to a real server")
+    parser.add_argument("--local", action="store_true", help="Run the flow in-process with concurrent branches")
+    parser.add_argument("--workers", type=int, help="Maximum number of concurrently running tasks (with --local)")
+    parser.add_argument("--stream", action="store_true", help="Stream every email through the flow on its own")
+    parser.add_argument("--batch-size", type=int, help="Micro-batch size between classification and sending (with --stream)")
+    parser.add_argument("--batch-delay-ms", type=float, default=200, help="Maximum micro-batch wait in milliseconds (with --stream)")
+    parser.add_argument("--plan", action="store_true", help="Print the execution plan of the flow instead of running it")
+    parser.add_argument("--dsl-file", help="Flow definition to plan, e.g. flow.dsl (with --plan)")
+    parser.add_argument("--durations-file", help="JSON file with per-task durations in seconds (with --plan)")
     
     args = parser.parse_args()
     
@@ -157,6 +202,11 @@ def main():
     if args.mock:
         os.environ["MOCK_EMAILS"] = "true"
     
+    # Analyze the flow without running it
+    if args.plan:
+        print_flow_plan(args.dsl_file, args.durations_file)
+        return
+    
     # Save flow definition only if requested
     if args.save_only:
         save_flow_definition(EMAIL_PROCESSING_DSL)
@@ -168,7 +218,12 @@ def main():
         username=args.username,
         password=args.password,
         folder=args.folder,
-        limit=args.limit
+        limit=args.limit,
+        local=args.local,
+        max_workers=args.workers,
+        stream=args.stream,
+        batch_size=args.batch_size,
+        batch_delay_ms=args.batch_delay_ms
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Uruchamianie przepływów DSL dla email pipeline.
+Wybiera przepływ dla emaila jednym skompilowanym wyrażeniem zamiast sprawdzania kolejnych
+kluczy mapowania, przechowuje definicje przepływów w pamięci do czasu zmiany pliku
+i wykonuje przepływy w ograniczonej puli wątków, poza pętlą przetwarzania poczty.
+"""
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Katalog z definicjami przepływów wskazywanymi w flow_mapping
+FLOWS_DIR = Path(__file__).parent / "dsl_definitions"
+
+class FlowRouter:
+    """Mapowanie słowo kluczowe -> plik przepływu skompilowane do jednego wyrażenia."""
+
+    def __init__(self, flow_mapping: Dict[str, str]):
+        """
+        Kompiluje mapowanie.
+
+        Args:
+            flow_mapping: Słowo kluczowe -> plik przepływu; przy kilku pasujących wygrywa wcześniejsze
+        """
+        self.keys = list(flow_mapping)
+        self.files = dict(flow_mapping)
+        self._priority = {key: index for index, key in enumerate(self.keys)}
+
+        # Podgląd w przód znajduje na każdej pozycji klucz o najwyższym priorytecie,
+        # także gdy klucze na siebie zachodzą
+        self._pattern = None
+        if self.keys:
+            self._pattern = re.compile("(?=(" + "|".join(re.escape(key) for key in self.keys) + "))")
+
+    def route(self, subject: str, body: str) -> Optional[str]:
+        """
+        Wybiera przepływ dla emaila.
+
+        Args:
+            subject: Temat emaila
+            body: Treść emaila
+
+        Returns:
+            Klucz pierwszego (wg kolejności mapowania) słowa występującego w temacie lub treści albo None
+        """
+        if self._pattern is None:
+            return None
+
+        best = None
+        for match in self._pattern.finditer(f"{subject.lower()}\x00{body.lower()}"):
+            priority = self._priority[match.group(1)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+        return None if best is None else self.keys[best]
+
+class FlowCache:
+    """Definicje przepływów w pamięci, wczytywane ponownie po zmianie pliku."""
+
+    def __init__(self):
+        self._flows: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: Union[str, Path]) -> Optional[str]:
+        """
+        Zwraca definicję przepływu.
+
+        Args:
+            path: Plik przepływu
+
+        Returns:
+            Treść DSL lub None, jeśli plik nie istnieje
+        """
+        path = str(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._flows.get(path)
+            if cached and cached[0] == version:
+                return cached[1]
+
+        with open(path, "r") as f:
+            dsl_content = f.read()
+        with self._lock:
+            self._flows[path] = (version, dsl_content)
+        return dsl_content
+
+def get_flow_runner() -> Callable[[str, Dict[str, Any]], Any]:
+    """Zwraca funkcję uruchamiającą przepływ z DSL (import tutaj, aby uniknąć cyklicznych importów)."""
+    from flow_dsl import run_flow_from_dsl
+    return run_flow_from_dsl
+
+class FlowTimeout(Exception):
+    """Przepływ nie zakończył się w wyznaczonym czasie."""
+
+# Wywoływana po zakończeniu przepływu: (klucz przepływu, wynik, błąd)
+FlowCallback = Callable[[str, Any, Optional[BaseException]], None]
+
+class FlowDispatcher:
+    """Ograniczona pula wątków dla przepływów z limitem równoległych uruchomień każdego przepływu."""
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, default_limit: int = 1,
+                 limits: Optional[Dict[str, int]] = None, timeout: Optional[float] = 300.0):
+        """
+        Inicjalizuje pulę.
+
+        Args:
+            max_workers: Liczba wątków wykonujących przepływy
+            max_pending: Największa liczba przepływów oczekujących i wykonywanych; submit czeka, gdy jest pełno
+            default_limit: Ile uruchomień tego samego przepływu może działać równocześnie
+            limits: Limity dla wybranych przepływów (klucz -> limit)
+            timeout: Czas, po którym przepływ jest zgłaszany jako przekroczony (None - bez limitu)
+        """
+        self.max_pending = max_pending
+        self.default_limit = default_limit
+        self.limits = dict(limits or {})
+        self.timeout = timeout
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flow")
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._running: Dict[str, int] = {}
+        self._waiting: Dict[str, Deque[Callable[[], None]]] = {}
+
+    def configure(self, default_limit: int, limits: Dict[str, int], timeout: Optional[float]):
+        """Zmienia limity i czas wykonania dla kolejnych uruchomień (np. po przeładowaniu konfiguracji)."""
+        with self._condition:
+            self.default_limit = default_limit
+            self.limits = dict(limits)
+            self.timeout = timeout
+            for key in list(self._waiting):
+                self._start_waiting(key)
+
+    def submit(self, key: str, fn: Callable[..., Any], *args, callback: Optional[FlowCallback] = None) -> Future:
+        """
+        Zleca wykonanie przepływu i wraca od razu (czeka tylko, gdy pula jest pełna).
+
+        Args:
+            key: Klucz przepływu, którego dotyczy limit równoległych uruchomień
+            fn: Funkcja uruchamiająca przepływ
+            *args: Argumenty funkcji
+            callback: Funkcja wywoływana raz z wynikiem, błędem lub FlowTimeout
+
+        Returns:
+            Future z wynikiem przepływu
+        """
+        future: Future = Future()
+        finished = threading.Lock()
+
+        def complete(result: Any = None, error: Optional[BaseException] = None):
+            # Pierwsze z: zakończenie lub przekroczenie czasu; późniejsze jest tylko logowane
+            if not finished.acquire(blocking=False):
+                if error is None:
+                    logger.info(f"Przepływ {key} zakończył się po przekroczeniu czasu")
+                return
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+            if callback:
+                try:
+                    callback(key, result, error)
+                except Exception as e:
+                    logger.error(f"Błąd funkcji zwrotnej przepływu {key}: {str(e)}")
+
+        def run():
+            timer = None
+            if self.timeout:
+                timer = threading.Timer(self.timeout, complete,
+                                        kwargs={"error": FlowTimeout(f"{key}: ponad {self.timeout}s")})
+                timer.daemon = True
+                timer.start()
+            try:
+                complete(fn(*args))
+            except Exception as e:
+                complete(error=e)
+            finally:
+                if timer:
+                    timer.cancel()
+                self._finished(key)
+
+        with self._condition:
+            while self._pending >= self.max_pending:
+                self._condition.wait()
+            self._pending += 1
+            self._waiting.setdefault(key, deque()).append(run)
+            self._start_waiting(key)
+        return future
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Czeka, aż wszystkie zlecone przepływy się zakończą.
+
+        Args:
+            timeout: Największy czas oczekiwania w sekundach
+
+        Returns:
+            True, jeśli nie ma już oczekujących przepływów
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Zwraca liczbę oczekujących i wykonywanych przepływów."""
+        with self._condition:
+            return {"pending": self._pending, "running": dict(self._running),
+                    "waiting": {key: len(jobs) for key, jobs in self._waiting.items() if jobs}}
+
+    def shutdown(self, wait: bool = True):
+        """Zatrzymuje pulę (po zakończeniu zleconych przepływów, jeśli wait=True)."""
+        if wait:
+            self.wait()
+        self._executor.shutdown(wait=wait)
+
+    def _start_waiting(self, key: str):
+        """Przekazuje do puli oczekujące uruchomienia przepływu w granicach jego limitu (wymaga blokady)."""
+        waiting = self._waiting.get(key)
+        limit = self.limits.get(key, self.default_limit)
+        while waiting and self._running.get(key, 0) < limit:
+            self._running[key] = self._running.get(key, 0) + 1
+            self._executor.submit(waiting.popleft())
+
+    def _finished(self, key: str):
+        with self._condition:
+            self._running[key] -= 1
+            self._pending -= 1
+            self._start_waiting(key)
+            self._condition.notify_all()
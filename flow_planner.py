@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Static execution planner for Taskinity flow DSLs.
+Parses a flow without running it and computes its topological levels, the number of
+tasks that can run concurrently at each level and the critical path weighted by
+historical per-task durations.
+"""
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from flow_runner import parse_flow_dsl
+
+# Per-task durations recorded by local flow runs
+DURATIONS_FILE = Path(__file__).resolve().parent / "logs" / "task_durations.json"
+
+# "task name(arg, other.field) -> output" declarations of the block-style DSL
+_TASK_PATTERN = re.compile(r"\btask\s+(\w+)\s*\(([^)]*)\)\s*->\s*(\w+)")
+
+def parse_dsl(dsl_text: str) -> Dict[str, List[str]]:
+    """
+    Parse the task dependencies of a flow in either DSL format.
+
+    Block-style flows ("task name(args) -> output", as in flow.dsl) depend on every task
+    whose output is referenced by one of their arguments; arrow-style flows
+    ("source -> target" lines) are parsed by parse_flow_dsl.
+
+    Args:
+        dsl_text: Flow definition
+
+    Returns:
+        Dictionary mapping every task to its upstream tasks, in declaration order
+    """
+    text = re.sub(r"//[^\n]*", "", dsl_text)
+    declarations = _TASK_PATTERN.findall(text)
+    if not declarations:
+        return parse_flow_dsl(dsl_text)
+
+    producers = {output: name for name, _, output in declarations}
+    dependencies: Dict[str, List[str]] = {}
+    for name, args, _ in declarations:
+        upstream = dependencies.setdefault(name, [])
+        for arg in args.split(","):
+            producer = producers.get(arg.strip().split(".", 1)[0])
+            if producer and producer != name and producer not in upstream:
+                upstream.append(producer)
+    return dependencies
+
+def load_durations(path: Union[str, Path] = DURATIONS_FILE) -> Dict[str, float]:
+    """
+    Load historical per-task durations.
+
+    Args:
+        path: JSON file mapping task names to seconds
+
+    Returns:
+        Durations by task name (empty if the file does not exist or is invalid)
+    """
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: float(seconds) for name, seconds in data.items() if isinstance(seconds, (int, float))}
+
+def record_durations(durations: Dict[str, float], path: Union[str, Path] = DURATIONS_FILE,
+                     alpha: float = 0.3) -> Dict[str, float]:
+    """
+    Fold the durations of one flow run into the history.
+
+    Args:
+        durations: Seconds taken by every task of the run
+        path: JSON file holding the history
+        alpha: Weight of the new run in the exponential moving average
+
+    Returns:
+        Updated durations by task name
+    """
+    history = load_durations(path)
+    for name, seconds in durations.items():
+        previous = history.get(name)
+        history[name] = seconds if previous is None else alpha * seconds + (1 - alpha) * previous
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+    return history
+
+def plan_flow(dsl_text: str, durations: Optional[Dict[str, float]] = None,
+              default_duration: float = 1.0) -> Dict[str, Any]:
+    """
+    Compute the execution plan of a flow.
+
+    Args:
+        dsl_text: Flow definition
+        durations: Historical seconds per task
+        default_duration: Weight of tasks without history
+
+    Returns:
+        Dictionary with "levels" (tasks that can start together, in dependency order),
+        "parallelism" (tasks per level), "max_parallelism", "critical_path",
+        "critical_path_duration", "durations" (the weights used) and "estimated"
+        (tasks weighted with the default)
+
+    Raises:
+        ValueError: If the flow contains a cycle
+    """
+    dependencies = parse_dsl(dsl_text)
+    durations = durations or {}
+    weights = {name: durations.get(name, default_duration) for name in dependencies}
+
+    # Kahn's algorithm, one level at a time
+    downstream: Dict[str, List[str]] = {name: [] for name in dependencies}
+    remaining = {}
+    for name, upstream in dependencies.items():
+        remaining[name] = len(upstream)
+        for source in upstream:
+            downstream[source].append(name)
+
+    levels: List[List[str]] = []
+    ready = [name for name, count in remaining.items() if count == 0]
+    while ready:
+        levels.append(ready)
+        following = []
+        for name in ready:
+            for target in downstream[name]:
+                remaining[target] -= 1
+                if remaining[target] == 0:
+                    following.append(target)
+        ready = following
+
+    planned = sum(len(level) for level in levels)
+    if planned < len(dependencies):
+        cycle = [name for name, count in remaining.items() if count > 0]
+        raise ValueError(f"Flow contains a cycle: {', '.join(cycle)}")
+
+    # Longest weighted path: earliest finish of every task, in topological order
+    finish: Dict[str, float] = {}
+    previous: Dict[str, Optional[str]] = {}
+    for level in levels:
+        for name in level:
+            slowest = max(dependencies[name], key=lambda source: finish[source], default=None)
+            previous[name] = slowest
+            finish[name] = weights[name] + (finish[slowest] if slowest else 0.0)
+
+    critical_path: List[str] = []
+    last = max(finish, key=finish.get, default=None)
+    while last:
+        critical_path.append(last)
+        last = previous[last]
+    critical_path.reverse()
+
+    parallelism = [len(level) for level in levels]
+    return {
+        "levels": levels,
+        "parallelism": parallelism,
+        "max_parallelism": max(parallelism, default=0),
+        "critical_path": critical_path,
+        "critical_path_duration": finish[critical_path[-1]] if critical_path else 0.0,
+        "durations": weights,
+        "estimated": [name for name in dependencies if name not in durations]
+    }
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Render a plan computed by plan_flow as text."""
+    lines = ["Execution plan:"]
+    for index, level in enumerate(plan["levels"]):
+        lines.append(f"  Level {index} (parallelism {len(level)}): {', '.join(level)}")
+    lines.append(f"Maximum parallelism: {plan['max_parallelism']}")
+    lines.append(f"Critical path ({plan['critical_path_duration']:.2f}s): {' -> '.join(plan['critical_path'])}")
+
+    if plan["critical_path"]:
+        bottleneck = max(plan["critical_path"], key=lambda name: plan["durations"][name])
+        lines.append(f"Slowest task on the critical path: {bottleneck} ({plan['durations'][bottleneck]:.2f}s)")
+    if plan["estimated"]:
+        lines.append(f"No recorded duration (default weight used): {', '.join(plan['estimated'])}")
+    return "\n".join(lines)
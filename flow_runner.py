@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Local flow runner for Taskinity email processing example.
+Runs a DSL flow in-process and executes independent branches concurrently,
+or streams every email through the flow on its own.
+"""
+import inspect
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Counter keys of the send_responses result, by category key
+SENT_COUNTER_KEYS = {
+    "urgent": "sent_urgent",
+    "attachments": "sent_attachments",
+    "support": "sent_support",
+    "order": "sent_orders",
+    "regular": "sent_regular"
+}
+
+def parse_flow_dsl(dsl_text: str) -> Dict[str, List[str]]:
+    """
+    Parse the dependencies of an arrow-style flow DSL.
+
+    Args:
+        dsl_text: Flow definition with "source -> target" lines
+
+    Returns:
+        Dictionary mapping every task to its upstream tasks, in declaration order
+    """
+    dependencies: Dict[str, List[str]] = {}
+    for line in dsl_text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if "->" not in line:
+            continue
+
+        source, target = (part.strip() for part in line.split("->", 1))
+        dependencies.setdefault(source, [])
+        upstream = dependencies.setdefault(target, [])
+        if source not in upstream:
+            upstream.append(source)
+
+    return dependencies
+
+def default_task_functions() -> Dict[str, Callable]:
+    """Return the task functions of the tasks package by name."""
+    import tasks
+    return {name: getattr(tasks, name) for name in tasks.__all__}
+
+def run_flow_locally(dsl_text: str, input_data: Dict[str, Any],
+                     task_functions: Optional[Dict[str, Callable]] = None,
+                     max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Run a flow in-process, executing independent tasks concurrently.
+
+    Inputs are bound as follows:
+    - tasks without upstream tasks receive the matching keys of input_data,
+    - a task with one upstream task receives the upstream result; if the result is a
+      dictionary containing the task's first parameter name, only that entry is passed,
+    - a task with several upstream tasks receives their results positionally,
+      in the order in which the edges are declared.
+
+    Args:
+        dsl_text: Flow definition
+        input_data: Input parameters for the root tasks
+        task_functions: Task functions by name (default: the tasks package)
+        max_workers: Thread pool size (default: widest possible fan-out)
+
+    Returns:
+        Dictionary with the result of every task by name, plus "status", "duration" and
+        "task_durations" (seconds per task)
+    """
+    dependencies = parse_flow_dsl(dsl_text)
+    if task_functions is None:
+        task_functions = default_task_functions()
+
+    missing = [name for name in dependencies if name not in task_functions]
+    if missing:
+        raise ValueError(f"Unknown tasks in flow: {', '.join(missing)}")
+
+    if max_workers is None:
+        max_workers = max(1, len(dependencies))
+
+    start_time = time.time()
+    results: Dict[str, Any] = {}
+    pending = dict(dependencies)
+    running: Dict[Future, str] = {}
+    task_durations: Dict[str, float] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flow") as executor:
+        while pending or running:
+            # Start every task whose upstream tasks have finished
+            for name in [n for n, upstream in pending.items() if all(u in results for u in upstream)]:
+                del pending[name]
+                args, kwargs = _bind_inputs(task_functions[name], dependencies[name], results, input_data)
+                running[executor.submit(_timed, task_functions[name], *args, **kwargs)] = name
+
+            if not running:
+                raise ValueError(f"Flow contains a cycle: {', '.join(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name], task_durations[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+
+    results["status"] = "success"
+    results["duration"] = time.time() - start_time
+    results["task_durations"] = task_durations
+    return results
+
+def _timed(function: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """Call a task function and return its result with the seconds it took."""
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+def _bind_inputs(function: Callable, upstream: List[str], results: Dict[str, Any],
+                 input_data: Dict[str, Any]):
+    """Build the positional and keyword arguments of a task call."""
+    parameters = list(inspect.signature(function).parameters)
+
+    if not upstream:
+        return [], {key: value for key, value in input_data.items() if key in parameters}
+
+    if len(upstream) == 1:
+        result = results[upstream[0]]
+        if isinstance(result, dict) and parameters and parameters[0] in result:
+            return [result[parameters[0]]], {}
+        return [result], {}
+
+    return [results[name] for name in upstream], {}
+
+def stream_email_flow(input_data: Dict[str, Any], queue_size: int = 10,
+                      suppress_duplicates: bool = False,
+                      send: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                      batch_size: Optional[int] = None,
+                      batch_delay_ms: float = 200.0) -> Dict[str, Any]:
+    """
+    Run the email flow in streaming mode.
+
+    Every email moves through fetch -> deduplicate -> classify -> process -> send on its
+    own as soon as the previous stage has produced it. Stages run in separate threads
+    connected by bounded queues, so memory use does not grow with the batch size.
+    Thread grouping needs the whole batch and is not applied in this mode.
+
+    With batch_size set, classified emails are collected by a micro-batcher instead and
+    every flushed batch runs through the process_* tasks and is sent together; a batch is
+    flushed at batch_size emails or after batch_delay_ms, whichever comes first.
+
+    Args:
+        input_data: Fetch parameters (server, username, password, folder, limit)
+        queue_size: Capacity of the queues between stages
+        suppress_duplicates: Drop near-duplicates instead of reusing their classification
+        send: Function sending a single response (default: send, or queue in the outbound spool)
+        batch_size: Micro-batch size (default: no micro-batching)
+        batch_delay_ms: Maximum time an email waits in a micro-batch
+
+    Returns:
+        Dictionary in the send_responses format, plus "first_reply_seconds", "duration"
+        and, with micro-batching, "batching" statistics
+    """
+    from tasks.fetch_emails import iter_emails
+    from tasks.send_emails import _send_or_spool
+
+    if send is None:
+        send = _send_or_spool
+
+    fetch_args = {key: value for key, value in input_data.items()
+                  if key in ("server", "username", "password", "folder", "limit")}
+
+    results = {key: 0 for key in SENT_COUNTER_KEYS.values()}
+    results.update({"total_sent": 0, "total_spooled": 0, "total_attempted": 0,
+                    "first_reply_seconds": None})
+
+    start_time = time.time()
+
+    def send_counted(category: str, response: Dict[str, Any]):
+        results[SENT_COUNTER_KEYS[category]] += 1
+        results["total_attempted"] += 1
+        sent = send(response)
+        if sent == "spooled":
+            results["total_spooled"] += 1
+        elif sent:
+            results["total_sent"] += 1
+            if results["first_reply_seconds"] is None:
+                results["first_reply_seconds"] = time.time() - start_time
+
+    emails = _threaded(iter_emails(**fetch_args), queue_size)
+    classified = _threaded(_classify_stream(emails, suppress_duplicates), queue_size)
+
+    try:
+        if batch_size:
+            from tasks.micro_batch import MicroBatcher
+
+            batcher = MicroBatcher(lambda batch: _process_batch(batch, send_counted),
+                                   max_size=batch_size, max_delay_ms=batch_delay_ms)
+            try:
+                for category, email in classified:
+                    batcher.add((category, email))
+            finally:
+                batcher.close()
+            results["batching"] = batcher.stats()
+        else:
+            from tasks.process_emails import build_response
+
+            for category, email in classified:
+                send_counted(category, build_response(category, email))
+    finally:
+        # Stops every stage on an error; closing the last one propagates upstream
+        classified.close()
+
+    results["duration"] = time.time() - start_time
+    return results
+
+def _classify_stream(emails: Iterable[Dict[str, Any]],
+                     suppress_duplicates: bool) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Deduplicate and classify emails one at a time."""
+    from tasks.classify_emails import classify_email
+    from tasks.deduplicate_emails import check_duplicate
+
+    try:
+        for email in emails:
+            if check_duplicate(email) and suppress_duplicates:
+                continue
+            for category in classify_email(email):
+                yield category, email
+    finally:
+        # Stop the upstream stage too when this one is closed early
+        close = getattr(emails, "close", None)
+        if close:
+            close()
+
+def _process_batch(batch: List[Tuple[str, Dict[str, Any]]],
+                   send: Callable[[str, Dict[str, Any]], None]):
+    """Run a micro-batch through the process_* task of each category and send the responses."""
+    from tasks.process_emails import PROCESS_TASKS
+
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
+    for category, email in batch:
+        by_category.setdefault(category, []).append(email)
+
+    for category, emails in by_category.items():
+        for response in PROCESS_TASKS[category](emails):
+            send(category, response)
+
+_END = object()
+
+def _threaded(items: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """
+    Consume an iterable in a background thread through a bounded queue.
+
+    The producer blocks when the queue is full, which gives backpressure to the
+    upstream stage. Exceptions raised by the producer are re-raised in the consumer.
+    When the consumer stops early (an exception or close()), the producer stops as well
+    and closes the source, so e.g. iter_emails logs out of the IMAP server.
+    """
+    buffer: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+    errors: List[BaseException] = []
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            # Close the source in the thread that iterates it
+            close = getattr(items, "close", None)
+            if close:
+                close()
+            put(_END)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                break
+            yield item
+    finally:
+        stop.set()
+        # Free the queue for a producer blocked on it
+        while not buffer.empty():
+            buffer.get_nowait()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Rejestr przetwarzania wiadomości przychodzących dla email pipeline.
+Zapisuje w SQLite etap, do którego doszło przetwarzanie każdej wiadomości (po Message-ID),
+dzięki czemu procesor uruchomiony ponownie po awarii wznawia pracę od właściwego etapu
+i nie powtarza zakończonych kroków. Filtr Blooma odpowiada bez zapytania do bazy
+na pytania o wiadomości, których rejestr nigdy nie widział. Wątek w tle usuwa zakończone
+wpisy starsze niż okres przechowywania i przebudowuje filtr według pozostałych wpisów.
+"""
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Etapy przetwarzania w kolejności
+FETCHED = "fetched"            # pobrana ze skrzynki
+CLASSIFIED = "classified"      # podjęto decyzję o odpowiedzi (zapisana w rejestrze)
+REPLIED = "replied"            # odpowiedź wysłana lub niepotrzebna
+TRIGGERED = "triggered"        # przepływ uruchomiony lub niepotrzebny
+ARCHIVED = "archived"          # oznaczona jako przeczytana i zarchiwizowana
+STAGES = (FETCHED, CLASSIFIED, REPLIED, TRIGGERED, ARCHIVED)
+_RANK = {stage: rank for rank, stage in enumerate(STAGES)}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inbound (
+    message_id TEXT PRIMARY KEY,
+    stage INTEGER NOT NULL,
+    decision TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS inbound_stage ON inbound (stage, updated_at);
+"""
+
+class BloomFilter:
+    """Filtr Blooma na bajtach: brak fałszywie ujemnych odpowiedzi, rzadkie fałszywie dodatnie."""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        """
+        Inicjalizuje filtr.
+
+        Args:
+            capacity: Oczekiwana liczba elementów
+            error_rate: Docelowe prawdopodobieństwo fałszywie dodatniej odpowiedzi przy tej liczbie
+        """
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def add(self, key: str):
+        """Dodaje element."""
+        with self._lock:
+            for position in self._positions(key):
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+def message_key(message_id: Optional[str], raw_email: bytes) -> str:
+    """
+    Zwraca klucz wiadomości w rejestrze.
+
+    Args:
+        message_id: Nagłówek Message-ID
+        raw_email: Surowa wiadomość (dla wiadomości bez Message-ID)
+
+    Returns:
+        Message-ID lub skrót treści wiadomości
+    """
+    message_id = (message_id or "").strip()
+    if message_id:
+        return message_id
+    return "sha1:" + hashlib.sha1(raw_email).hexdigest()
+
+class InboundLedger:
+    """Rejestr etapów przetwarzania: Message-ID -> etap i decyzja o odpowiedzi."""
+
+    def __init__(self, path: Union[str, Path], bloom_capacity: int = 100000,
+                 retention_seconds: float = 30 * 24 * 3600, compact_interval: float = 3600.0):
+        """
+        Otwiera (i w razie potrzeby tworzy) rejestr i wypełnia filtr Blooma.
+
+        Args:
+            path: Plik bazy SQLite
+            bloom_capacity: Minimalna pojemność filtra Blooma
+            retention_seconds: Wiek, po którym zakończone wpisy są usuwane przy kompaktowaniu
+            compact_interval: Co ile sekund wątek w tle usuwa stare wpisy (0 - bez wątku)
+        """
+        self.path = str(path)
+        self.bloom_capacity = bloom_capacity
+        self.retention_seconds = retention_seconds
+        self.compact_interval = compact_interval
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        # Chroni filtr przy przebudowie, aby żaden dodawany klucz nie został pominięty
+        self._bloom_lock = threading.Lock()
+        self._connection().executescript(_SCHEMA)
+        self._rebuild_bloom()
+
+        self._compactor = None
+        if compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="inbound-ledger-compact",
+                                               daemon=True)
+            self._compactor.start()
+
+    def get(self, message_id: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Zwraca etap wiadomości.
+
+        Args:
+            message_id: Klucz wiadomości
+
+        Returns:
+            Krotka (etap, decyzja) lub None dla wiadomości nieznanej
+        """
+        if message_id not in self._bloom:
+            return None
+        row = self._connection().execute("SELECT stage, decision FROM inbound WHERE message_id = ?",
+                                         (message_id,)).fetchone()
+        return (STAGES[row[0]], row[1]) if row else None
+
+    def advance(self, message_id: str, stage: str, decision: Optional[str] = None):
+        """
+        Zapisuje osiągnięcie etapu; etap nigdy się nie cofa.
+
+        Args:
+            message_id: Klucz wiadomości
+            stage: Osiągnięty etap
+            decision: Decyzja o odpowiedzi (szablon lub pusty napis), zapisywana przy klasyfikacji
+        """
+        with self._bloom_lock:
+            self._connection().execute(
+                "INSERT INTO inbound (message_id, stage, decision, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(message_id) DO UPDATE SET stage = excluded.stage, "
+                "decision = COALESCE(excluded.decision, decision), updated_at = excluded.updated_at "
+                "WHERE excluded.stage > stage",
+                (message_id, _RANK[stage], decision, time.time())
+            )
+            if message_id not in self._bloom:
+                self._bloom.add(message_id)
+                self._bloom_keys += 1
+            full = self._bloom_keys > self._bloom.capacity
+        # Po przekroczeniu pojemności filtr przestaje odsiewać nieznane wiadomości
+        if full:
+            self._rebuild_bloom()
+
+    def is_done(self, message_id: str) -> bool:
+        """Sprawdza, czy wiadomość przeszła wszystkie etapy."""
+        entry = self.get(message_id)
+        return entry is not None and entry[0] == ARCHIVED
+
+    def unfinished(self) -> List[Tuple[str, str]]:
+        """
+        Zwraca wiadomości, których przetwarzanie zostało przerwane.
+
+        Returns:
+            Lista krotek (klucz wiadomości, etap)
+        """
+        rows = self._connection().execute("SELECT message_id, stage FROM inbound WHERE stage < ? "
+                                          "ORDER BY updated_at", (_RANK[ARCHIVED],))
+        return [(message_id, STAGES[stage]) for message_id, stage in rows.fetchall()]
+
+    def compact(self, max_age_seconds: Optional[float] = None, now: Optional[float] = None) -> int:
+        """
+        Usuwa zakończone wpisy starsze niż podany wiek i przebudowuje filtr Blooma.
+
+        Args:
+            max_age_seconds: Wiek, po którym wpis jest usuwany (domyślnie retention_seconds)
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            Liczba usuniętych wpisów
+        """
+        now = time.time() if now is None else now
+        max_age_seconds = self.retention_seconds if max_age_seconds is None else max_age_seconds
+        cursor = self._connection().execute("DELETE FROM inbound WHERE stage = ? AND updated_at <= ?",
+                                            (_RANK[ARCHIVED], now - max_age_seconds))
+        # Usunięte klucze wypadają z filtra, który dostaje rozmiar według pozostałych wpisów
+        if cursor.rowcount:
+            self._rebuild_bloom()
+        return cursor.rowcount
+
+    def close(self):
+        """Zatrzymuje kompaktowanie i zamyka połączenie bieżącego wątku."""
+        self._stop.set()
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _rebuild_bloom(self):
+        """Tworzy filtr Blooma od nowa z kluczy w bazie, z zapasem na dwukrotnie więcej wpisów."""
+        with self._bloom_lock:
+            message_ids = [row[0] for row in self._connection().execute("SELECT message_id FROM inbound")]
+            bloom = BloomFilter(max(self.bloom_capacity, 2 * len(message_ids)))
+            for message_id in message_ids:
+                bloom.add(message_id)
+            self._bloom = bloom
+            self._bloom_keys = len(message_ids)
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                removed = self.compact()
+                if removed:
+                    logger.debug(f"Usunięto {removed} zakończonych wpisów rejestru wiadomości")
+            except Exception as e:
+                logger.error(f"Błąd kompaktowania rejestru wiadomości: {str(e)}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Zwraca połączenie bieżącego wątku."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
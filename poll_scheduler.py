@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Harmonogram odpytywania skrzynki dla email pipeline.
+Wydłuża odstęp między cyklami wykładniczo, gdy skrzynka jest bezczynna, skraca go
+do minimum, gdy pojawia się ruch, i dodaje losowe odchylenie, aby wiele procesów
+nie odpytywało serwera w tych samych chwilach.
+"""
+import random
+from typing import Optional
+
+class PollScheduler:
+    """Odstępy odpytywania z wykładniczym wydłużaniem i losowym odchyleniem."""
+
+    def __init__(self, min_interval: float = 60.0, max_interval: float = 600.0, factor: float = 2.0,
+                 jitter: float = 0.1, rng: Optional[random.Random] = None):
+        """
+        Inicjalizuje harmonogram.
+
+        Args:
+            min_interval: Odstęp przy ruchu w skrzynce (sekundy)
+            max_interval: Największy odstęp przy bezczynności (sekundy)
+            factor: Mnożnik odstępu po każdym bezczynnym cyklu
+            jitter: Względne losowe odchylenie odstępu (0.1 = ±10%)
+            rng: Generator liczb losowych (do testów)
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.interval = min_interval
+        self._rng = rng or random.Random()
+
+    def active(self) -> float:
+        """
+        Zwraca odstęp po cyklu, w którym przetworzono wiadomości.
+
+        Returns:
+            Czas oczekiwania w sekundach
+        """
+        self.interval = self.min_interval
+        return self._jittered()
+
+    def idle(self) -> float:
+        """
+        Zwraca odstęp po cyklu bez nowych wiadomości.
+
+        Returns:
+            Czas oczekiwania w sekundach
+        """
+        self.interval = min(max(self.interval, self.min_interval) * self.factor, self.max_interval)
+        return self._jittered()
+
+    def _jittered(self) -> float:
+        return max(0.0, self.interval * (1 + self._rng.uniform(-self.jitter, self.jitter)))
@@ -41,6 +41,7 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
 FROM_EMAIL = os.getenv("FROM_EMAIL", SMTP_USERNAME)
 REPLY_TO_EMAIL = os.getenv("REPLY_TO_EMAIL", FROM_EMAIL)
 TEST_EMAIL = os.getenv("TEST_EMAIL")  # Default test email
+SMTP_BACKEND = os.getenv("SMTP_BACKEND", "smtplib").lower()  # smtplib or asyncio
 
 # IMAP Configuration
 IMAP_SERVER = os.getenv("IMAP_SERVER")
@@ -166,31 +167,18 @@ Subject: {subject}
 
 {content}"""
     
-    server = None
+    from tasks.send_emails import _deliver
+    
     try:
-        print(f"🔌 Connecting to SMTP server: {SMTP_SERVER}:{SMTP_PORT}...")
+        print(f"✉️  Sending email to {email}...")
         start_time = time.time()
         
-        # Handle SSL vs non-SSL connections
-        if SMTP_PORT == 465:  # SSL
-            print("🔒 Using SSL connection...")
-            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=timeout)
-        else:  # Non-SSL or STARTTLS
-            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=timeout)
-            if SMTP_PORT == 587:  # STARTTLS
-                print("🔒 Starting TLS...")
-                server.starttls()
-        
-        # Enable debug output
-        server.set_debuglevel(1)
-        
-        # Login
-        print(f"🔑 Authenticating as {SMTP_USERNAME}...")
-        server.login(SMTP_USERNAME, SMTP_PASSWORD)
-        
-        # Send the email
-        print(f"✉️  Sending email to {email}...")
-        server.sendmail(FROM_EMAIL, email, message)
+        # Pooled connections, weighted relays with failover and adaptive rate limits,
+        # shared with the Taskinity tasks (SMTP_RELAYS, SMTP_BACKEND, SMTP_RELAY_RATE, ...)
+        _deliver(FROM_EMAIL, [email], message,
+                 {"server": SMTP_SERVER, "port": SMTP_PORT, "username": SMTP_USERNAME,
+                  "password": SMTP_PASSWORD, "use_tls": SMTP_PORT == 587,
+                  "backend": SMTP_BACKEND, "timeout": timeout})
         
         elapsed = time.time() - start_time
         print(f"✅ Email sent successfully in {elapsed:.2f} seconds")
@@ -207,15 +195,9 @@ Subject: {subject}
     except socket.timeout as e:
         print(f"⌛ Operation timed out after {timeout} seconds: {str(e)}")
     except Exception as e:
-        print(f"❌ Unexpected error: {str(e)}")
+        print(f"❌ Unexpected error: {type(e).__name__}: {str(e)}")
         import traceback
         traceback.print_exc()
-    finally:
-        try:
-            if server:
-                server.quit()
-        except Exception as e:
-            print(f"⚠️  Error while closing connection: {str(e)}")
     
     return False
 
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Historia automatycznych odpowiedzi dla email pipeline.
+Przechowuje czas ostatniej odpowiedzi do każdego nadawcy w SQLite (tryb WAL) z indeksem
+po nadawcy, usuwa wpisy po upływie okresu cooldown i może być współdzielona przez kilka
+procesów przetwarzających pocztę.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replies (
+    sender TEXT PRIMARY KEY,
+    replied_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replies_replied_at ON replies (replied_at);
+"""
+
+class ReplyHistory:
+    """Historia odpowiedzi: nadawca -> czas ostatniej odpowiedzi (epoch)."""
+
+    def __init__(self, path: Union[str, Path], cooldown_seconds: float = 24 * 3600,
+                 compact_interval: float = 3600.0):
+        """
+        Otwiera (i w razie potrzeby tworzy) bazę historii.
+
+        Args:
+            path: Plik bazy SQLite
+            cooldown_seconds: Okres, przez który nie odpowiadamy ponownie temu samemu nadawcy
+            compact_interval: Co ile sekund wątek w tle usuwa wygasłe wpisy (0 - bez wątku)
+        """
+        self.path = str(path)
+        self.cooldown_seconds = cooldown_seconds
+        self.compact_interval = compact_interval
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._connection().executescript(_SCHEMA)
+
+        self._compactor = None
+        if compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="reply-history-compact",
+                                               daemon=True)
+            self._compactor.start()
+
+    def record(self, sender: str, replied_at: Optional[float] = None):
+        """
+        Zapisuje odpowiedź do nadawcy (jeden wiersz, bez przepisywania całej historii).
+
+        Args:
+            sender: Adres nadawcy
+            replied_at: Czas odpowiedzi (domyślnie teraz)
+        """
+        replied_at = time.time() if replied_at is None else replied_at
+        # MAX zachowuje nowszy wpis, gdy kilka procesów zapisuje tego samego nadawcę
+        self._connection().execute(
+            "INSERT INTO replies (sender, replied_at) VALUES (?, ?) "
+            "ON CONFLICT(sender) DO UPDATE SET replied_at = MAX(replied_at, excluded.replied_at)",
+            (sender, replied_at)
+        )
+
+    def claim(self, sender: str, now: Optional[float] = None) -> bool:
+        """
+        Rezerwuje odpowiedź do nadawcy, jeśli nie jest w okresie cooldown.
+
+        Sprawdzenie i zapis są jednym poleceniem, więc z kilku procesów odpowiadających
+        temu samemu nadawcy rezerwację dostaje tylko jeden.
+
+        Args:
+            sender: Adres nadawcy
+            now: Czas odpowiedzi (domyślnie teraz)
+
+        Returns:
+            True, jeśli odpowiedź zarezerwowano; False, jeśli nadawca jest w okresie cooldown
+        """
+        now = time.time() if now is None else now
+        cursor = self._connection().execute(
+            "INSERT INTO replies (sender, replied_at) VALUES (?, ?) "
+            "ON CONFLICT(sender) DO UPDATE SET replied_at = excluded.replied_at "
+            "WHERE replied_at <= excluded.replied_at - ?",
+            (sender, now, self.cooldown_seconds)
+        )
+        return cursor.rowcount > 0
+
+    def release(self, sender: str, replied_at: float):
+        """
+        Zwalnia rezerwację z claim(), np. gdy wysyłka odpowiedzi się nie powiodła.
+
+        Args:
+            sender: Adres nadawcy
+            replied_at: Czas przekazany do claim()
+        """
+        self._connection().execute("DELETE FROM replies WHERE sender = ? AND replied_at = ?",
+                                   (sender, replied_at))
+
+    def last_reply(self, sender: str) -> Optional[float]:
+        """
+        Zwraca czas ostatniej odpowiedzi do nadawcy.
+
+        Args:
+            sender: Adres nadawcy
+
+        Returns:
+            Czas odpowiedzi (epoch) lub None
+        """
+        row = self._connection().execute("SELECT replied_at FROM replies WHERE sender = ?",
+                                         (sender,)).fetchone()
+        return row[0] if row else None
+
+    def in_cooldown(self, sender: str, now: Optional[float] = None) -> bool:
+        """
+        Sprawdza, czy nadawca jest w okresie cooldown.
+
+        Args:
+            sender: Adres nadawcy
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            True, jeśli odpowiedziano mu w ciągu ostatnich cooldown_seconds
+        """
+        last = self.last_reply(sender)
+        now = time.time() if now is None else now
+        return last is not None and now - last < self.cooldown_seconds
+
+    def active(self, now: Optional[float] = None) -> Dict[str, float]:
+        """
+        Zwraca wpisy, które są jeszcze w okresie cooldown.
+
+        Args:
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            Słownik nadawca -> czas odpowiedzi
+        """
+        now = time.time() if now is None else now
+        rows = self._connection().execute("SELECT sender, replied_at FROM replies WHERE replied_at > ?",
+                                          (now - self.cooldown_seconds,))
+        return dict(rows.fetchall())
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Usuwa wpisy, których okres cooldown minął.
+
+        Args:
+            now: Bieżący czas (domyślnie teraz)
+
+        Returns:
+            Liczba usuniętych wpisów
+        """
+        now = time.time() if now is None else now
+        cursor = self._connection().execute("DELETE FROM replies WHERE replied_at <= ?",
+                                            (now - self.cooldown_seconds,))
+        return cursor.rowcount
+
+    def import_json(self, json_file: Union[str, Path]) -> int:
+        """
+        Przenosi historię z dawnego pliku replied_to.json (email -> czas ISO).
+
+        Wczytywane są tylko wpisy w okresie cooldown; plik jest potem zmieniany na *.migrated.
+
+        Args:
+            json_file: Ścieżka do pliku JSON
+
+        Returns:
+            Liczba przeniesionych wpisów
+        """
+        json_file = Path(json_file)
+        if not json_file.exists():
+            return 0
+
+        with open(json_file, "r") as f:
+            entries = json.load(f)
+
+        threshold = time.time() - self.cooldown_seconds
+        imported = 0
+        for sender, replied_at in entries.items():
+            try:
+                timestamp = datetime.fromisoformat(replied_at).timestamp()
+            except (TypeError, ValueError):
+                continue
+            if timestamp > threshold:
+                self.record(sender, timestamp)
+                imported += 1
+
+        json_file.rename(json_file.with_name(json_file.name + ".migrated"))
+        logger.info(f"Przeniesiono {imported} wpisów historii odpowiedzi z {json_file}")
+        return imported
+
+    def close(self):
+        """Zatrzymuje kompaktowanie i zamyka połączenie bieżącego wątku."""
+        self._stop.set()
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _compact_loop(self):
+        while not self._stop.wait(self.compact_interval):
+            try:
+                removed = self.compact()
+                if removed:
+                    logger.debug(f"Usunięto {removed} wygasłych wpisów historii odpowiedzi")
+            except Exception as e:
+                logger.error(f"Błąd kompaktowania historii odpowiedzi: {str(e)}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Zwraca połączenie bieżącego wątku."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
@@ -4,6 +4,8 @@ This package contains modular tasks for email processing.
 """
 
 from tasks.fetch_emails import fetch_emails
+from tasks.group_threads import group_threads
+from tasks.deduplicate_emails import deduplicate_emails
 from tasks.classify_emails import classify_emails, analyze_email_sentiment
 from tasks.process_emails import (
     process_urgent_emails,
@@ -16,6 +18,8 @@ from tasks.send_emails import send_responses, send_email, send_bulk_emails
 
 __all__ = [
     'fetch_emails',
+    'group_threads',
+    'deduplicate_emails',
     'classify_emails',
     'analyze_email_sentiment',
     'process_urgent_emails',
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Asynchronous SMTP delivery for Taskinity.
+This module provides an asyncio SMTP client and connection pool, so that one process
+can keep many deliveries in flight, and a background event loop that lets the
+synchronous send functions use it.
+"""
+import asyncio
+import atexit
+import base64
+import concurrent.futures
+import smtplib
+import ssl
+import threading
+from typing import Awaitable, Dict, List, Optional, Sequence, Tuple, TypeVar, Union
+
+from tasks.smtp_pool import SMTPDeliveryUncertain, _data_block, _encode_message
+
+T = TypeVar("T")
+
+class AsyncSMTPConnection:
+    """Single SMTP session on asyncio streams."""
+
+    def __init__(self, server: str, port: int = 587, username: str = "", password: str = "",
+                 use_tls: bool = True, use_ssl: bool = False, timeout: float = 30.0):
+        """
+        Initialize the session. Call connect() before sending.
+
+        Args:
+            server: SMTP server address
+            port: SMTP server port
+            username: SMTP username (no AUTH if empty)
+            password: SMTP password
+            use_tls: Run STARTTLS after connecting
+            use_ssl: Connect with implicit TLS (port 465)
+            timeout: Timeout of every network operation in seconds
+        """
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+
+        self.extensions: Dict[str, str] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self):
+        """Open, secure and authenticate the session."""
+        context = ssl.create_default_context() if self.use_tls or self.use_ssl else None
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.server, self.port, ssl=context if self.use_ssl else None),
+            self.timeout
+        )
+        try:
+            code, message = await self._read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, message)
+
+            await self._ehlo()
+            if self.use_tls and not self.use_ssl:
+                code, message = await self.command("STARTTLS")
+                if code != 220:
+                    raise smtplib.SMTPNotSupportedError(f"STARTTLS failed: {code} {message!r}")
+                await asyncio.wait_for(self._writer.start_tls(context, server_hostname=self.server),
+                                       self.timeout)
+                await self._ehlo()
+
+            if self.username:
+                token = base64.b64encode(f"\0{self.username}\0{self.password}".encode("utf-8")).decode("ascii")
+                code, message = await self.command(f"AUTH PLAIN {token}")
+                if code != 235:
+                    raise smtplib.SMTPAuthenticationError(code, message)
+        except BaseException:
+            await self.close()
+            raise
+
+    async def command(self, line: str) -> Tuple[int, bytes]:
+        """
+        Send a command and read its reply.
+
+        Args:
+            line: Command line without CRLF
+
+        Returns:
+            Reply code and message
+        """
+        self._write(line.encode("ascii") + b"\r\n")
+        await self._drain()
+        return await self._read_reply()
+
+    async def sendmail(self, from_addr: str, to_addrs: Sequence[str], msg) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send a message. MAIL, RCPT and DATA are pipelined when the server supports it.
+
+        Errors are raised as by smtplib.SMTP.sendmail.
+
+        Args:
+            from_addr: Envelope sender
+            to_addrs: Envelope recipients
+            msg: Message as str or bytes
+
+        Returns:
+            Refused recipients mapped to (code, message)
+        """
+        msg = _encode_message(msg)
+        to_addrs = list(to_addrs)
+        commands = [f"MAIL FROM:{smtplib.quoteaddr(from_addr)}"]
+        commands += [f"RCPT TO:{smtplib.quoteaddr(addr)}" for addr in to_addrs]
+        commands.append("DATA")
+
+        if "pipelining" in self.extensions:
+            self._write("".join(command + "\r\n" for command in commands).encode("ascii"))
+            await self._drain()
+            mail_reply = await self._read_reply()
+            rcpt_replies = [await self._read_reply() for _ in to_addrs]
+            data_reply = await self._read_reply()
+        else:
+            mail_reply, rcpt_replies, data_reply = await self.command(commands[0]), [], (503, b"Not sent")
+            if mail_reply[0] == 250:
+                rcpt_replies = [await self.command(command) for command in commands[1:-1]]
+                if any(reply[0] in (250, 251) for reply in rcpt_replies):
+                    data_reply = await self.command("DATA")
+
+        refused = {addr: reply for addr, reply in zip(to_addrs, rcpt_replies) if reply[0] not in (250, 251)}
+
+        if data_reply[0] == 354 and (mail_reply[0] != 250 or len(refused) == len(to_addrs)):
+            # Server accepted DATA without a valid envelope: end it with an empty message
+            self._write(b".\r\n")
+            await self._drain()
+            await self._read_reply()
+            data_reply = (None, b"")
+
+        if mail_reply[0] != 250:
+            await self.command("RSET")
+            raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+        if len(refused) == len(to_addrs):
+            await self.command("RSET")
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if data_reply[0] != 354:
+            await self.command("RSET")
+            raise smtplib.SMTPDataError(*data_reply)
+
+        # Past this point the server may accept the message even if the session drops
+        try:
+            self._write(_data_block(msg))
+            await self._drain()
+            code, message = await self._read_reply()
+        except smtplib.SMTPServerDisconnected as e:
+            raise SMTPDeliveryUncertain(f"Connection lost after the message data was sent: {e}") from e
+        if code != 250:
+            await self.command("RSET")
+            raise smtplib.SMTPDataError(code, message)
+        return refused
+
+    async def close(self):
+        """Send QUIT and close the connection, ignoring errors."""
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        try:
+            writer.write(b"QUIT\r\n")
+            await asyncio.wait_for(writer.drain(), self.timeout)
+        except Exception:
+            pass
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    def abort(self):
+        """Close the connection without QUIT (e.g. when a send is cancelled mid-transaction)."""
+        if self._writer is not None:
+            writer, self._writer = self._writer, None
+            writer.close()
+
+    async def _ehlo(self):
+        """Send EHLO and remember the advertised extensions."""
+        code, message = await self.command("EHLO localhost")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, message)
+        self.extensions = {}
+        for line in message.decode("latin-1").splitlines()[1:]:
+            name, _, params = line.partition(" ")
+            self.extensions[name.lower()] = params
+
+    def _write(self, data: bytes):
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("Connection closed")
+        self._writer.write(data)
+
+    async def _drain(self):
+        try:
+            await asyncio.wait_for(self._writer.drain(), self.timeout)
+        except (ConnectionError, OSError) as e:
+            raise smtplib.SMTPServerDisconnected(str(e))
+
+    async def _read_reply(self) -> Tuple[int, bytes]:
+        """Read a possibly multi-line reply."""
+        lines: List[bytes] = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except (ConnectionError, OSError) as e:
+                raise smtplib.SMTPServerDisconnected(str(e))
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            lines.append(line[4:].rstrip(b"\r\n"))
+            if line[3:4] != b"-":
+                try:
+                    return int(line[:3]), b"\n".join(lines)
+                except ValueError:
+                    raise smtplib.SMTPResponseException(-1, line)
+
+class AsyncSMTPPool:
+    """Pool of asynchronous SMTP sessions to a single relay."""
+
+    def __init__(self, server: str, port: int = 587, username: str = "", password: str = "",
+                 use_tls: bool = True, use_ssl: bool = False, max_size: int = 16,
+                 timeout: float = 30.0):
+        """
+        Initialize the pool. Sessions are opened lazily.
+
+        Args:
+            server: SMTP server address
+            port: SMTP server port
+            username: SMTP username
+            password: SMTP password
+            use_tls: Run STARTTLS after connecting
+            use_ssl: Connect with implicit TLS (port 465)
+            max_size: Maximum number of open sessions; sends wait beyond that
+            timeout: Timeout of every network operation in seconds
+        """
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self._idle: List[AsyncSMTPConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.created = 0
+        self.reused = 0
+
+    async def sendmail(self, from_addr: str, to_addrs: Sequence[str], msg) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send a message over a pooled session.
+
+        A session dropped by the server before the message data was sent is replaced and
+        the message is sent once more; a drop after that raises SMTPDeliveryUncertain.
+
+        Args:
+            from_addr: Envelope sender
+            to_addrs: Envelope recipients
+            msg: Message as str or bytes
+
+        Returns:
+            Refused recipients mapped to (code, message)
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+
+        async with self._slots:
+            for attempt in range(2):
+                session = await self._checkout()
+                try:
+                    refused = await session.sendmail(from_addr, to_addrs, msg)
+                except smtplib.SMTPServerDisconnected:
+                    await session.close()
+                    if attempt:
+                        raise
+                    continue
+                except SMTPDeliveryUncertain:
+                    await session.close()
+                    raise
+                except asyncio.CancelledError:
+                    # The transaction state is unknown, so the session cannot be reused
+                    session.abort()
+                    raise
+                except BaseException:
+                    await self._checkin(session)
+                    raise
+                await self._checkin(session)
+                return refused
+
+    async def close(self):
+        """Close all idle sessions."""
+        idle, self._idle = self._idle, []
+        for session in idle:
+            await session.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get pool statistics.
+
+        Returns:
+            Dictionary with the number of idle, created and reused sessions
+        """
+        return {"idle": len(self._idle), "created": self.created, "reused": self.reused}
+
+    async def _checkout(self) -> AsyncSMTPConnection:
+        if self._idle:
+            self.reused += 1
+            return self._idle.pop()
+
+        session = AsyncSMTPConnection(self.server, self.port, self.username, self.password,
+                                      self.use_tls, self.use_ssl, self.timeout)
+        await session.connect()
+        self.created += 1
+        return session
+
+    async def _checkin(self, session: AsyncSMTPConnection):
+        try:
+            code, _ = await session.command("RSET")
+        except Exception:
+            code = None
+        if code == 250:
+            self._idle.append(session)
+        else:
+            await session.close()
+
+# Event loop shared by the synchronous wrappers, running in a daemon thread
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+# Pools bound to the shared loop: (server, port, username, use_tls, use_ssl) -> pool
+_pools: Dict[Tuple[str, int, str, bool, bool], AsyncSMTPPool] = {}
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Get the background event loop used for synchronous calls, starting it on first use.
+
+    Returns:
+        Running event loop
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="smtp-asyncio", daemon=True).start()
+        return _loop
+
+def run_sync(coroutine: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine on the background event loop and wait for its result.
+
+    Args:
+        coroutine: Coroutine to run
+        timeout: Maximum time to wait in seconds
+
+    Returns:
+        Result of the coroutine
+
+    Raises:
+        TimeoutError: If the coroutine did not finish in time; it is cancelled
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        # Stop the coroutine so it does not keep holding a pooled session
+        future.cancel()
+        raise
+
+def run_all(coroutines: Sequence[Awaitable[T]]) -> List[Union[T, BaseException]]:
+    """
+    Run coroutines concurrently on the background event loop and wait for all of them.
+
+    Args:
+        coroutines: Coroutines to run
+
+    Returns:
+        Result of every coroutine, or the exception it raised, in the same order
+    """
+    async def gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    return run_sync(gather())
+
+def get_async_smtp_pool(server: str, port: int = 587, username: str = "", password: str = "",
+                        use_tls: bool = True, use_ssl: bool = False,
+                        max_size: int = 16) -> AsyncSMTPPool:
+    """
+    Get the shared asynchronous pool for a relay and account, creating it on first use.
+
+    The pool belongs to the background event loop; use it through run_sync() from
+    synchronous code.
+
+    Args:
+        server: SMTP server address
+        port: SMTP server port
+        username: SMTP username
+        password: SMTP password
+        use_tls: Run STARTTLS after connecting
+        use_ssl: Connect with implicit TLS (port 465)
+        max_size: Maximum number of open sessions (used when the pool is created)
+
+    Returns:
+        Shared AsyncSMTPPool
+    """
+    key = (server, port, username, use_tls, use_ssl)
+    with _loop_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = AsyncSMTPPool(server, port, username, password, use_tls, use_ssl, max_size)
+        return pool
+
+def send_message(server: str, port: int, from_addr: str, to_addrs: Sequence[str], msg,
+                 username: str = "", password: str = "", use_tls: bool = True,
+                 use_ssl: bool = False, max_size: int = 16,
+                 timeout: Optional[float] = None) -> Dict[str, Tuple[int, bytes]]:
+    """
+    Send a message through the shared asynchronous pool and wait for the result.
+
+    Args:
+        server: SMTP server address
+        port: SMTP server port
+        from_addr: Envelope sender
+        to_addrs: Envelope recipients
+        msg: Message as str or bytes
+        username: SMTP username
+        password: SMTP password
+        use_tls: Run STARTTLS after connecting
+        use_ssl: Connect with implicit TLS (port 465)
+        max_size: Maximum number of open sessions (used when the pool is created)
+        timeout: Maximum time to wait in seconds
+
+    Returns:
+        Refused recipients mapped to (code, message)
+    """
+    pool = get_async_smtp_pool(server, port, username, password, use_tls, use_ssl, max_size)
+    return run_sync(pool.sendmail(from_addr, to_addrs, msg), timeout)
+
+@atexit.register
+def close_all_pools():
+    """Close the idle sessions of every shared pool."""
+    if _loop is None or not _loop.is_running():
+        return
+    with _loop_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        try:
+            run_sync(pool.close(), timeout=5)
+        except Exception:
+            pass
@@ -9,11 +9,17 @@ from typing import Any, Dict, List, Tuple
 # Import Taskinity core functionality
 from taskinity.core.taskinity_core import task
 
+from tasks.deduplicate_emails import email_key
+from tasks.extract_fields import extract_fields
+
 @task(name="Classify Emails", description="Classifies emails into different categories")
 def classify_emails(emails: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """
     Classifies emails into different categories.
     
+    A near-duplicate (marked with "duplicate_of" by deduplicate_emails) whose
+    representative is in the same batch reuses the representative's categories.
+    
     Args:
         emails: List of email data dictionaries
     
@@ -29,30 +35,29 @@ def classify_emails(emails: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, An
     orders = []
     regular = []
     
+    buckets = {
+        "urgent": urgent,
+        "attachments": with_attachments,
+        "support": support,
+        "order": orders,
+        "regular": regular
+    }
+    
+    # Categories by email_key, for near-duplicates of emails in the same batch
+    classified: Dict[Any, List[str]] = {}
+    
     # Classify each email
     for email in emails:
-        # Check if urgent
-        if email.get("urgent", False):
-            urgent.append(email)
+        representative = email.get("duplicate_of")
+        if "categories" not in email and representative in classified:
+            email["categories"] = list(classified[representative])
         
-        # Check if has attachments
-        if email.get("has_attachments", False) or email.get("attachments", []):
-            with_attachments.append(email)
-        
-        # Check if support request
-        if _is_support_request(email):
-            support.append(email)
-        
-        # Check if order related
-        if _is_order_related(email):
-            orders.append(email)
-        
-        # If not in any other category, add to regular
-        if not (email.get("urgent", False) or 
-                email.get("has_attachments", False) or 
-                _is_support_request(email) or 
-                _is_order_related(email)):
-            regular.append(email)
+        categories = classify_email(email)
+        key = email_key(email)
+        if key is not None:
+            classified.setdefault(key, categories)
+        for category in categories:
+            buckets[category].append(email)
     
     return {
         "urgent_emails": urgent,
@@ -62,6 +67,63 @@ def classify_emails(emails: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, An
         "regular_emails": regular
     }
 
+def classify_email(email: Dict[str, Any]) -> List[str]:
+    """
+    Classifies a single email.
+    
+    Structured fields are extracted first, so that every later stage can reuse them.
+    The categories are stored in email["categories"]; categories already attached
+    (e.g. reused from a near-duplicate) are returned as they are.
+    
+    Args:
+        email: Email data dictionary
+    
+    Returns:
+        List of category keys
+    """
+    extract_fields(email)
+    
+    categories = email.get("categories")
+    if categories is None:
+        categories = _categorize(email)
+        email["categories"] = categories
+    
+    return categories
+
+def _categorize(email: Dict[str, Any]) -> List[str]:
+    """
+    Determine the categories of an email.
+    
+    Args:
+        email: Email data dictionary
+    
+    Returns:
+        List of category keys ("urgent", "attachments", "support", "order" or "regular")
+    """
+    categories = []
+    
+    # Check if urgent
+    if email.get("urgent", False):
+        categories.append("urgent")
+    
+    # Check if has attachments
+    if email.get("has_attachments", False) or email.get("attachments", []):
+        categories.append("attachments")
+    
+    # Check if support request
+    if _is_support_request(email):
+        categories.append("support")
+    
+    # Check if order related
+    if _is_order_related(email):
+        categories.append("order")
+    
+    # If not in any other category, add to regular
+    if not categories:
+        categories.append("regular")
+    
+    return categories
+
 def _is_support_request(email: Dict[str, Any]) -> bool:
     """
     Determine if an email is a support request.
@@ -128,9 +190,10 @@ def _is_order_related(email: Dict[str, Any]) -> bool:
         if keyword in body_preview:
             return True
     
-    # Check for order number pattern (e.g., #12345)
-    order_pattern = r'#\d{4,}'
-    if re.search(order_pattern, subject) or re.search(order_pattern, body_preview):
+    # Check for an order number (e.g., #12345) starting in the subject or the body
+    # preview, as found by the field extraction pass (also inside "Ticket #12345")
+    offset = extract_fields(email)["order_number_offset"]
+    if offset is not None and offset <= len(subject) + 200:
         return True
     
     return False
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection functionality for Taskinity.
+This module provides a task that detects bursts of nearly identical emails
+(campaign spam, form-generated mail) using SimHash signatures and an LSH index.
+"""
+import re
+import time
+import hashlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Import Taskinity core functionality
+from taskinity.core.taskinity_core import task
+
+SIGNATURE_BITS = 64
+# Eight 8-bit bands: by the pigeonhole principle two signatures that differ
+# in at most 7 bits always share at least one band exactly
+LSH_BANDS = 8
+MAX_HAMMING_DISTANCE = 7
+# Texts shorter than this produce unstable signatures and are never matched
+MIN_TOKENS = 8
+MAX_TEXT_LENGTH = 4000
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_BAND_BITS = SIGNATURE_BITS // LSH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+class NearDuplicateIndex:
+    """LSH index of SimHash signatures over a sliding time window."""
+
+    def __init__(self, window_seconds: float = 3600.0):
+        """
+        Initialize the index.
+
+        Args:
+            window_seconds: How long a processed cluster stays matchable
+        """
+        self.window_seconds = window_seconds
+        self._buckets: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        self._entries: Deque[Dict[str, Any]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, signature: int, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find a live cluster whose signature is close to the given one.
+
+        Args:
+            signature: SimHash signature
+            now: Current time (default: time.time())
+
+        Returns:
+            The matching cluster dictionary, or None
+        """
+        self._expire(time.time() if now is None else now)
+        for band_key in _band_keys(signature):
+            for cluster in self._buckets.get(band_key, ()):
+                if bin(cluster["signature"] ^ signature).count("1") <= MAX_HAMMING_DISTANCE:
+                    return cluster
+        return None
+
+    def add(self, signature: int, email: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Register a new cluster with the given email as its representative.
+
+        Args:
+            signature: SimHash signature
+            email: Representative email data dictionary
+            now: Current time (default: time.time())
+
+        Returns:
+            The new cluster dictionary
+        """
+        cluster = {
+            "signature": signature,
+            "representative": email,
+            "created": time.time() if now is None else now,
+            "count": 1
+        }
+        self._entries.append(cluster)
+        for band_key in _band_keys(signature):
+            self._buckets.setdefault(band_key, []).append(cluster)
+        return cluster
+
+    def _expire(self, now: float):
+        """Drop clusters that have left the time window."""
+        while self._entries and now - self._entries[0]["created"] > self.window_seconds:
+            cluster = self._entries.popleft()
+            for band_key in _band_keys(cluster["signature"]):
+                bucket = self._buckets.get(band_key)
+                if bucket:
+                    # By identity: another cluster may have an equal representative
+                    bucket[:] = [other for other in bucket if other is not cluster]
+                    if not bucket:
+                        del self._buckets[band_key]
+
+# Index shared by consecutive flow runs in the same process
+_default_index = NearDuplicateIndex()
+
+@task(name="Deduplicate Emails", description="Detects near-duplicate emails in bursts")
+def deduplicate_emails(emails: List[Dict[str, Any]], suppress: bool = False,
+                       index: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+    """
+    Detects near-duplicate emails against recently processed clusters.
+
+    A duplicate is marked with "duplicate_of" (the email_key of the cluster representative).
+    If the representative has already been classified, its "categories" are copied
+    so that classification is not repeated; otherwise classify_emails copies them
+    once it has classified the representative in the same batch.
+
+    Args:
+        emails: List of email data dictionaries
+        suppress: Drop duplicates instead of passing them on with reused classification
+        index: Near-duplicate index (default: index shared across runs)
+
+    Returns:
+        List of emails to process further
+    """
+    print(f"Checking {len(emails)} emails for near-duplicates")
+
+    unique = []
+    duplicate_count = 0
+    for email in emails:
+        if check_duplicate(email, index):
+            duplicate_count += 1
+            if suppress:
+                continue
+        unique.append(email)
+
+    print(f"Found {duplicate_count} near-duplicate emails"
+          f"{' (suppressed)' if suppress and duplicate_count else ''}")
+    return unique
+
+def check_duplicate(email: Dict[str, Any], index: Optional[NearDuplicateIndex] = None) -> bool:
+    """
+    Check a single email against recently processed clusters.
+
+    A new email starts a cluster. A near-duplicate is marked with "duplicate_of" and,
+    if the cluster representative has already been classified, gets its "categories".
+
+    Args:
+        email: Email data dictionary
+        index: Near-duplicate index (default: index shared across runs)
+
+    Returns:
+        True if the email is a near-duplicate, False otherwise
+    """
+    if index is None:
+        index = _default_index
+
+    signature = simhash(f"{email.get('subject', '')}\n{email.get('body', '')}")
+    if signature is None:
+        return False
+
+    cluster = index.lookup(signature)
+    if cluster is None:
+        index.add(signature, email)
+        return False
+
+    cluster["count"] += 1
+    representative = cluster["representative"]
+    email["duplicate_of"] = email_key(representative)
+    if "categories" in representative:
+        email["categories"] = list(representative["categories"])
+    return True
+
+def email_key(email: Dict[str, Any]) -> Any:
+    """
+    Identify an email across flow runs.
+
+    IMAP sequence ids are reused by later runs, so the Message-ID is preferred;
+    the id is used only for emails without one.
+
+    Args:
+        email: Email data dictionary
+
+    Returns:
+        Message-ID, or the email id if there is none
+    """
+    return email.get("message_id") or email.get("id")
+
+def simhash(text: str) -> Optional[int]:
+    """
+    Compute the 64-bit SimHash signature of a text over word 3-shingles.
+
+    Args:
+        text: Text to sign (only the first MAX_TEXT_LENGTH characters are used)
+
+    Returns:
+        Signature as an integer, or None if the text is too short to sign
+    """
+    tokens = _TOKEN_RE.findall(text[:MAX_TEXT_LENGTH].lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+
+    weights = [0] * SIGNATURE_BITS
+    for i in range(len(tokens) - 2):
+        shingle = " ".join(tokens[i:i + 3]).encode("utf-8")
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big")
+        for bit in range(SIGNATURE_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    signature = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            signature |= 1 << bit
+    return signature
+
+def _band_keys(signature: int) -> List[Tuple[int, int]]:
+    """Split a signature into its LSH band keys."""
+    return [(band, signature >> (band * _BAND_BITS) & _BAND_MASK) for band in range(LSH_BANDS)]
+
+if __name__ == "__main__":
+    # Example usage
+    from fetch_emails import _get_mock_emails
+
+    # Get the mock batch twice to simulate a burst
+    emails = _get_mock_emails() + _get_mock_emails()
+
+    # Detect near-duplicates
+    unique = deduplicate_emails(emails, suppress=True)
+
+    # Print results
+    print(f"\n{len(unique)} of {len(emails)} emails left after deduplication")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Structured field extraction for Taskinity.
+This module extracts order numbers, ticket IDs and similar fields from an email
+in a single compiled pass and stores them on the email record for later stages.
+"""
+import re
+from typing import Any, Dict, Optional
+
+# Only the beginning of the body is scanned
+MAX_BODY_SCAN = 2000
+
+# Field patterns in priority order: when several patterns for the same field match,
+# the earliest pattern in this list wins (then the earliest position in the text)
+_FIELD_PATTERNS = [
+    ("order_number", r'order\s*#\s*(?P<g0>\d+)'),
+    ("order_number", r'order\s*number\s*[:#]\s*(?P<g1>\d+)'),
+    ("order_number", r'order\s*id\s*[:#]\s*(?P<g2>\d+)'),
+    ("ticket_id", r'\b(?P<g3>SUP-\d+-[\w-]+)'),
+    ("ticket_id", r'ticket\s*(?:number|no\.?|nr)?\s*[:#]?\s*(?P<g4>\d{3,})'),
+    ("invoice_number", r'(?:invoice|faktura)\s*(?:number|no\.?|nr)?\s*[:#]?\s*(?P<g5>[A-Z]*\d[\w/-]*)'),
+    ("order_number", r'#(?P<g6>\d{4,})'),
+    ("order_number", r'zamówienie\s*nr\s*(?P<g7>\d+)'),
+]
+
+# The alternation sits in a lookahead, so a match does not consume the text and every
+# position is tried: "#12345" in "Ticket #12345" is still found as an order number
+_FIELDS_RE = re.compile("(?=" + "|".join(pattern for _, pattern in _FIELD_PATTERNS) + ")", re.IGNORECASE)
+_GROUPS = {f"g{rank}": (field, rank) for rank, (field, _) in enumerate(_FIELD_PATTERNS)}
+FIELD_NAMES = tuple(dict.fromkeys(field for field, _ in _FIELD_PATTERNS))
+
+def extract_fields(email: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Extract structured fields from an email.
+
+    The subject and the first MAX_BODY_SCAN characters of the body are scanned once.
+    The result is stored in email["fields"] and reused on later calls.
+
+    Args:
+        email: Email data dictionary
+
+    Returns:
+        Dictionary with "order_number" (e.g. "#12345"), "ticket_id" and
+        "invoice_number"; missing fields are None. "order_number_offset" is the
+        position of the first order number match in "<subject>\n<body>", also when
+        the order number itself is taken from a later, higher-priority match
+    """
+    fields = email.get("fields")
+    if fields is not None:
+        return fields
+
+    text = f"{email.get('subject', '')}\n{email.get('body', '')[:MAX_BODY_SCAN]}"
+
+    best: Dict[str, int] = {}
+    fields = dict.fromkeys(FIELD_NAMES)
+    fields["order_number_offset"] = None
+    for match in _FIELDS_RE.finditer(text):
+        field, rank = _GROUPS[match.lastgroup]
+        if field == "order_number" and fields["order_number_offset"] is None:
+            fields["order_number_offset"] = match.start()
+        if field not in best or rank < best[field]:
+            best[field] = rank
+            fields[field] = match.group(match.lastgroup)
+
+    if fields["order_number"]:
+        fields["order_number"] = f"#{fields['order_number']}"
+
+    email["fields"] = fields
+    return fields
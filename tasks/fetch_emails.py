@@ -8,7 +8,7 @@ import time
 import imaplib
 import email
 from email.header import decode_header
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -40,94 +40,133 @@ def fetch_emails(server: str, username: str, password: str, folder: str = "INBOX
         return _get_mock_emails()
     
     try:
-        # Connect to the IMAP server
-        mail = imaplib.IMAP4_SSL(server)
-        mail.login(username, password)
-        mail.select(folder)
-        
+        return list(iter_emails(server, username, password, folder, limit))
+    
+    except Exception as e:
+        print(f"Error fetching emails: {str(e)}")
+        return _get_mock_emails()  # Fallback to mock data on error
+
+def iter_emails(server: str, username: str, password: str, folder: str = "INBOX", limit: int = 10) -> Iterator[Dict[str, Any]]:
+    """
+    Fetches emails from an IMAP server one at a time.
+    
+    Each email is yielded as soon as it has been fetched and parsed, so that
+    later stages can start on it while the rest of the batch is still being fetched.
+    
+    Args:
+        server: IMAP server address
+        username: Email username
+        password: Email password
+        folder: Folder to fetch emails from (default: INBOX)
+        limit: Maximum number of emails to fetch
+    
+    Yields:
+        Email data dictionaries
+    """
+    # For testing without an actual IMAP server, yield mock data
+    if os.getenv("MOCK_EMAILS", "false").lower() == "true":
+        yield from _get_mock_emails()
+        return
+    
+    # Connect to the IMAP server
+    mail = imaplib.IMAP4_SSL(server)
+    mail.login(username, password)
+    mail.select(folder)
+    
+    try:
         # Search for all emails in the folder
         status, messages = mail.search(None, "ALL")
         if status != "OK":
             print(f"Error searching for emails: {status}")
-            return []
+            return
         
         email_ids = messages[0].split()
         if not email_ids:
             print("No emails found")
-            return []
+            return
         
         # Limit the number of emails to fetch
         if limit > 0:
             email_ids = email_ids[-limit:]
         
-        emails = []
         for email_id in email_ids:
             status, msg_data = mail.fetch(email_id, "(RFC822)")
             if status != "OK":
                 print(f"Error fetching email {email_id}: {status}")
                 continue
             
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
-            
-            # Extract email data
-            subject = _decode_email_header(msg["Subject"])
-            from_addr = _decode_email_header(msg["From"])
-            to_addr = _decode_email_header(msg["To"])
-            date = msg["Date"]
-            
-            # Extract email body
-            body = ""
-            attachments = []
+            yield _parse_email(email_id, msg_data[0][1])
+    
+    finally:
+        # Close the connection
+        mail.close()
+        mail.logout()
+
+def _parse_email(email_id: bytes, raw_email: bytes) -> Dict[str, Any]:
+    """
+    Parse a raw RFC822 message into an email data dictionary.
+    
+    Args:
+        email_id: IMAP message id
+        raw_email: Raw message bytes
+    
+    Returns:
+        Email data dictionary
+    """
+    msg = email.message_from_bytes(raw_email)
+    
+    # Extract email data
+    subject = _decode_email_header(msg["Subject"])
+    from_addr = _decode_email_header(msg["From"])
+    to_addr = _decode_email_header(msg["To"])
+    date = msg["Date"]
+    message_id = msg.get("Message-ID", "")
+    in_reply_to = msg.get("In-Reply-To", "")
+    references = msg.get("References", "")
+    
+    # Extract email body
+    body = ""
+    attachments = []
+    
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition"))
             
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-                    
-                    # Extract text content
-                    if content_type == "text/plain" and "attachment" not in content_disposition:
-                        try:
-                            body = part.get_payload(decode=True).decode()
-                        except:
-                            body = "Unable to decode email body"
-                    
-                    # Track attachments
-                    if "attachment" in content_disposition:
-                        filename = part.get_filename()
-                        if filename:
-                            attachments.append(filename)
-            else:
-                # Not multipart - extract content directly
+            # Extract text content
+            if content_type == "text/plain" and "attachment" not in content_disposition:
                 try:
-                    body = msg.get_payload(decode=True).decode()
+                    body = part.get_payload(decode=True).decode()
                 except:
                     body = "Unable to decode email body"
             
-            # Create email data dictionary
-            email_data = {
-                "id": email_id.decode(),
-                "subject": subject,
-                "from": from_addr,
-                "to": to_addr,
-                "date": date,
-                "body": body,
-                "has_attachments": len(attachments) > 0,
-                "attachments": attachments,
-                "urgent": _is_urgent(subject, body)
-            }
-            
-            emails.append(email_data)
-        
-        # Close the connection
-        mail.close()
-        mail.logout()
-        
-        return emails
+            # Track attachments
+            if "attachment" in content_disposition:
+                filename = part.get_filename()
+                if filename:
+                    attachments.append(filename)
+    else:
+        # Not multipart - extract content directly
+        try:
+            body = msg.get_payload(decode=True).decode()
+        except:
+            body = "Unable to decode email body"
     
-    except Exception as e:
-        print(f"Error fetching emails: {str(e)}")
-        return _get_mock_emails()  # Fallback to mock data on error
+    # Create email data dictionary
+    return {
+        "id": email_id.decode(),
+        "subject": subject,
+        "from": from_addr,
+        "to": to_addr,
+        "date": date,
+        "message_id": message_id,
+        "in_reply_to": in_reply_to,
+        "references": references,
+        "body": body,
+        "has_attachments": len(attachments) > 0,
+        "attachments": attachments,
+        "urgent": _is_urgent(subject, body)
+    }
 
 def _decode_email_header(header):
     """Decode email header."""
@@ -195,6 +234,7 @@ def _get_mock_emails() -> List[Dict[str, Any]]:
     return [
         {
             "id": "1",
+            "message_id": "<mock-1@example.com>",
             "subject": "Important message about your order",
             "from": "support@example.com",
             "to": "user@example.com",
@@ -206,6 +246,7 @@ def _get_mock_emails() -> List[Dict[str, Any]]:
         },
         {
             "id": "2",
+            "message_id": "<mock-2@example.com>",
             "subject": "Monthly newsletter",
             "from": "newsletter@example.com",
             "to": "user@example.com",
@@ -217,6 +258,7 @@ def _get_mock_emails() -> List[Dict[str, Any]]:
         },
         {
             "id": "3",
+            "message_id": "<mock-3@example.com>",
             "subject": "Quarterly report",
             "from": "reports@example.com",
             "to": "user@example.com",
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Email thread grouping functionality for Taskinity.
+This module provides a task that collapses a batch of emails into conversation threads,
+so that every thread is classified and answered only once.
+"""
+import re
+from email.utils import parseaddr, parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+# Import Taskinity core functionality
+from taskinity.core.taskinity_core import task
+
+# Reply/forward prefixes stripped from subjects (English, Polish and German clients)
+_SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fw|fwd|odp|pd|aw|wg)(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+_MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+
+@task(name="Group Email Threads", description="Groups emails into conversation threads")
+def group_threads(emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Groups a batch of emails into conversation threads.
+
+    Emails are linked through their Message-ID, In-Reply-To and References headers.
+    Emails without any header link are joined by normalized subject, but only when
+    they come from the same sender, so that unrelated messages titled "Help" stay apart.
+
+    Args:
+        emails: List of email data dictionaries
+
+    Returns:
+        List with one representative email per thread (the latest message),
+        extended with "thread_size" and "thread_ids"
+    """
+    print(f"Grouping {len(emails)} emails into threads")
+
+    parent = list(range(len(emails)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    # Link every email to the first email that shares one of its thread keys
+    owners: Dict[str, int] = {}
+    for index, email in enumerate(emails):
+        for key in _thread_keys(email):
+            if key in owners:
+                union(index, owners[key])
+            else:
+                owners[key] = index
+
+    # Collect thread members in batch order
+    threads: Dict[int, List[int]] = {}
+    for index in range(len(emails)):
+        threads.setdefault(find(index), []).append(index)
+
+    representatives = []
+    for members in threads.values():
+        latest = max(members, key=lambda i: (_email_timestamp(emails[i]), i))
+        representative = dict(emails[latest])
+        representative["thread_size"] = len(members)
+        representative["thread_ids"] = [emails[i].get("id") for i in members]
+        representatives.append(representative)
+
+    print(f"Grouped {len(emails)} emails into {len(representatives)} threads")
+    return representatives
+
+def normalize_subject(subject: str) -> str:
+    """
+    Normalize an email subject for thread matching.
+
+    Args:
+        subject: Email subject
+
+    Returns:
+        Lowercase subject without reply/forward prefixes and repeated whitespace
+    """
+    subject = _SUBJECT_PREFIX_RE.sub("", subject or "")
+    return " ".join(subject.lower().split())
+
+def _thread_keys(email: Dict[str, Any]) -> List[str]:
+    """
+    Build the keys that link an email to its thread.
+
+    Args:
+        email: Email data dictionary
+
+    Returns:
+        List of thread keys (message ids and, as a fallback, sender and subject)
+    """
+    keys = []
+    for header in ("message_id", "in_reply_to", "references"):
+        keys.extend(f"id:{message_id}" for message_id in _MESSAGE_ID_RE.findall(email.get(header) or ""))
+
+    # Fall back to the subject only when the headers do not link the email anywhere
+    if len(keys) <= 1:
+        subject = normalize_subject(email.get("subject", ""))
+        sender = parseaddr(email.get("from", ""))[1].lower()
+        if subject:
+            keys.append(f"subject:{sender}:{subject}")
+
+    return keys
+
+def _email_timestamp(email: Dict[str, Any]) -> float:
+    """Return the email date as a POSIX timestamp, or 0 if it cannot be parsed."""
+    date: Optional[str] = email.get("date")
+    if not date:
+        return 0.0
+    try:
+        return parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
+
+if __name__ == "__main__":
+    # Example usage
+    from fetch_emails import _get_mock_emails
+
+    # Get mock emails
+    emails = _get_mock_emails()
+
+    # Group emails into threads
+    threads = group_threads(emails)
+
+    # Print results
+    print("\nThread Grouping Results:")
+    for thread in threads:
+        print(f"{thread['subject']}: {thread['thread_size']} message(s)")
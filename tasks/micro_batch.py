@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Micro-batching functionality for Taskinity.
+This module provides a batcher that collects items and hands them to a handler
+when either a size or a time limit is reached, whichever comes first.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+class MicroBatcher:
+    """Collects items into batches flushed by size or age."""
+
+    def __init__(self, handler: Callable[[List[Any]], Any], max_size: int = 10,
+                 max_delay_ms: float = 200.0):
+        """
+        Initialize the batcher and start its flushing thread.
+
+        The handler is always called from the flushing thread, one batch at a time.
+        add() blocks while a full batch is waiting, which gives backpressure to the producer.
+
+        Args:
+            handler: Function called with every flushed batch
+            max_size: Flush when this many items are buffered
+            max_delay_ms: Flush when the oldest buffered item is this old
+        """
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+
+        self.handler = handler
+        self.max_size = max_size
+        self.max_delay = max_delay_ms / 1000.0
+
+        self._buffer: List[Any] = []
+        self._oldest: Optional[float] = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._errors: List[BaseException] = []
+
+        self._batches = 0
+        self._items = 0
+        self._max_batch_size = 0
+        self._flush_reasons = {"size": 0, "time": 0, "close": 0}
+
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, item: Any):
+        """
+        Add an item to the current batch.
+
+        Args:
+            item: Item to batch
+        """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            while len(self._buffer) >= self.max_size:
+                self._condition.wait()
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.append(item)
+            self._condition.notify_all()
+
+    def close(self):
+        """Flush the remaining items, stop the flushing thread and re-raise handler errors."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get batching statistics.
+
+        Returns:
+            Dictionary with batch and item counts, average and maximum batch size,
+            and the number of flushes by reason ("size", "time" or "close")
+        """
+        with self._condition:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch_size,
+                "flush_reasons": dict(self._flush_reasons)
+            }
+
+    def __enter__(self) -> "MicroBatcher":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def _run(self):
+        """Wait for a flush trigger and hand the batch to the handler."""
+        while True:
+            with self._condition:
+                while True:
+                    if len(self._buffer) >= self.max_size:
+                        reason = "size"
+                        break
+                    if self._closed:
+                        reason = "close"
+                        break
+                    if self._buffer:
+                        remaining = self._oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            reason = "time"
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+
+                batch, self._buffer = self._buffer, []
+                self._condition.notify_all()
+
+                if batch:
+                    self._batches += 1
+                    self._items += len(batch)
+                    self._max_batch_size = max(self._max_batch_size, len(batch))
+                    self._flush_reasons[reason] += 1
+
+            if batch:
+                try:
+                    self.handler(batch)
+                except Exception as e:
+                    self._errors.append(e)
+
+            if reason == "close":
+                with self._condition:
+                    if not self._buffer:
+                        return
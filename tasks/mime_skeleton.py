@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Precomputed MIME messages for Taskinity.
+This module serializes the constant headers and body parts of a message once per
+template as bytes and fills in only the per-recipient fields for every message,
+instead of building and serializing an email.mime tree for each recipient.
+"""
+import base64
+import re
+import threading
+import time
+import uuid
+from email.header import Header
+from email.utils import formatdate
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+# Per-recipient placeholders, as used by send_bulk_emails personalization
+_PLACEHOLDER = re.compile(r"\{(name|email|domain)\}")
+_NEWLINE = re.compile(r"\r\n|\r|\n")
+
+# Segments of a template: literal bytes or the name of a per-recipient field
+Segment = Union[bytes, str]
+
+class MessageSkeleton:
+    """Message whose headers and body are serialized once and completed per recipient."""
+
+    def __init__(self, subject: str, body: str, from_email: str,
+                 html_body: Optional[str] = None, reply_to: Optional[str] = None,
+                 cc: Optional[Sequence[str]] = None, headers: Optional[Dict[str, str]] = None,
+                 personalize: bool = True):
+        """
+        Precompute the message.
+
+        With personalize set, subject and bodies may contain the {name}, {email} and
+        {domain} placeholders, which are filled in for every recipient.
+
+        Args:
+            subject: Subject template
+            body: Plain text body template
+            from_email: Sender email address
+            html_body: HTML body template; the message is multipart/alternative only if set
+            reply_to: Reply-to email address
+            cc: CC recipients (shown in the header)
+            headers: Additional constant headers
+            personalize: Fill in the placeholders (otherwise braces are sent as they are)
+        """
+        self.from_email = from_email
+        self._domain = from_email.rsplit("@", 1)[-1] or "localhost"
+        self._subject = _split(subject, personalize)
+
+        constant = [("From", from_email)]
+        if cc:
+            constant.append(("Cc", ", ".join(cc)))
+        if reply_to:
+            constant.append(("Reply-To", reply_to))
+        constant.extend((headers or {}).items())
+        constant.append(("MIME-Version", "1.0"))
+        header_block = b"".join(_header(name, value) for name, value in constant)
+
+        parts = [_Part("plain", body, personalize)]
+        if html_body:
+            parts.append(_Part("html", html_body, personalize))
+
+        if len(parts) == 1:
+            # Single part: the part headers are the message headers, no multipart wrapper
+            self._head = header_block
+            self._parts = parts
+            self._boundary = None
+        else:
+            self._boundary = f"=_{uuid.uuid4().hex}".encode("ascii")
+            self._head = (header_block + b'Content-Type: multipart/alternative; boundary="'
+                          + self._boundary + b'"\r\n')
+            self._parts = parts
+
+    def render(self, to_email: str) -> bytes:
+        """
+        Serialize the message for a recipient.
+
+        Args:
+            to_email: Recipient email address (also used for the placeholders)
+
+        Returns:
+            Complete message with CRLF line endings
+        """
+        fields = _fields(to_email)
+        subject = _join(self._subject, fields).decode("utf-8")
+
+        out = [
+            self._head,
+            _header("To", to_email),
+            _header("Subject", subject),
+            b"Date: " + formatdate(time.time(), localtime=True).encode("ascii") + b"\r\n",
+            b"Message-ID: <" + uuid.uuid4().hex.encode("ascii") + b"@" + self._domain.encode("idna") + b">\r\n"
+        ]
+
+        if self._boundary is None:
+            out.append(self._parts[0].render(fields))
+        else:
+            out.append(b"\r\n")
+            for part in self._parts:
+                out.append(b"--" + self._boundary + b"\r\n")
+                out.append(part.render(fields))
+                out.append(b"\r\n")
+            out.append(b"--" + self._boundary + b"--\r\n")
+
+        return b"".join(out)
+
+class _Part:
+    """Body part with precomputed headers and body segments."""
+
+    def __init__(self, subtype: str, text: str, personalize: bool):
+        self.segments = _split(_NEWLINE.sub("\r\n", text), personalize)
+        literals = b"".join(segment for segment in self.segments if isinstance(segment, bytes))
+
+        # 7bit is only valid for ASCII text with lines of at most 998 octets
+        self.seven_bit = literals.isascii() and all(len(line) <= 998 for line in literals.split(b"\r\n"))
+        content_type = f'Content-Type: text/{subtype}; charset="utf-8"\r\n'.encode("ascii")
+        self.headers_7bit = content_type + b"Content-Transfer-Encoding: 7bit\r\n\r\n"
+        self.headers_base64 = content_type + b"Content-Transfer-Encoding: base64\r\n\r\n"
+
+    def render(self, fields: Dict[str, bytes]) -> bytes:
+        body = _join(self.segments, fields)
+        if self.seven_bit and body.isascii():
+            return self.headers_7bit + body + (b"" if body.endswith(b"\r\n") else b"\r\n")
+        return self.headers_base64 + base64.encodebytes(body).replace(b"\n", b"\r\n")
+
+def _split(template: str, personalize: bool = True) -> List[Segment]:
+    """Split a template into literal bytes and placeholder names."""
+    if not personalize:
+        return [template.encode("utf-8")]
+    segments: List[Segment] = []
+    position = 0
+    for match in _PLACEHOLDER.finditer(template):
+        if match.start() > position:
+            segments.append(template[position:match.start()].encode("utf-8"))
+        segments.append(match.group(1))
+        position = match.end()
+    if position < len(template):
+        segments.append(template[position:].encode("utf-8"))
+    return segments
+
+def _join(segments: List[Segment], fields: Dict[str, bytes]) -> bytes:
+    return b"".join(segment if isinstance(segment, bytes) else fields[segment] for segment in segments)
+
+def _fields(recipient: str) -> Dict[str, bytes]:
+    """Per-recipient field values, matching send_emails._personalize_email."""
+    local, _, domain = recipient.partition("@")
+    name = local.split(".")[0].capitalize()
+    return {"name": name.encode("utf-8"), "email": recipient.encode("utf-8"), "domain": domain.encode("utf-8")}
+
+def _header(name: str, value: str) -> bytes:
+    """Serialize a header, RFC 2047-encoding non-ASCII values."""
+    value = _NEWLINE.sub(" ", value)
+    if value.isascii() and len(name) + len(value) < 996:
+        return f"{name}: {value}\r\n".encode("ascii")
+    encoded = Header(value, "utf-8", header_name=name).encode(linesep="\r\n")
+    return f"{name}: {encoded}\r\n".encode("ascii")
+
+# Skeletons of recent bulk templates: (subject, body, from, html, reply_to, cc) -> skeleton
+_skeletons: Dict[Tuple, MessageSkeleton] = {}
+_skeletons_lock = threading.Lock()
+_MAX_SKELETONS = 256
+
+def get_skeleton(subject: str, body: str, from_email: str, html_body: Optional[str] = None,
+                 reply_to: Optional[str] = None, cc: Optional[Sequence[str]] = None) -> MessageSkeleton:
+    """
+    Get the cached personalized skeleton of a template, building it on first use.
+
+    Args:
+        subject: Subject template
+        body: Plain text body template
+        from_email: Sender email address
+        html_body: HTML body template
+        reply_to: Reply-to email address
+        cc: CC recipients
+
+    Returns:
+        Shared MessageSkeleton
+    """
+    key = (subject, body, from_email, html_body, reply_to, tuple(cc or ()))
+    with _skeletons_lock:
+        skeleton = _skeletons.get(key)
+        if skeleton is None:
+            if len(_skeletons) >= _MAX_SKELETONS:
+                _skeletons.pop(next(iter(_skeletons)))
+            skeleton = _skeletons[key] = MessageSkeleton(subject, body, from_email, html_body, reply_to, cc)
+        return skeleton
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Durable outbound spool for Taskinity.
+This module keeps rendered responses that could not be sent in a local SQLite database
+(WAL mode) and retries them with exponential backoff from a separate drainer, moving
+responses that keep failing, or fail permanently, to a dead-letter state.
+"""
+import json
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tasks.smtp_pool import SMTPDeliveryUncertain
+
+# Default location of the spool database
+DEFAULT_SPOOL_FILE = Path(__file__).resolve().parent.parent / "spool" / "outbound.db"
+
+# Message states
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbound (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    response TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbound_due ON outbound (state, next_attempt);
+"""
+
+class OutboundSpool:
+    """SQLite-backed queue of responses waiting to be sent."""
+
+    def __init__(self, path: Optional[str] = None, max_attempts: int = 8,
+                 base_delay: float = 30.0, max_delay: float = 3600.0, lease: float = 300.0):
+        """
+        Open (and create if needed) the spool database.
+
+        Args:
+            path: Database file (default: OUTBOUND_SPOOL_FILE or spool/outbound.db)
+            max_attempts: Failed attempts after which a response becomes a dead letter
+            base_delay: Delay before the first retry in seconds; doubled on every failure
+            max_delay: Upper bound of the retry delay in seconds
+            lease: Time after which a claimed but unfinished response is retried
+        """
+        self.path = str(path or os.getenv("OUTBOUND_SPOOL_FILE") or DEFAULT_SPOOL_FILE)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript(_SCHEMA)
+
+    def enqueue(self, response: Dict[str, Any], error: Optional[str] = None,
+                delay: Optional[float] = None, permanent: bool = False) -> int:
+        """
+        Add a rendered response to the spool.
+
+        Args:
+            response: Response data dictionary, as passed to _deliver_response
+            error: Reason of the failed send, if any
+            delay: Seconds before the first attempt (default: base_delay if error is set, else 0)
+            permanent: The failure will not go away by retrying; store a dead letter
+
+        Returns:
+            Spool ID of the response
+        """
+        now = time.time()
+        if delay is None:
+            delay = self.base_delay if error else 0.0
+        with self._connection() as db:
+            cursor = db.execute(
+                "INSERT INTO outbound (response, state, attempts, next_attempt, last_error, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (json.dumps(response, default=str), DEAD if permanent else PENDING, 1 if error else 0,
+                 now + delay, error, now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit: int = 20) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        Take due responses for sending.
+
+        Claimed responses are leased; if the drainer dies before marking them,
+        they become due again after the lease expires.
+
+        Args:
+            limit: Maximum number of responses to claim
+
+        Returns:
+            List of (spool ID, response) pairs
+        """
+        now = time.time()
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT id, response FROM outbound WHERE state IN (?, ?) AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?",
+                (PENDING, SENDING, now, limit)
+            ).fetchall()
+            db.executemany(
+                "UPDATE outbound SET state = ?, next_attempt = ?, updated = ? WHERE id = ?",
+                [(SENDING, now + self.lease, now, row[0]) for row in rows]
+            )
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def mark_sent(self, spool_id: int):
+        """
+        Mark a claimed response as sent.
+
+        Args:
+            spool_id: Spool ID of the response
+        """
+        with self._connection() as db:
+            db.execute("UPDATE outbound SET state = ?, last_error = NULL, updated = ? WHERE id = ?",
+                       (SENT, time.time(), spool_id))
+
+    def mark_failed(self, spool_id: int, error: str, permanent: bool = False) -> str:
+        """
+        Record a failed attempt and schedule the next one with exponential backoff.
+
+        Args:
+            spool_id: Spool ID of the response
+            error: Reason of the failure
+            permanent: The failure will not go away by retrying; make it a dead letter now
+
+        Returns:
+            New state of the response ("pending" or "dead")
+        """
+        now = time.time()
+        db = self._connection()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute("SELECT attempts FROM outbound WHERE id = ?", (spool_id,)).fetchone()
+            if row is None:
+                raise KeyError(spool_id)
+            attempts = row[0] + 1
+            state = DEAD if permanent or attempts >= self.max_attempts else PENDING
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            db.execute(
+                "UPDATE outbound SET state = ?, attempts = ?, next_attempt = ?, last_error = ?, updated = ? "
+                "WHERE id = ?",
+                (state, attempts, now + delay, error, now, spool_id)
+            )
+        return state
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Get responses that will no longer be retried.
+
+        Args:
+            limit: Maximum number of entries
+
+        Returns:
+            List of dictionaries with id, response, attempts and last_error
+        """
+        rows = self._connection().execute(
+            "SELECT id, response, attempts, last_error FROM outbound WHERE state = ? ORDER BY id LIMIT ?",
+            (DEAD, limit)
+        ).fetchall()
+        return [{"id": row[0], "response": json.loads(row[1]), "attempts": row[2], "last_error": row[3]}
+                for row in rows]
+
+    def requeue(self, spool_id: int):
+        """
+        Move a dead letter back to the pending state with a fresh attempt counter.
+
+        Args:
+            spool_id: Spool ID of the response
+        """
+        now = time.time()
+        with self._connection() as db:
+            db.execute("UPDATE outbound SET state = ?, attempts = 0, next_attempt = ?, updated = ? "
+                       "WHERE id = ? AND state = ?", (PENDING, now, now, spool_id, DEAD))
+
+    def purge_sent(self, older_than: float = 86400.0) -> int:
+        """
+        Delete sent responses.
+
+        Args:
+            older_than: Minimum age in seconds of the deleted entries
+
+        Returns:
+            Number of deleted entries
+        """
+        with self._connection() as db:
+            cursor = db.execute("DELETE FROM outbound WHERE state = ? AND updated < ?",
+                                (SENT, time.time() - older_than))
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get the number of responses by state.
+
+        Returns:
+            Dictionary with pending, sending, sent and dead counts
+        """
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0}
+        for state, count in self._connection().execute(
+                "SELECT state, COUNT(*) FROM outbound GROUP BY state"):
+            counts[state] = count
+        return counts
+
+    def close(self):
+        """Close the database connection of the calling thread."""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the database connection of the calling thread."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+_spool: Optional[OutboundSpool] = None
+_spool_lock = threading.Lock()
+
+def get_outbound_spool() -> Optional[OutboundSpool]:
+    """
+    Get the spool shared by the process, configured from the environment.
+
+    Returns:
+        Shared OutboundSpool, or None if OUTBOUND_SPOOL is "false"
+    """
+    global _spool
+    if os.getenv("OUTBOUND_SPOOL", "true").lower() != "true":
+        return None
+    with _spool_lock:
+        if _spool is None:
+            _spool = OutboundSpool(
+                max_attempts=int(os.getenv("OUTBOUND_SPOOL_MAX_ATTEMPTS", 8)),
+                base_delay=float(os.getenv("OUTBOUND_SPOOL_RETRY_DELAY", 30))
+            )
+        return _spool
+
+def _describe_error(error: Exception) -> str:
+    """
+    Describe a send error for the outbound spool.
+
+    Args:
+        error: Exception raised while sending
+
+    Returns:
+        Exception type and message, e.g. "SMTPDataError: (451, b'Try again later')"
+    """
+    return f"{type(error).__name__}: {error}"
+
+def is_permanent_failure(error: Exception) -> bool:
+    """
+    Tell whether a send error will not go away by retrying.
+
+    Args:
+        error: Exception raised while sending
+
+    Returns:
+        True for 5xx replies (for SMTPRecipientsRefused: if every recipient got one),
+        a session lost after the message data was sent (it may have been delivered)
+        and errors that are not SMTP or connection errors (e.g. invalid input);
+        False for 4xx replies and connection errors
+    """
+    if isinstance(error, SMTPDeliveryUncertain):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(reply[0] >= 500 for reply in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    if isinstance(code, int) and code > 0:
+        return code >= 500
+    return not isinstance(error, (smtplib.SMTPException, OSError))
+
+def drain_spool(spool: Optional[OutboundSpool] = None,
+                send: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                batch_size: int = 20) -> Dict[str, int]:
+    """
+    Send every response that is due, once.
+
+    Args:
+        spool: Spool to drain (default: the shared spool)
+        send: Function sending a single response; it returns False or raises on failure
+            (default: _deliver_response, which raises the SMTP error)
+        batch_size: Number of responses claimed at a time
+
+    Returns:
+        Dictionary with the number of sent, retried and dead responses
+    """
+    if spool is None:
+        spool = get_outbound_spool() or OutboundSpool()
+    if send is None:
+        from tasks.send_emails import _deliver_response
+        send = _deliver_response
+
+    results = {"sent": 0, "retried": 0, "dead": 0}
+    while True:
+        claimed = spool.claim(batch_size)
+        if not claimed:
+            return results
+
+        for spool_id, response in claimed:
+            permanent = False
+            try:
+                sent = send(response)
+                error = "send failed"
+            except Exception as e:
+                sent, error, permanent = False, _describe_error(e), is_permanent_failure(e)
+
+            if sent:
+                spool.mark_sent(spool_id)
+                results["sent"] += 1
+            elif spool.mark_failed(spool_id, error, permanent) == DEAD:
+                results["dead"] += 1
+            else:
+                results["retried"] += 1
+
+def run_drainer(interval: float = 5.0, spool: Optional[OutboundSpool] = None,
+                send: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                stop: Optional[threading.Event] = None):
+    """
+    Drain the spool periodically until stopped.
+
+    Args:
+        interval: Seconds between drain passes
+        spool: Spool to drain (default: the shared spool)
+        send: Function sending a single response (default: _deliver_response)
+        stop: Event ending the loop (default: run forever)
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        results = drain_spool(spool, send)
+        if any(results.values()):
+            print(f"Outbound spool: {results['sent']} sent, {results['retried']} retried, "
+                  f"{results['dead']} dead")
+        stop.wait(interval)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Drain the outbound response spool")
+    parser.add_argument("--once", action="store_true", help="Drain due responses once and exit")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between drain passes")
+    parser.add_argument("--dead", action="store_true", help="List dead letters and exit")
+    args = parser.parse_args()
+
+    # Same settings (OUTBOUND_SPOOL_*) as the spool the flows write to
+    outbound = get_outbound_spool() or OutboundSpool()
+    if args.dead:
+        for entry in outbound.dead_letters():
+            print(f"{entry['id']}: {entry['response'].get('original_from')} "
+                  f"({entry['attempts']} attempts, {entry['last_error']})")
+    elif args.once:
+        print(drain_spool(outbound))
+        print(outbound.stats())
+    else:
+        print(f"Draining {outbound.path} every {args.interval}s (Ctrl+C to stop)")
+        try:
+            run_drainer(args.interval, outbound)
+        except KeyboardInterrupt:
+            pass
@@ -12,6 +12,9 @@ from dotenv import load_dotenv
 # Import Taskinity core functionality
 from taskinity.core.taskinity_core import task
 
+from tasks.extract_fields import extract_fields
+from tasks.response_templates import get_template
+
 @task(name="Process Urgent Emails", description="Processes urgent emails")
 def process_urgent_emails(urgent_emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
@@ -28,22 +31,7 @@ def process_urgent_emails(urgent_emails: List[Dict[str, Any]]) -> List[Dict[str,
     # Simulate processing time
     time.sleep(0.5)
     
-    responses = []
-    for email in urgent_emails:
-        # Create response
-        response = {
-            "id": email["id"],
-            "original_subject": email["subject"],
-            "original_from": email["from"],
-            "response_subject": f"Re: {email['subject']}",
-            "response_body": _generate_urgent_response(email),
-            "priority": "high",
-            "response_time": "within 1 hour"
-        }
-        
-        responses.append(response)
-    
-    return responses
+    return build_responses("urgent", urgent_emails)
 
 @task(name="Process Emails with Attachments", description="Processes emails with attachments")
 def process_emails_with_attachments(emails_with_attachments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -61,22 +49,7 @@ def process_emails_with_attachments(emails_with_attachments: List[Dict[str, Any]
     # Simulate processing time
     time.sleep(0.7)
     
-    responses = []
-    for email in emails_with_attachments:
-        # Create response
-        response = {
-            "id": email["id"],
-            "original_subject": email["subject"],
-            "original_from": email["from"],
-            "response_subject": f"Re: {email['subject']}",
-            "response_body": _generate_attachment_response(email),
-            "priority": "medium",
-            "response_time": "within 24 hours"
-        }
-        
-        responses.append(response)
-    
-    return responses
+    return build_responses("attachments", emails_with_attachments)
 
 @task(name="Process Support Emails", description="Processes support request emails")
 def process_support_emails(support_emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -94,23 +67,7 @@ def process_support_emails(support_emails: List[Dict[str, Any]]) -> List[Dict[st
     # Simulate processing time
     time.sleep(0.6)
     
-    responses = []
-    for email in support_emails:
-        # Create response
-        response = {
-            "id": email["id"],
-            "original_subject": email["subject"],
-            "original_from": email["from"],
-            "response_subject": f"Re: {email['subject']}",
-            "response_body": _generate_support_response(email),
-            "priority": "medium",
-            "response_time": "within 24 hours",
-            "ticket_number": f"SUP-{int(time.time())}-{email['id']}"
-        }
-        
-        responses.append(response)
-    
-    return responses
+    return build_responses("support", support_emails)
 
 @task(name="Process Order Emails", description="Processes order-related emails")
 def process_order_emails(order_emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -128,23 +85,7 @@ def process_order_emails(order_emails: List[Dict[str, Any]]) -> List[Dict[str, A
     # Simulate processing time
     time.sleep(0.5)
     
-    responses = []
-    for email in order_emails:
-        # Create response
-        response = {
-            "id": email["id"],
-            "original_subject": email["subject"],
-            "original_from": email["from"],
-            "response_subject": f"Re: {email['subject']}",
-            "response_body": _generate_order_response(email),
-            "priority": "medium",
-            "response_time": "within 24 hours",
-            "order_number": _extract_order_number(email)
-        }
-        
-        responses.append(response)
-    
-    return responses
+    return build_responses("order", order_emails)
 
 @task(name="Process Regular Emails", description="Processes regular emails")
 def process_regular_emails(regular_emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -162,95 +103,101 @@ def process_regular_emails(regular_emails: List[Dict[str, Any]]) -> List[Dict[st
     # Simulate processing time
     time.sleep(0.5)
     
+    return build_responses("regular", regular_emails)
+
+# Priority and response time of the response record by category key
+# (see classify_emails.classify_email); the response template has the same name
+RESPONSE_PROFILES = {
+    "urgent": ("high", "within 1 hour"),
+    "attachments": ("medium", "within 24 hours"),
+    "support": ("medium", "within 24 hours"),
+    "order": ("medium", "within 24 hours"),
+    "regular": ("low", "within 48 hours")
+}
+
+# process_* tasks by category key
+PROCESS_TASKS = {
+    "urgent": process_urgent_emails,
+    "attachments": process_emails_with_attachments,
+    "support": process_support_emails,
+    "order": process_order_emails,
+    "regular": process_regular_emails
+}
+
+def build_responses(category: str, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build the response records for a batch of emails of a category.
+    
+    The category template is looked up once and rendered for the whole batch.
+    
+    Args:
+        category: Category key ("urgent", "attachments", "support", "order" or "regular")
+        emails: Email data dictionaries
+    
+    Returns:
+        List of response data dictionaries
+    """
+    values_list = [_response_values(category, email) for email in emails]
+    bodies = get_template(category).render_batch(values_list)
+    priority, response_time = RESPONSE_PROFILES[category]
+    
     responses = []
-    for email in regular_emails:
-        # Create response
+    for email, values, body in zip(emails, values_list, bodies):
         response = {
             "id": email["id"],
             "original_subject": email["subject"],
             "original_from": email["from"],
             "response_subject": f"Re: {email['subject']}",
-            "response_body": _generate_regular_response(email),
-            "priority": "low",
-            "response_time": "within 48 hours"
+            "response_body": body,
+            "priority": priority,
+            "response_time": response_time
         }
-        
+        # Generated numbers are kept on the record as well as in the body
+        for key in ("ticket_number", "order_number"):
+            if key in values:
+                response[key] = values[key]
         responses.append(response)
-    
     return responses
 
-def _generate_urgent_response(email: Dict[str, Any]) -> str:
-    """Generate response for urgent email."""
-    return f"""Dear {_extract_name(email['from'])},
-
-Thank you for your urgent message regarding "{email['subject']}".
-
-We have prioritized your request and our team is working on it immediately. 
-You can expect a detailed response within the next hour.
-
-If you need immediate assistance, please call our urgent support line at +1-555-123-4567.
-
-Best regards,
-The Taskinity Support Team
-"""
-
-def _generate_attachment_response(email: Dict[str, Any]) -> str:
-    """Generate response for email with attachments."""
-    attachments = ", ".join(email.get("attachments", []))
-    return f"""Dear {_extract_name(email['from'])},
-
-Thank you for your email and for sending us the following attachment(s): {attachments}.
-
-We have received your files and they are being processed by our team. 
-We will get back to you within 24 hours with our feedback.
-
-Best regards,
-The Taskinity Support Team
-"""
-
-def _generate_support_response(email: Dict[str, Any]) -> str:
-    """Generate response for support request email."""
-    return f"""Dear {_extract_name(email['from'])},
-
-Thank you for contacting Taskinity Support regarding "{email['subject']}".
-
-We have received your support request and created a ticket for you. Your ticket number is SUP-{int(time.time())}-{email['id']}.
-Our support team will analyze your issue and respond within 24 hours.
-
-For future reference, please include your ticket number in any follow-up communications.
-
-Best regards,
-The Taskinity Support Team
-"""
-
-def _generate_order_response(email: Dict[str, Any]) -> str:
-    """Generate response for order-related email."""
-    order_number = _extract_order_number(email)
-    return f"""Dear {_extract_name(email['from'])},
-
-Thank you for your message regarding your order {order_number}.
-
-We have received your inquiry and our customer service team is reviewing the details.
-We will get back to you with more information within 24 hours.
-
-You can also check the status of your order at any time by visiting our website and entering your order number.
-
-Best regards,
-The Taskinity Customer Service Team
-"""
-
-def _generate_regular_response(email: Dict[str, Any]) -> str:
-    """Generate response for regular email."""
-    return f"""Dear {_extract_name(email['from'])},
-
-Thank you for your email regarding "{email['subject']}".
+def build_response(category: str, email: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the response record for a single email of a category.
+    
+    Args:
+        category: Category key ("urgent", "attachments", "support", "order" or "regular")
+        email: Email data dictionary
+    
+    Returns:
+        Response data dictionary
+    """
+    return build_responses(category, [email])[0]
 
-We have received your message and will respond to your inquiry within 48 hours.
-We appreciate your patience.
+def _response_values(category: str, email: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute the template placeholder values of an email for a category."""
+    if category == "support":
+        return _template_values(email, ticket_number=f"SUP-{int(time.time())}-{email['id']}")
+    if category == "order":
+        return _template_values(email, order_number=_extract_order_number(email))
+    return _template_values(email)
 
-Best regards,
-The Taskinity Team
-"""
+def _template_values(email: Dict[str, Any], **extra: Any) -> Dict[str, Any]:
+    """
+    Compute the template placeholder values for an email.
+    
+    Args:
+        email: Email data dictionary
+        **extra: Additional category-specific values (e.g. ticket_number)
+    
+    Returns:
+        Dictionary of placeholder values
+    """
+    values = {
+        "name": _extract_name(email["from"]),
+        "subject": email["subject"],
+        "attachments": ", ".join(email.get("attachments", []))
+    }
+    values.update(extra)
+    return values
 
 def _extract_name(email_address: str) -> str:
     """Extract name from email address."""
@@ -276,31 +223,9 @@ def _extract_name(email_address: str) -> str:
 
 def _extract_order_number(email: Dict[str, Any]) -> str:
     """Extract order number from email."""
-    import re
-    
-    # Check subject and body for order number pattern
-    subject = email.get("subject", "")
-    body = email.get("body", "")
-    
-    # Look for patterns like "order #12345" or "order number: 12345"
-    patterns = [
-        r'order\s*#\s*(\d+)',
-        r'order\s*number\s*[:#]\s*(\d+)',
-        r'order\s*id\s*[:#]\s*(\d+)',
-        r'#(\d{4,})',
-        r'zamówienie\s*nr\s*(\d+)'
-    ]
-    
-    for pattern in patterns:
-        # Check subject
-        match = re.search(pattern, subject, re.IGNORECASE)
-        if match:
-            return f"#{match.group(1)}"
-        
-        # Check body
-        match = re.search(pattern, body, re.IGNORECASE)
-        if match:
-            return f"#{match.group(1)}"
+    order_number = extract_fields(email)["order_number"]
+    if order_number:
+        return order_number
     
     # If no order number found, generate a placeholder
     return f"#ORDER-{email['id']}"
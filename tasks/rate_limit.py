@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Adaptive outbound rate limiting for Taskinity.
+This module provides token buckets per SMTP relay and per recipient domain whose rates
+slow down on throttling replies (421/451/452) and recover after sustained success.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+# SMTP replies that mean "slow down"
+THROTTLE_CODES = frozenset({421, 451, 452})
+
+class TokenBucket:
+    """Thread-safe token bucket."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Initialize the bucket full.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (default: one second worth of tokens, at least 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        # Burst length in seconds of sending; the capacity follows the rate
+        self._burst_seconds = self.capacity / rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """
+        Take tokens, waiting until enough are available.
+
+        Args:
+            tokens: Number of tokens to take
+        """
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: float = 1.0):
+        """
+        Take tokens like acquire(), waiting without blocking the event loop.
+
+        Args:
+            tokens: Number of tokens to take
+        """
+        while True:
+            wait = self._take(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def set_rate(self, rate: float):
+        """
+        Change the refill rate and scale the capacity with it.
+
+        Tokens above the new capacity are dropped, so a full bucket cannot send a burst
+        at the old rate right after slowing down.
+
+        Args:
+            rate: Tokens added per second
+        """
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.capacity = max(1.0, rate * self._burst_seconds)
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _take(self, tokens: float) -> float:
+        """Take tokens if enough are available; otherwise return the seconds to wait for them."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class AdaptiveRateLimiter:
+    """Token buckets per relay and per recipient domain with additive-increase/multiplicative-decrease rates."""
+
+    def __init__(self, relay_rate: float = 20.0, domain_rate: float = 5.0,
+                 relay_rates: Optional[Dict[str, float]] = None,
+                 domain_rates: Optional[Dict[str, float]] = None,
+                 min_rate: float = 0.1, backoff: float = 0.5,
+                 recovery: float = 1.1, recovery_after: int = 20):
+        """
+        Initialize the limiter.
+
+        Args:
+            relay_rate: Default messages per second per relay
+            domain_rate: Default messages per second per recipient domain
+            relay_rates: Configured rates for specific relays
+            domain_rates: Configured rates for specific domains
+            min_rate: Lower bound of any rate
+            backoff: Rate multiplier applied on a throttling reply
+            recovery: Rate multiplier applied after recovery_after consecutive successes
+            recovery_after: Number of consecutive successes before the rate grows again
+        """
+        self.relay_rate = relay_rate
+        self.domain_rate = domain_rate
+        self.relay_rates = dict(relay_rates or {})
+        self.domain_rates = dict(domain_rates or {})
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.recovery_after = recovery_after
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._ceilings: Dict[str, float] = {}
+        self._successes: Dict[str, int] = {}
+        self._throttled: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, relay: str, domains: Iterable[str]):
+        """
+        Wait until a message may be sent through a relay to the given recipient domains.
+
+        Args:
+            relay: Relay address
+            domains: Recipient domains of the message
+        """
+        for domain in sorted(set(domains)):
+            self._bucket(f"domain:{domain}").acquire()
+        self._bucket(f"relay:{relay}").acquire()
+
+    async def acquire_async(self, relay: str, domains: Iterable[str]):
+        """
+        Wait like acquire(), without blocking the event loop.
+
+        Args:
+            relay: Relay address
+            domains: Recipient domains of the message
+        """
+        for domain in sorted(set(domains)):
+            await self._bucket(f"domain:{domain}").acquire_async()
+        await self._bucket(f"relay:{relay}").acquire_async()
+
+    def record(self, relay: str, domains: Iterable[str], code: Optional[int]):
+        """
+        Adapt the rates to the reply of a send attempt.
+
+        Args:
+            relay: Relay address
+            domains: Recipient domains of the message
+            code: SMTP reply code (2xx on success), or None if unknown
+        """
+        keys = [f"relay:{relay}"] + [f"domain:{domain}" for domain in set(domains)]
+        for key in keys:
+            if code in THROTTLE_CODES:
+                self._slow_down(key)
+            elif code is not None and 200 <= code < 300:
+                self._speed_up(key)
+
+    def metrics(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Get the current rates.
+
+        Returns:
+            Dictionary with "relays" and "domains", each mapping a name to its
+            current rate, configured rate and number of throttling replies
+        """
+        with self._lock:
+            metrics: Dict[str, Dict[str, Dict[str, float]]] = {"relays": {}, "domains": {}}
+            for key, bucket in self._buckets.items():
+                kind, name = key.split(":", 1)
+                metrics["relays" if kind == "relay" else "domains"][name] = {
+                    "rate": bucket.rate,
+                    "configured_rate": self._ceilings[key],
+                    "throttled": self._throttled.get(key, 0)
+                }
+            return metrics
+
+    def _bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                kind, name = key.split(":", 1)
+                if kind == "relay":
+                    rate = self.relay_rates.get(name, self.relay_rate)
+                else:
+                    rate = self.domain_rates.get(name, self.domain_rate)
+                bucket = self._buckets[key] = TokenBucket(rate)
+                self._ceilings[key] = rate
+            return bucket
+
+    def _slow_down(self, key: str):
+        bucket = self._bucket(key)
+        with self._lock:
+            self._successes[key] = 0
+            self._throttled[key] = self._throttled.get(key, 0) + 1
+            bucket.set_rate(max(self.min_rate, bucket.rate * self.backoff))
+
+    def _speed_up(self, key: str):
+        bucket = self._bucket(key)
+        with self._lock:
+            self._successes[key] = self._successes.get(key, 0) + 1
+            if self._successes[key] >= self.recovery_after and bucket.rate < self._ceilings[key]:
+                self._successes[key] = 0
+                bucket.set_rate(min(self._ceilings[key], bucket.rate * self.recovery))
+
+def _parse_rates(value: str) -> Dict[str, float]:
+    """Parse "name=rate,name=rate" into a dictionary."""
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            rates[name.strip().lower()] = float(rate)
+    return rates
+
+_limiter: Optional[AdaptiveRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    Get the limiter shared by all outbound sends, configured from the environment.
+
+    SMTP_RELAY_RATE and SMTP_DOMAIN_RATE set the default messages per second;
+    SMTP_RELAY_RATES and SMTP_DOMAIN_RATES ("gmail.com=1,example.com=20") override them.
+
+    Returns:
+        Shared AdaptiveRateLimiter
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveRateLimiter(
+                relay_rate=float(os.getenv("SMTP_RELAY_RATE", 20)),
+                domain_rate=float(os.getenv("SMTP_DOMAIN_RATE", 5)),
+                relay_rates=_parse_rates(os.getenv("SMTP_RELAY_RATES", "")),
+                domain_rates=_parse_rates(os.getenv("SMTP_DOMAIN_RATES", ""))
+            )
+        return _limiter
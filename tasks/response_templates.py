@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Response template engine for Taskinity.
+This module loads response templates from config and compiles each one once
+into literal and placeholder segments, so rendering is a single join per email.
+"""
+import os
+import json
+import string
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Default location of the response templates
+DEFAULT_TEMPLATES_FILE = Path(__file__).parent.parent / "config" / "response_templates.json"
+
+# str.format conversions ("{name!r}")
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+class CompiledTemplate:
+    """Template split into literal text and placeholder segments."""
+
+    def __init__(self, text: str):
+        """
+        Compile a template.
+
+        Placeholders use the str.format syntax ("{name}", "{name!r}", "{name:>10}");
+        "{{" and "}}" are literal braces. Positional, attribute or index fields and
+        nested placeholders in a format spec are rejected.
+
+        Args:
+            text: Template text
+
+        Raises:
+            ValueError: If the template uses an unsupported placeholder
+        """
+        self.text = text
+        self.segments: List[Tuple[str, Optional[str], Optional[str], str]] = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            if field_name is not None and not field_name.isidentifier():
+                raise ValueError(f"Unsupported placeholder {{{field_name}}} in template: {text[:40]!r}")
+            if conversion and conversion not in _CONVERSIONS:
+                raise ValueError(f"Unknown conversion !{conversion} in template: {text[:40]!r}")
+            if format_spec and "{" in format_spec:
+                raise ValueError(f"Nested placeholder in format spec of {{{field_name}}}: {text[:40]!r}")
+            self.segments.append((literal, field_name, conversion, format_spec or ""))
+        self.placeholders = frozenset(segment[1] for segment in self.segments if segment[1] is not None)
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        Render the template.
+
+        Args:
+            values: Placeholder values
+
+        Returns:
+            Rendered text, the same as text.format(**values)
+        """
+        parts = []
+        for literal, field_name, conversion, format_spec in self.segments:
+            parts.append(literal)
+            if field_name is None:
+                continue
+            value = values[field_name]
+            if conversion:
+                value = _CONVERSIONS[conversion](value)
+            parts.append(format(value, format_spec) if format_spec else str(value))
+        return "".join(parts)
+
+    def render_batch(self, values_list: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Render the template once for every set of values.
+
+        Args:
+            values_list: Placeholder values, one dictionary per email
+
+        Returns:
+            List of rendered texts
+        """
+        render = self.render
+        return [render(values) for values in values_list]
+
+# Compiled templates cached per file: path -> ((mtime, size), templates)
+_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, CompiledTemplate]]] = {}
+
+def load_templates(path: Optional[str] = None) -> Dict[str, CompiledTemplate]:
+    """
+    Load and compile the response templates.
+
+    Templates are compiled once and recompiled only when the file changes,
+    so edits to the config take effect without a code change or restart.
+
+    Args:
+        path: Templates file (default: RESPONSE_TEMPLATES_FILE or config/response_templates.json)
+
+    Returns:
+        Dictionary of compiled templates by name
+    """
+    path = str(path or os.getenv("RESPONSE_TEMPLATES_FILE", DEFAULT_TEMPLATES_FILE))
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _cache.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw_templates = json.load(f)
+
+    templates = {name: CompiledTemplate(text) for name, text in raw_templates.items()}
+    _cache[path] = (version, templates)
+    return templates
+
+def get_template(name: str, path: Optional[str] = None) -> CompiledTemplate:
+    """
+    Get a compiled response template by name.
+
+    Args:
+        name: Template name (e.g. "urgent", "support")
+        path: Templates file (default: see load_templates)
+
+    Returns:
+        Compiled template
+    """
+    templates = load_templates(path)
+    if name not in templates:
+        raise KeyError(f"Response template not found: {name}")
+    return templates[name]
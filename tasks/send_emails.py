@@ -5,15 +5,22 @@ This module provides tasks for sending email responses.
 """
 import os
 import time
+import asyncio
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Any, Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 
 # Import Taskinity core functionality
 from taskinity.core.taskinity_core import task
 
+from tasks.async_smtp import get_async_smtp_pool, run_all, send_message
+from tasks.mime_skeleton import MessageSkeleton, get_skeleton
+from tasks.outbound_spool import _describe_error, get_outbound_spool, is_permanent_failure
+from tasks.rate_limit import THROTTLE_CODES, get_rate_limiter
+from tasks.smtp_pool import get_smtp_pool
+from tasks.smtp_relays import get_relay_pool, is_relay_failure
+
 # Load environment variables
 load_dotenv()
 
@@ -22,7 +29,8 @@ def send_responses(urgent_responses: List[Dict[str, Any]] = None,
                   attachment_responses: List[Dict[str, Any]] = None,
                   support_responses: List[Dict[str, Any]] = None,
                   order_responses: List[Dict[str, Any]] = None,
-                  regular_responses: List[Dict[str, Any]] = None) -> Dict[str, int]:
+                  regular_responses: List[Dict[str, Any]] = None,
+                  max_workers: Optional[int] = None) -> Dict[str, int]:
     """
     Sends email responses for different categories.
     
@@ -32,9 +40,11 @@ def send_responses(urgent_responses: List[Dict[str, Any]] = None,
         support_responses: List of responses for support emails
         order_responses: List of responses for order emails
         regular_responses: List of responses for regular emails
+        max_workers: Number of concurrent senders (default: SMTP_SEND_WORKERS)
     
     Returns:
-        Dictionary with counts of sent emails by category
+        Dictionary with counts of sent emails by category; "total_spooled" counts
+        failed responses queued for retry in the outbound spool
     """
     # Initialize counts
     urgent_count = len(urgent_responses) if urgent_responses else 0
@@ -61,11 +71,13 @@ def send_responses(urgent_responses: List[Dict[str, Any]] = None,
     if regular_responses:
         all_responses.extend(regular_responses)
     
-    # Send each response
-    sent_count = 0
-    for response in all_responses:
-        if _send_email_response(response):
-            sent_count += 1
+    # Send the responses concurrently; failed responses are kept in the outbound spool
+    if _asyncio_backend() and not _mock_emails():
+        results = _send_batch_or_spool(all_responses)
+    else:
+        results = _deliver_concurrently(_send_or_spool, all_responses, max_workers)
+    sent_count = sum(1 for result in results if result is True)
+    spooled_count = sum(1 for result in results if result == "spooled")
     
     return {
         "sent_urgent": urgent_count,
@@ -74,6 +86,7 @@ def send_responses(urgent_responses: List[Dict[str, Any]] = None,
         "sent_orders": order_count,
         "sent_regular": regular_count,
         "total_sent": sent_count,
+        "total_spooled": spooled_count,
         "total_attempted": total_count
     }
 
@@ -100,19 +113,41 @@ def send_email(to_email: str, subject: str, body: str,
     Returns:
         True if email was sent successfully, False otherwise
     """
-    # Get SMTP configuration from environment
-    smtp_server = os.getenv("SMTP_SERVER", "smtp.example.com")
-    smtp_port = int(os.getenv("SMTP_PORT", 587))
-    smtp_username = os.getenv("SMTP_USERNAME", "")
-    smtp_password = os.getenv("SMTP_PASSWORD", "")
-    default_from_email = os.getenv("FROM_EMAIL", "noreply@taskinity.org")
+    try:
+        _send_message(to_email, subject, body, from_email, cc, bcc, reply_to, html_body)
+    except Exception as e:
+        print(f"Error sending email: {str(e)}")
+        return False
+    return True
+
+def _send_message(to_email: str, subject: str, body: str,
+                  from_email: Optional[str] = None,
+                  cc: Optional[List[str]] = None,
+                  bcc: Optional[List[str]] = None,
+                  reply_to: Optional[str] = None,
+                  html_body: Optional[str] = None):
+    """
+    Send a single email like send_email, but raise the error if sending fails.
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject
+        body: Email body (plain text)
+        from_email: Sender email address (default: from environment)
+        cc: List of CC recipients
+        bcc: List of BCC recipients
+        reply_to: Reply-to email address
+        html_body: HTML version of the email body
     
+    Raises:
+        Exception: The SMTP or connection error of the failed send
+    """
     # Use default from_email if not provided
     if not from_email:
-        from_email = default_from_email
+        from_email = os.getenv("FROM_EMAIL", "noreply@taskinity.org")
     
     # For testing without an actual SMTP server
-    if os.getenv("MOCK_EMAILS", "false").lower() == "true":
+    if _mock_emails():
         print(f"MOCK: Sending email to {to_email}")
         print(f"MOCK: Subject: {subject}")
         print(f"MOCK: From: {from_email}")
@@ -122,42 +157,63 @@ def send_email(to_email: str, subject: str, body: str,
             print(f"MOCK: BCC: {', '.join(bcc)}")
         print(f"MOCK: Body: {body[:100]}...")
         time.sleep(0.2)  # Simulate sending delay
-        return True
+        return
+    
+    _deliver(*_build_message(to_email, subject, body, from_email, cc, bcc, reply_to, html_body))
+    print(f"Email sent to {to_email}")
+
+def _build_message(to_email: str, subject: str, body: str,
+                   from_email: Optional[str] = None,
+                   cc: Optional[List[str]] = None,
+                   bcc: Optional[List[str]] = None,
+                   reply_to: Optional[str] = None,
+                   html_body: Optional[str] = None) -> Tuple[str, List[str], bytes]:
+    """
+    Serialize a single email for _deliver.
+    
+    Args:
+        to_email: Recipient email address
+        subject: Email subject
+        body: Email body (plain text)
+        from_email: Sender email address (default: from environment)
+        cc: List of CC recipients
+        bcc: List of BCC recipients
+        reply_to: Reply-to email address
+        html_body: HTML version of the email body
+    
+    Returns:
+        Envelope sender, envelope recipients and the complete message
+    """
+    if not from_email:
+        from_email = os.getenv("FROM_EMAIL", "noreply@taskinity.org")
+    
+    # Prepare recipients list
+    recipients = [to_email]
+    if cc:
+        recipients.extend(cc)
+    if bcc:
+        recipients.extend(bcc)
+    
+    # Serialize the message directly; plain text mail has no multipart wrapper
+    message = MessageSkeleton(subject, body, from_email, html_body=html_body, reply_to=reply_to,
+                              cc=cc, personalize=False).render(to_email)
+    return from_email, recipients, message
+
+def _send_prepared(to_email: str, from_email: str, recipients: List[str], message: bytes) -> bool:
+    """
+    Send a serialized message over a pooled, already authenticated connection.
     
+    Args:
+        to_email: Main recipient, for reporting
+        from_email: Envelope sender
+        recipients: Envelope recipients
+        message: Complete message
+    
+    Returns:
+        True if email was sent successfully, False otherwise
+    """
     try:
-        # Create message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = from_email
-        msg["To"] = to_email
-        
-        if cc:
-            msg["Cc"] = ", ".join(cc)
-        if reply_to:
-            msg["Reply-To"] = reply_to
-        
-        # Add plain text body
-        msg.attach(MIMEText(body, "plain"))
-        
-        # Add HTML body if provided
-        if html_body:
-            msg.attach(MIMEText(html_body, "html"))
-        
-        # Connect to SMTP server
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            
-            # Prepare recipients list
-            recipients = [to_email]
-            if cc:
-                recipients.extend(cc)
-            if bcc:
-                recipients.extend(bcc)
-            
-            # Send email
-            server.sendmail(from_email, recipients, msg.as_string())
-        
+        _deliver(from_email, recipients, message)
         print(f"Email sent to {to_email}")
         return True
     
@@ -165,15 +221,32 @@ def send_email(to_email: str, subject: str, body: str,
         print(f"Error sending email: {str(e)}")
         return False
 
-def _send_email_response(response: Dict[str, Any]) -> bool:
+def _deliver_response(response: Dict[str, Any]) -> bool:
     """
-    Send an email response based on the response data.
+    Send an email response, raising the error if sending fails.
     
     Args:
         response: Response data dictionary
     
     Returns:
-        True if email was sent successfully, False otherwise
+        True once the email has been sent
+    
+    Raises:
+        Exception: The SMTP or connection error of the failed send
+    """
+    # Send the email
+    _send_message(**_response_fields(response))
+    return True
+
+def _response_fields(response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the _send_message arguments of an email response.
+    
+    Args:
+        response: Response data dictionary
+    
+    Returns:
+        Dictionary with to_email, subject, body and reply_to
     """
     # Extract recipient from the original sender
     to_email = response.get("original_from", "")
@@ -191,53 +264,160 @@ def _send_email_response(response: Dict[str, Any]) -> bool:
         headers["X-MSMail-Priority"] = "High"
         headers["Importance"] = "High"
     
-    # Send the email
-    return send_email(
-        to_email=to_email,
-        subject=subject,
-        body=body,
-        reply_to=os.getenv("REPLY_TO_EMAIL", None)
-    )
+    return {
+        "to_email": to_email,
+        "subject": subject,
+        "body": body,
+        "reply_to": os.getenv("REPLY_TO_EMAIL", None)
+    }
+
+def _send_or_spool(response: Dict[str, Any]) -> Union[bool, str]:
+    """
+    Send an email response, or queue it in the outbound spool if sending fails.
+    
+    Permanent failures (5xx replies, invalid input) are stored as dead letters
+    instead of being retried.
+    
+    Args:
+        response: Response data dictionary
+    
+    Returns:
+        True if the email was sent, "spooled" if it was queued for retry, False otherwise
+    """
+    try:
+        return _deliver_response(response)
+    except Exception as e:
+        return _spool_failed(response, e)
+
+def _send_batch_or_spool(responses: List[Dict[str, Any]]) -> List[Union[bool, str]]:
+    """
+    Send email responses together on the asyncio backend, spooling the failed ones.
+    
+    Args:
+        responses: Response data dictionaries
+    
+    Returns:
+        Result of every response, as returned by _send_or_spool
+    """
+    messages = [_build_message(**_response_fields(response)) for response in responses]
+    results = []
+    for response, (_, recipients, _), outcome in zip(responses, messages, _deliver_batch(messages)):
+        if isinstance(outcome, Exception):
+            results.append(_spool_failed(response, outcome))
+        else:
+            print(f"Email sent to {recipients[0]}")
+            results.append(True)
+    return results
+
+def _spool_failed(response: Dict[str, Any], error: Exception) -> Union[bool, str]:
+    """
+    Queue a response that could not be sent in the outbound spool.
+    
+    Args:
+        response: Response data dictionary
+        error: Exception raised while sending
+    
+    Returns:
+        "spooled" if the response was queued for retry, False otherwise
+    """
+    # Kept with the spooled response, so dead letters show why they failed
+    permanent = is_permanent_failure(error)
+    error = _describe_error(error)
+    print(f"Error sending email: {error}")
+    
+    spool = get_outbound_spool()
+    if spool is None:
+        return False
+    
+    try:
+        spool.enqueue(response, error=error, permanent=permanent)
+    except Exception as e:
+        print(f"Error spooling email response: {str(e)}")
+        return False
+    if permanent:
+        print(f"Response to {response.get('original_from', '')} failed permanently, kept as a dead letter")
+        return False
+    print(f"Queued response to {response.get('original_from', '')} for retry")
+    return "spooled"
 
 @task(name="Send Bulk Emails", description="Sends bulk emails to multiple recipients")
 def send_bulk_emails(recipients: List[str], subject: str, body: str,
                     from_email: Optional[str] = None,
-                    personalize: bool = True) -> Dict[str, int]:
+                    personalize: bool = True,
+                    max_workers: Optional[int] = None) -> Dict[str, int]:
     """
     Sends bulk emails to multiple recipients.
     
+    Messages are sent by a pool of concurrent workers; the number of open
+    connections per relay is limited by the SMTP connection pool (SMTP_POOL_SIZE).
+    Without personalization, the identical message is sent once per recipient domain
+    with many RCPT commands per transaction (see _send_grouped).
+    
     Args:
         recipients: List of recipient email addresses
         subject: Email subject
         body: Email body template
         from_email: Sender email address (default: from environment)
         personalize: Whether to personalize emails for each recipient
+        max_workers: Number of concurrent senders (default: SMTP_SEND_WORKERS)
     
     Returns:
         Dictionary with counts of sent and failed emails
     """
     print(f"Sending bulk emails to {len(recipients)} recipients")
     
-    sent_count = 0
-    failed_count = 0
+    # Identical messages go out as shared transactions with many recipients
+    if not personalize:
+        failed = _send_grouped(recipients, subject, body, from_email, max_workers)
+        return _bulk_result(recipients, failed)
     
-    for recipient in recipients:
-        # Personalize email if requested
-        if personalize:
-            personalized_body = _personalize_email(body, recipient)
-            personalized_subject = _personalize_email(subject, recipient)
-        else:
-            personalized_body = body
-            personalized_subject = subject
-        
-        # Send email
-        if send_email(recipient, personalized_subject, personalized_body, from_email):
-            sent_count += 1
-        else:
-            failed_count += 1
+    # Headers and body are serialized once; only the per-recipient fields are rendered
+    if not from_email:
+        from_email = os.getenv("FROM_EMAIL", "noreply@taskinity.org")
+    skeleton = get_skeleton(subject, body, from_email)
+    mock = _mock_emails()
+    
+    # The asyncio backend keeps every message in flight at once on its event loop
+    if _asyncio_backend() and not mock:
+        messages = [(from_email, [recipient], skeleton.render(recipient)) for recipient in recipients]
+        outcomes = _deliver_batch(messages)
+        for recipient, outcome in zip(recipients, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"Error sending email to {recipient}: {str(outcome)}")
+        return _bulk_result(recipients, [recipient for recipient, outcome in zip(recipients, outcomes)
+                                         if isinstance(outcome, Exception)])
+    
+    def send_to(recipient: str) -> bool:
+        if mock:
+            return send_email(recipient, _personalize_email(subject, recipient),
+                              _personalize_email(body, recipient), from_email)
         
-        # Add a small delay between emails to avoid rate limiting
-        time.sleep(0.1)
+        # Send email; pacing is handled by the adaptive rate limiter in _deliver
+        return _send_prepared(recipient, from_email, [recipient], skeleton.render(recipient))
+    
+    # Collect the result of every recipient
+    results = _deliver_concurrently(send_to, recipients, max_workers)
+    
+    failed = [recipient for recipient, sent in zip(recipients, results) if not sent]
+    return _bulk_result(recipients, failed)
+
+def _bulk_result(recipients: List[str], failed: List[str]) -> Dict[str, int]:
+    """
+    Report failed recipients and build the send_bulk_emails result.
+    
+    Args:
+        recipients: All recipient email addresses
+        failed: Recipients that were not sent to
+    
+    Returns:
+        Dictionary with counts of sent and failed emails
+    """
+    if failed:
+        print(f"Failed to send to {len(failed)} recipients: {', '.join(failed[:10])}"
+              f"{' ...' if len(failed) > 10 else ''}")
+    
+    sent_count = len(recipients) - len(failed)
+    failed_count = len(failed)
     
     return {
         "total_recipients": len(recipients),
@@ -245,6 +425,297 @@ def send_bulk_emails(recipients: List[str], subject: str, body: str,
         "failed": failed_count
     }
 
+def _send_grouped(recipients: List[str], subject: str, body: str,
+                  from_email: Optional[str] = None,
+                  max_workers: Optional[int] = None) -> List[str]:
+    """
+    Send one identical message to many recipients in shared SMTP transactions.
+    
+    The message is built once. Recipients are grouped by domain, and every group is split
+    into transactions of at most SMTP_MAX_RECIPIENTS RCPT commands (default: 50).
+    
+    Args:
+        recipients: List of recipient email addresses
+        subject: Email subject
+        body: Email body
+        from_email: Sender email address (default: from environment)
+        max_workers: Number of concurrent transactions (default: SMTP_SEND_WORKERS)
+    
+    Returns:
+        List of recipients that were not sent to
+    """
+    if not from_email:
+        from_email = os.getenv("FROM_EMAIL", "noreply@taskinity.org")
+    max_recipients = max(1, int(os.getenv("SMTP_MAX_RECIPIENTS", 50)))
+    
+    by_domain: Dict[str, List[str]] = {}
+    for recipient in recipients:
+        by_domain.setdefault(recipient.rsplit("@", 1)[-1].lower(), []).append(recipient)
+    transactions = [group[i:i + max_recipients] for group in by_domain.values()
+                    for i in range(0, len(group), max_recipients)]
+    
+    print(f"Sending {len(recipients)} identical emails in {len(transactions)} transactions")
+    
+    # For testing without an actual SMTP server
+    if _mock_emails():
+        for group in transactions:
+            print(f"MOCK: Sending email to {len(group)} recipients at {group[0].rsplit('@', 1)[-1]}")
+            time.sleep(0.2)  # Simulate sending delay
+        return []
+    
+    # Recipients are in the envelope only, so they do not see each other
+    message = MessageSkeleton(subject, body, from_email, personalize=False).render("undisclosed-recipients:;")
+    
+    def failed_in(group: List[str], outcome: Union[Dict[str, Any], Exception]) -> List[str]:
+        if isinstance(outcome, Exception):
+            print(f"Error sending email to {len(group)} recipients: {str(outcome)}")
+            return group
+        return [recipient for recipient in group if recipient in outcome]
+    
+    def send_group(group: List[str]) -> List[str]:
+        try:
+            outcome = _deliver(from_email, group, message)
+        except Exception as e:
+            outcome = e
+        return failed_in(group, outcome)
+    
+    if _asyncio_backend():
+        outcomes = _deliver_batch([(from_email, group, message) for group in transactions])
+        failed_groups = [failed_in(group, outcome) for group, outcome in zip(transactions, outcomes)]
+    else:
+        failed_groups = _deliver_concurrently(send_group, transactions, max_workers)
+    failed = {recipient for group in failed_groups for recipient in group}
+    return [recipient for recipient in recipients if recipient in failed]
+
+def _deliver(from_email: str, recipients: List[str], message: Union[str, bytes],
+             smtp_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Send a message through the rate limiter and a pooled connection of one of the relays.
+    
+    Relays come from SMTP_RELAYS (or SMTP_SERVER) and are chosen by weighted round robin;
+    when a relay fails at the connection level, the next healthy relay is tried.
+    SMTP_BACKEND selects the client: "smtplib" (default) or "asyncio". Relays on
+    port 465 are connected with implicit TLS.
+    
+    Args:
+        from_email: Envelope sender
+        recipients: Envelope recipients
+        message: Complete message
+        smtp_config: Settings overriding the environment, e.g. the smtp section of
+            email_config.json: "relays", "server", "port", "username", "password",
+            "use_tls", "backend", "pool_size" and "timeout"
+    
+    Returns:
+        Refused recipients mapped to (code, message)
+    """
+    settings = _smtp_settings(smtp_config)
+    relays = settings["relays"]
+    limiter = get_rate_limiter()
+    domains = [recipient.rsplit("@", 1)[-1].lower() for recipient in recipients]
+    tried = []
+    
+    while True:
+        relay = relays.choose(exclude=tried)
+        tried.append(relay)
+        use_ssl = relay.port == 465
+        
+        # Wait for the relay and recipient domain rate limits
+        limiter.acquire(relay.name, domains)
+        
+        try:
+            if settings["asyncio"]:
+                # Sessions are multiplexed on one event loop instead of one thread each
+                refused = send_message(relay.host, relay.port, from_email, recipients, message,
+                                       settings["username"], settings["password"], use_tls=settings["use_tls"],
+                                       use_ssl=use_ssl, max_size=settings["pool_size"],
+                                       timeout=settings["timeout"])
+            else:
+                pool = get_smtp_pool(relay.host, relay.port, settings["username"], settings["password"],
+                                     use_tls=settings["use_tls"], max_size=settings["pool_size"],
+                                     use_ssl=use_ssl, timeout=settings["timeout"] or 30.0)
+                refused = pool.sendmail(from_email, recipients, message)
+        except Exception as e:
+            if not _try_next_relay(relays, relay, tried, limiter, domains, e):
+                raise
+            continue
+        
+        return _delivered(relays, relay, limiter, domains, refused)
+
+async def _deliver_async(from_email: str, recipients: List[str], message: Union[str, bytes],
+                         settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Send a message like _deliver, as a coroutine on the event loop of the asyncio backend.
+    
+    Args:
+        from_email: Envelope sender
+        recipients: Envelope recipients
+        message: Complete message
+        settings: Delivery settings from _smtp_settings
+    
+    Returns:
+        Refused recipients mapped to (code, message)
+    """
+    relays = settings["relays"]
+    limiter = get_rate_limiter()
+    domains = [recipient.rsplit("@", 1)[-1].lower() for recipient in recipients]
+    tried = []
+    
+    while True:
+        relay = relays.choose(exclude=tried)
+        tried.append(relay)
+        
+        await limiter.acquire_async(relay.name, domains)
+        pool = get_async_smtp_pool(relay.host, relay.port, settings["username"], settings["password"],
+                                   settings["use_tls"], relay.port == 465, settings["pool_size"])
+        try:
+            refused = await asyncio.wait_for(pool.sendmail(from_email, recipients, message), settings["timeout"])
+        except Exception as e:
+            if not _try_next_relay(relays, relay, tried, limiter, domains, e):
+                raise
+            continue
+        
+        return _delivered(relays, relay, limiter, domains, refused)
+
+def _deliver_batch(messages: List[Tuple[str, List[str], Union[str, bytes]]],
+                   smtp_config: Optional[Dict[str, Any]] = None) -> List[Union[Dict[str, Any], Exception]]:
+    """
+    Send many messages at once on the event loop of the asyncio backend.
+    
+    Every message is delivered like _deliver, but all of them are in flight together,
+    limited only by the rate limiter and the session pools, not by caller threads.
+    
+    Args:
+        messages: (envelope sender, envelope recipients, complete message) of every message
+        smtp_config: Settings overriding the environment (see _deliver)
+    
+    Returns:
+        Refused recipients of every message, or the exception its send raised, in order
+    """
+    settings = _smtp_settings(smtp_config)
+    return run_all([_deliver_async(from_email, recipients, message, settings)
+                    for from_email, recipients, message in messages])
+
+def _smtp_settings(smtp_config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Resolve the delivery settings of _deliver.
+    
+    Args:
+        smtp_config: Settings overriding the environment (see _deliver)
+    
+    Returns:
+        Dictionary with username, password, use_tls, pool_size, timeout,
+        asyncio (backend flag) and relays (RelayPool)
+    """
+    smtp_config = smtp_config or {}
+    
+    # SMTP_RELAYS takes precedence over a single configured server
+    relay_list = smtp_config.get("relays") or os.getenv("SMTP_RELAYS")
+    if not relay_list and smtp_config.get("server"):
+        relay_list = f"{smtp_config['server']}:{smtp_config.get('port', 587)}"
+    
+    # Get SMTP configuration from environment
+    return {
+        "username": smtp_config.get("username", os.getenv("SMTP_USERNAME", "")),
+        "password": smtp_config.get("password", os.getenv("SMTP_PASSWORD", "")),
+        "use_tls": smtp_config.get("use_tls", os.getenv("SMTP_USE_TLS", "true").lower() == "true"),
+        "pool_size": int(smtp_config.get("pool_size", os.getenv("SMTP_POOL_SIZE", 4))),
+        "timeout": smtp_config.get("timeout"),
+        "asyncio": _asyncio_backend(smtp_config),
+        "relays": get_relay_pool(relay_list, smtp_config.get("port"))
+    }
+
+def _asyncio_backend(smtp_config: Optional[Dict[str, Any]] = None) -> bool:
+    """Tell whether SMTP_BACKEND (or the "backend" setting) selects the asyncio client."""
+    backend = (smtp_config or {}).get("backend", os.getenv("SMTP_BACKEND", "smtplib"))
+    return backend.lower() == "asyncio"
+
+def _mock_emails() -> bool:
+    """Tell whether MOCK_EMAILS replaces sending with printing."""
+    return os.getenv("MOCK_EMAILS", "false").lower() == "true"
+
+def _try_next_relay(relays: Any, relay: Any, tried: List[Any], limiter: Any,
+                    domains: List[str], error: Exception) -> bool:
+    """
+    Record a failed send attempt and decide whether another relay should be tried.
+    
+    Args:
+        relays: RelayPool the relay was chosen from
+        relay: Relay of the failed attempt
+        tried: Relays tried so far for the message
+        limiter: Rate limiter of the attempt
+        domains: Recipient domains of the message
+        error: Exception raised by the attempt
+    
+    Returns:
+        True if the message should be sent through another relay
+    """
+    limiter.record(relay.name, domains, _smtp_reply_code(error))
+    if not is_relay_failure(error):
+        relays.record_success(relay)
+        return False
+    relays.record_failure(relay)
+    if len(tried) >= len(relays):
+        return False
+    print(f"SMTP relay {relay.name} failed ({str(error)}), trying another relay")
+    return True
+
+def _delivered(relays: Any, relay: Any, limiter: Any, domains: List[str], refused: Any) -> Dict[str, Any]:
+    """Record a successful send attempt and return its refused recipients."""
+    relays.record_success(relay)
+    refused = refused if isinstance(refused, dict) else {}
+    limiter.record(relay.name, domains, _worst_reply_code(refused) if refused else 250)
+    return refused
+
+def _smtp_reply_code(error: Exception) -> Optional[int]:
+    """
+    Get the SMTP reply code carried by a send error.
+    
+    Args:
+        error: Exception raised while sending
+    
+    Returns:
+        Reply code (a throttling code if any recipient was throttled), or None
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return _worst_reply_code(error.recipients)
+    return getattr(error, "smtp_code", None)
+
+def _worst_reply_code(refused: Dict[str, Any]) -> Optional[int]:
+    """
+    Pick the reply code that matters most for rate limiting from refused recipients.
+    
+    Args:
+        refused: Refused recipients mapped to (code, message), as reported by smtplib
+    
+    Returns:
+        A throttling code if any recipient was throttled, otherwise the first code, or None
+    """
+    codes = [reply[0] for reply in refused.values()]
+    throttled = [code for code in codes if code in THROTTLE_CODES]
+    return (throttled or codes or [None])[0]
+
+def _deliver_concurrently(send_one: Callable[[Any], Any], items: List[Any],
+                          max_workers: Optional[int] = None) -> List[Any]:
+    """
+    Send items concurrently and collect the result of each one.
+    
+    Args:
+        send_one: Function sending a single item and returning its result
+        items: Items to send
+        max_workers: Number of concurrent senders (default: SMTP_SEND_WORKERS or 8)
+    
+    Returns:
+        List of results in the order of the items
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv("SMTP_SEND_WORKERS", 8))
+    
+    if max_workers <= 1 or len(items) <= 1:
+        return [send_one(item) for item in items]
+    
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="smtp-send") as executor:
+        return list(executor.map(send_one, items))
+
 def _personalize_email(template: str, recipient: str) -> str:
     """
     Personalize an email template for a specific recipient.
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Pooled SMTP connections for Taskinity.
+This module keeps authenticated SMTP sessions open and reuses them across sends,
+so that every email does not pay a full TCP, TLS and AUTH handshake.
+"""
+import atexit
+import re
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+class SMTPDeliveryUncertain(smtplib.SMTPException):
+    """The session dropped after the message data was sent, before the server replied.
+
+    The server may already have accepted the message, so it is not sent again
+    (neither on a new session nor through another relay).
+    """
+
+class SMTPConnectionPool:
+    """Pool of authenticated SMTP sessions to a single relay."""
+
+    def __init__(self, server: str, port: int = 587, username: str = "", password: str = "",
+                 use_tls: bool = True, max_size: int = 4, timeout: float = 30.0,
+                 noop_after: float = 5.0, max_idle: float = 60.0, use_ssl: bool = False):
+        """
+        Initialize the pool. Connections are opened lazily.
+
+        Args:
+            server: SMTP server address
+            port: SMTP server port
+            username: SMTP username (no AUTH if empty)
+            password: SMTP password
+            use_tls: Run STARTTLS after connecting
+            max_size: Maximum number of open connections; acquire() blocks beyond that
+            timeout: Socket timeout in seconds
+            noop_after: Check an idle session with NOOP before reuse after this many seconds
+            max_idle: Close sessions idle for longer than this many seconds
+            use_ssl: Connect with implicit TLS (port 465) instead of STARTTLS
+        """
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_size = max_size
+        self.timeout = timeout
+        self.noop_after = noop_after
+        self.max_idle = max_idle
+        self.use_ssl = use_ssl
+
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.created = 0
+        self.reused = 0
+        self.replaced = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        Borrow a session from the pool.
+
+        The session is reset with RSET and returned to the pool afterwards;
+        if the block raises, the session is discarded unless RSET still succeeds.
+
+        Yields:
+            Authenticated smtplib.SMTP session
+        """
+        self._slots.acquire()
+        try:
+            session = self._checkout()
+            try:
+                yield session
+            except BaseException:
+                self._checkin(session)
+                raise
+            self._checkin(session)
+        finally:
+            self._slots.release()
+
+    def sendmail(self, from_addr: str, to_addrs: Sequence[str], msg) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send a message over a pooled session.
+
+        A session dropped by the server before the message data was sent is replaced and
+        the message is sent once more; a drop after that raises SMTPDeliveryUncertain.
+        When the server advertises PIPELINING, MAIL, RCPT and DATA are sent in a single
+        round trip; errors are raised as by smtplib.SMTP.sendmail in both cases.
+
+        Args:
+            from_addr: Envelope sender
+            to_addrs: Envelope recipients
+            msg: Message as str or bytes
+
+        Returns:
+            Refused recipients, as returned by smtplib.SMTP.sendmail
+        """
+        try:
+            with self.connection() as session:
+                return _sendmail(session, from_addr, list(to_addrs), msg)
+        except smtplib.SMTPServerDisconnected:
+            with self.connection() as session:
+                return _sendmail(session, from_addr, list(to_addrs), msg)
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session, _ in idle:
+            _quit(session)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get pool statistics.
+
+        Returns:
+            Dictionary with the number of idle, created, reused and replaced sessions
+        """
+        with self._lock:
+            return {"idle": len(self._idle), "created": self.created,
+                    "reused": self.reused, "replaced": self.replaced}
+
+    def _checkout(self) -> smtplib.SMTP:
+        """Take a live idle session, or open a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                session, released_at = self._idle.pop()
+
+            idle_for = time.monotonic() - released_at
+            if idle_for <= self.noop_after or (idle_for <= self.max_idle and _is_alive(session)):
+                with self._lock:
+                    self.reused += 1
+                return session
+
+            # Dead or stale session: close it and try the next one
+            _quit(session)
+            with self._lock:
+                self.replaced += 1
+
+        session = self._connect()
+        with self._lock:
+            self.created += 1
+        return session
+
+    def _checkin(self, session: smtplib.SMTP):
+        """Reset a session and put it back into the pool."""
+        try:
+            code, _ = session.rset()
+        except Exception:
+            code = None
+        if code != 250:
+            _quit(session)
+            return
+        with self._lock:
+            self._idle.append((session, time.monotonic()))
+
+    def _connect(self) -> smtplib.SMTP:
+        """Open and authenticate a new session."""
+        if self.use_ssl:
+            session = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            session = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls and not self.use_ssl:
+                session.starttls()
+            if self.username:
+                session.login(self.username, self.password)
+        except Exception:
+            _quit(session)
+            raise
+        return session
+
+def _sendmail(session: smtplib.SMTP, from_addr: str, to_addrs: List[str], msg) -> Dict[str, Tuple[int, bytes]]:
+    """Send a message, pipelining the envelope commands when the server supports it."""
+    session.ehlo_or_helo_if_needed()
+    msg = _encode_message(msg)
+
+    commands = [f"MAIL FROM:{smtplib.quoteaddr(from_addr)}"]
+    commands += [f"RCPT TO:{smtplib.quoteaddr(addr)}" for addr in to_addrs]
+    commands.append("DATA")
+    refused = {}
+
+    if session.has_extn("pipelining"):
+        # MAIL, every RCPT and DATA go out together; replies come back in the same order
+        session.send("".join(command + "\r\n" for command in commands))
+        mail_reply = session.getreply()
+        for addr in to_addrs:
+            code, response = session.getreply()
+            if code not in (250, 251):
+                refused[addr] = (code, response)
+        data_code, data_response = session.getreply()
+    else:
+        mail_reply = session.docmd(commands[0])
+        data_code, data_response = 503, b"Not sent"
+        if mail_reply[0] == 250:
+            for addr, command in zip(to_addrs, commands[1:-1]):
+                code, response = session.docmd(command)
+                if code not in (250, 251):
+                    refused[addr] = (code, response)
+            if len(refused) < len(to_addrs):
+                data_code, data_response = session.docmd("DATA")
+
+    if data_code == 354 and (mail_reply[0] != 250 or len(refused) == len(to_addrs)):
+        # Server accepted DATA without a valid envelope: end it with an empty message
+        session.send(b".\r\n")
+        session.getreply()
+        data_code = None
+
+    if mail_reply[0] != 250:
+        session.rset()
+        raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], from_addr)
+    if len(refused) == len(to_addrs):
+        session.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    if data_code != 354:
+        session.rset()
+        raise smtplib.SMTPDataError(data_code, data_response)
+
+    # Past this point the server may accept the message even if the session drops
+    try:
+        session.send(_data_block(msg))
+        code, response = session.getreply()
+    except smtplib.SMTPServerDisconnected as e:
+        raise SMTPDeliveryUncertain(f"Connection lost after the message data was sent: {e}") from e
+    if code != 250:
+        session.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+def _encode_message(msg) -> bytes:
+    """Encode a message with CRLF line endings, as smtplib does."""
+    if isinstance(msg, str):
+        msg = re.sub(r"(?:\r\n|\n|\r(?!\n))", "\r\n", msg).encode("ascii")
+    return msg
+
+def _data_block(msg: bytes) -> bytes:
+    """Dot-stuff a message and terminate it for the DATA command."""
+    data = re.sub(rb"(?m)^\.", b"..", msg)
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    return data + b".\r\n"
+
+def _is_alive(session: smtplib.SMTP) -> bool:
+    """Check a session with NOOP."""
+    try:
+        code, _ = session.noop()
+        return code == 250
+    except Exception:
+        return False
+
+def _quit(session: smtplib.SMTP):
+    """Close a session, ignoring errors from already closed connections."""
+    try:
+        session.quit()
+    except Exception:
+        try:
+            session.close()
+        except Exception:
+            pass
+
+# Pools shared by all senders in the process: (server, port, username, use_tls, use_ssl) -> pool
+_pools: Dict[Tuple[str, int, str, bool, bool], SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_smtp_pool(server: str, port: int = 587, username: str = "", password: str = "",
+                  use_tls: bool = True, max_size: int = 4, use_ssl: bool = False,
+                  timeout: float = 30.0) -> SMTPConnectionPool:
+    """
+    Get the shared pool for a relay and account, creating it on first use.
+
+    Args:
+        server: SMTP server address
+        port: SMTP server port
+        username: SMTP username
+        password: SMTP password
+        use_tls: Run STARTTLS after connecting
+        max_size: Maximum number of open connections (used when the pool is created)
+        use_ssl: Connect with implicit TLS (port 465)
+        timeout: Socket timeout in seconds (used when the pool is created)
+
+    Returns:
+        Shared SMTPConnectionPool
+    """
+    key = (server, port, username, use_tls, use_ssl)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPConnectionPool(server, port, username, password, use_tls, max_size, timeout,
+                                      use_ssl=use_ssl)
+            _pools[key] = pool
+        return pool
+
+@atexit.register
+def close_all_pools():
+    """Close the idle sessions of every shared pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
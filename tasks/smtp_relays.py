@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Outbound relay selection for Taskinity.
+This module spreads outgoing mail over several weighted SMTP relays, takes a relay
+out of rotation after consecutive failures and probes it in the background until
+it recovers.
+"""
+import os
+import smtplib
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+class Relay:
+    """SMTP relay with its weight and health state."""
+
+    def __init__(self, host: str, port: int = 587, weight: int = 1):
+        """
+        Initialize the relay.
+
+        Args:
+            host: Relay address
+            port: Relay port
+            weight: Share of the traffic relative to the other relays
+        """
+        self.host = host
+        self.port = port
+        self.weight = max(1, weight)
+        self.name = f"{host.lower()}:{port}"
+
+        self.healthy = True
+        self.failures = 0
+        self.sent = 0
+        self.current = 0
+
+    def __repr__(self) -> str:
+        return f"Relay({self.name}, weight={self.weight}, healthy={self.healthy})"
+
+class RelayPool:
+    """Weighted round robin over healthy relays with failure detection."""
+
+    def __init__(self, relays: Sequence[Relay], failure_threshold: int = 3,
+                 probe_interval: float = 10.0, probe_timeout: float = 10.0):
+        """
+        Initialize the pool.
+
+        Args:
+            relays: Relays to balance over
+            failure_threshold: Consecutive failures after which a relay is marked unhealthy
+            probe_interval: Seconds between probes of unhealthy relays
+            probe_timeout: Connection timeout of a probe in seconds
+        """
+        if not relays:
+            raise ValueError("At least one relay is required")
+
+        self.relays = list(relays)
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+
+        self._lock = threading.Lock()
+        self._prober: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.relays)
+
+    def choose(self, exclude: Sequence[Relay] = ()) -> Relay:
+        """
+        Pick the next relay by smooth weighted round robin.
+
+        Unhealthy relays are skipped; if every candidate is unhealthy, they are used anyway
+        rather than failing without an attempt.
+
+        Args:
+            exclude: Relays already tried for the current message
+
+        Returns:
+            Selected relay
+        """
+        with self._lock:
+            candidates = [relay for relay in self.relays if relay not in exclude]
+            if not candidates:
+                raise ValueError("No relay left to try")
+            healthy = [relay for relay in candidates if relay.healthy]
+            candidates = healthy or candidates
+
+            total = sum(relay.weight for relay in candidates)
+            for relay in candidates:
+                relay.current += relay.weight
+            selected = max(candidates, key=lambda relay: relay.current)
+            selected.current -= total
+            return selected
+
+    def record_success(self, relay: Relay):
+        """
+        Record a send that the relay handled (even if it refused some recipients).
+
+        Args:
+            relay: Relay used
+        """
+        with self._lock:
+            relay.failures = 0
+            relay.healthy = True
+            relay.sent += 1
+
+    def record_failure(self, relay: Relay):
+        """
+        Record a connection-level failure and take the relay out of rotation at the threshold.
+
+        Args:
+            relay: Relay used
+        """
+        with self._lock:
+            relay.failures += 1
+            if relay.healthy and relay.failures >= self.failure_threshold:
+                relay.healthy = False
+                print(f"SMTP relay {relay.name} marked unhealthy after {relay.failures} failures")
+                if self._prober is None or not self._prober.is_alive():
+                    self._prober = threading.Thread(target=self._probe_loop, name="smtp-relay-probe",
+                                                    daemon=True)
+                    self._prober.start()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """
+        Get the state of every relay.
+
+        Returns:
+            Dictionary mapping relay names to weight, health, consecutive failures and sends
+        """
+        with self._lock:
+            return {relay.name: {"weight": relay.weight, "healthy": relay.healthy,
+                                 "failures": relay.failures, "sent": relay.sent}
+                    for relay in self.relays}
+
+    def probe(self, relay: Relay) -> bool:
+        """
+        Check whether a relay accepts SMTP sessions again.
+
+        Args:
+            relay: Relay to check
+
+        Returns:
+            True if the relay answered EHLO and NOOP
+        """
+        # Port 465 speaks implicit TLS from the first byte
+        smtp_class = smtplib.SMTP_SSL if relay.port == 465 else smtplib.SMTP
+        try:
+            session = smtp_class(relay.host, relay.port, timeout=self.probe_timeout)
+        except Exception:
+            return False
+        try:
+            session.ehlo()
+            return session.noop()[0] == 250
+        except Exception:
+            return False
+        finally:
+            try:
+                session.quit()
+            except Exception:
+                session.close()
+
+    def _probe_loop(self):
+        """Probe unhealthy relays until all of them recovered."""
+        while True:
+            with self._lock:
+                unhealthy = [relay for relay in self.relays if not relay.healthy]
+            if not unhealthy:
+                return
+
+            for relay in unhealthy:
+                if self.probe(relay):
+                    with self._lock:
+                        relay.healthy = True
+                        relay.failures = 0
+                    print(f"SMTP relay {relay.name} recovered")
+
+            time.sleep(self.probe_interval)
+
+def is_relay_failure(error: Exception) -> bool:
+    """
+    Tell whether a send error is caused by the relay rather than by the message.
+
+    Args:
+        error: Exception raised while sending
+
+    Returns:
+        True for connection errors, dropped sessions and 421 "service not available" replies
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError, OSError)):
+        return True
+    return getattr(error, "smtp_code", None) == 421
+
+def parse_relays(value: str, default_port: int = 587) -> List[Relay]:
+    """
+    Parse a relay list such as "smtp1.example.com:587:3,smtp2.example.com:587:1".
+
+    Args:
+        value: Comma-separated host[:port[:weight]] entries
+        default_port: Port used for entries without one
+
+    Returns:
+        List of relays
+    """
+    relays = []
+    for item in value.split(","):
+        parts = item.strip().split(":")
+        if not parts[0]:
+            continue
+        port = int(parts[1]) if len(parts) > 1 and parts[1] else default_port
+        weight = int(parts[2]) if len(parts) > 2 and parts[2] else 1
+        relays.append(Relay(parts[0], port, weight))
+    return relays
+
+# Pools by relay configuration, so that a changed environment gets its own pool
+_relay_pools: Dict[Tuple[str, int], RelayPool] = {}
+_relay_pools_lock = threading.Lock()
+
+def get_relay_pool(relays: Optional[str] = None, port: Optional[int] = None) -> RelayPool:
+    """
+    Get the relay pool for the current environment.
+
+    SMTP_RELAYS lists the relays as host:port:weight entries; without it the single
+    SMTP_SERVER/SMTP_PORT relay is used. SMTP_RELAY_FAILURES and SMTP_RELAY_PROBE_INTERVAL
+    set the failure threshold and the probe interval.
+
+    Args:
+        relays: Relay list overriding the environment (same format as SMTP_RELAYS)
+        port: Port of relays listed without one (default: SMTP_PORT)
+
+    Returns:
+        Shared RelayPool
+    """
+    port = port or int(os.getenv("SMTP_PORT", 587))
+    relays = relays or os.getenv("SMTP_RELAYS") or f"{os.getenv('SMTP_SERVER', 'smtp.example.com')}:{port}"
+    key = (relays, port)
+    with _relay_pools_lock:
+        pool = _relay_pools.get(key)
+        if pool is None:
+            pool = _relay_pools[key] = RelayPool(
+                parse_relays(relays, port),
+                failure_threshold=int(os.getenv("SMTP_RELAY_FAILURES", 3)),
+                probe_interval=float(os.getenv("SMTP_RELAY_PROBE_INTERVAL", 10))
+            )
+        return pool
@@ -47,3 +47,43 @@ def classified_emails(sample_emails):
         'with_attachments': [sample_emails[1]],
         'regular': [sample_emails[2]]
     }
+
+@pytest.fixture
+def smtp_sink():
+    """Fixture providing a local in-process SMTP sink."""
+    from smtp_sink import SMTPSink
+    sink = SMTPSink()
+    yield sink
+    sink.close()
+
+@pytest.fixture
+def fake_imap():
+    """Fixture providing an in-memory IMAP mailbox."""
+    from fake_imap import FakeIMAP
+    return FakeIMAP()
+
+@pytest.fixture
+def make_processor(tmp_path, monkeypatch, fake_imap):
+    """Fixture providing a factory of EmailProcessors that keep their state in tmp_path."""
+    import copy
+    import email_pipeline
+
+    monkeypatch.setattr(email_pipeline, 'EMAILS_DIR', tmp_path)
+
+    def factory(**overrides):
+        config = copy.deepcopy(email_pipeline.DEFAULT_EMAIL_CONFIG)
+        config['processing']['attachments_folder'] = str(tmp_path / 'attachments')
+        config['flows']['trigger_flow_on_email'] = False
+        for section, values in overrides.items():
+            config[section].update(values)
+
+        processor = email_pipeline.EmailProcessor(config)
+
+        def connect_imap():
+            processor.imap = fake_imap
+            return True
+
+        processor.connect_imap = connect_imap
+        return processor
+
+    return factory
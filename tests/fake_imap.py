@@ -0,0 +1,123 @@
+"""
+In-memory IMAP mailbox for tests.
+Implements the subset of imaplib.IMAP4 used by EmailProcessor on plain Python data.
+"""
+import threading
+from typing import Dict, List, Optional
+
+class FakeIMAP:
+    """Mailbox folders holding messages with flags, addressed by sequence number."""
+
+    def __init__(self):
+        self.folders: Dict[str, List[Dict]] = {"INBOX": []}
+        self.selected = "INBOX"
+        self.commands: List[str] = []
+        self.next_uid: Dict[str, int] = {"INBOX": 1}
+        self.lock = threading.Lock()
+
+    def deliver(self, raw: bytes, folder: str = "INBOX", flags: Optional[set] = None):
+        """Append a message to a folder."""
+        with self.lock:
+            self.folders.setdefault(folder, [])
+            uid = self.next_uid.get(folder, 1)
+            self.next_uid[folder] = uid + 1
+            self.folders[folder].append({"uid": uid, "raw": raw, "flags": set(flags or ())})
+
+    def login(self, username, password):
+        self.commands.append("LOGIN")
+        return "OK", [b"Logged in"]
+
+    def logout(self):
+        self.commands.append("LOGOUT")
+        return "BYE", [b"Logging out"]
+
+    def select(self, folder="INBOX"):
+        self.commands.append("SELECT")
+        self.selected = folder
+        return "OK", [str(len(self.folders.get(folder, []))).encode()]
+
+    def status(self, folder, items):
+        self.commands.append(f"STATUS {items}")
+        with self.lock:
+            uidnext = self.next_uid.get(folder, 1)
+            unseen = self.unseen(folder)
+        return "OK", [f'"{folder}" (UIDNEXT {uidnext} UNSEEN {unseen})'.encode()]
+
+    def close(self):
+        self.commands.append("CLOSE")
+        self.expunge()
+        return "OK", [b""]
+
+    def search(self, charset, criterion):
+        self.commands.append(f"SEARCH {criterion}")
+        with self.lock:
+            messages = self.folders[self.selected]
+            numbers = [str(i + 1) for i, message in enumerate(messages)
+                       if criterion != "UNSEEN" or "\\Seen" not in message["flags"]]
+        return "OK", [" ".join(numbers).encode()]
+
+    def fetch(self, msg_id, spec):
+        self.commands.append(f"FETCH {spec}")
+        with self.lock:
+            message = self.folders[self.selected][int(msg_id) - 1]
+            if "PEEK" not in spec:
+                message["flags"].add("\\Seen")
+            return "OK", [(f"{int(msg_id)} (BODY[] {{{len(message['raw'])}}}".encode(), message["raw"]), b")"]
+
+    def store(self, msg_id, command, flags):
+        self.commands.append(f"STORE {flags}")
+        with self.lock:
+            self.folders[self.selected][int(msg_id) - 1]["flags"].add(flags)
+        return "OK", [b""]
+
+    def copy(self, msg_id, folder):
+        self.commands.append("COPY")
+        message = self.folders[self.selected][int(msg_id) - 1]
+        self.deliver(message["raw"], folder, message["flags"] - {"\\Deleted"})
+        return "OK", [b""]
+
+    def uid(self, command, *args):
+        """UID variants of SEARCH, FETCH, STORE and COPY."""
+        command = command.upper()
+        if command == "SEARCH":
+            status, data = self.search(*args)
+            with self.lock:
+                messages = self.folders[self.selected]
+                uids = [str(messages[int(number) - 1]["uid"]) for number in data[0].split()]
+            return status, [" ".join(uids).encode()]
+
+        msg_id = self._sequence_number(args[0])
+        if msg_id is None:
+            return "OK", [None]
+        if command == "FETCH":
+            return self.fetch(msg_id, *args[1:])
+        if command == "STORE":
+            return self.store(msg_id, *args[1:])
+        if command == "COPY":
+            return self.copy(msg_id, *args[1:])
+        raise ValueError(f"Unsupported UID command: {command}")
+
+    def _sequence_number(self, uid) -> Optional[int]:
+        with self.lock:
+            for number, message in enumerate(self.folders[self.selected], 1):
+                if message["uid"] == int(uid):
+                    return number
+        return None
+
+    def expunge(self):
+        self.commands.append("EXPUNGE")
+        with self.lock:
+            self.folders[self.selected] = [message for message in self.folders[self.selected]
+                                           if "\\Deleted" not in message["flags"]]
+        return "OK", [b""]
+
+    def unseen(self, folder: str = "INBOX") -> int:
+        """Number of messages without the Seen flag."""
+        return sum(1 for message in self.folders.get(folder, []) if "\\Seen" not in message["flags"])
+
+def make_message(message_id: str, subject: str, sender: str = "client@example.com", body: str = "Hello") -> bytes:
+    """Build a raw RFC 822 message."""
+    headers = f"From: {sender}\r\nTo: inbox@example.org\r\nSubject: {subject}\r\n"
+    if message_id:
+        headers += f"Message-ID: {message_id}\r\n"
+    return (headers + "\r\n" + body + "\r\n").encode("utf-8")
@@ -0,0 +1,128 @@
+"""
+Local in-process SMTP sink for tests.
+Accepts mail on a random localhost port and records every command and message.
+"""
+import socketserver
+import threading
+from typing import Dict, List, Optional
+
+class SMTPSink:
+    """Threaded SMTP server that stores received messages instead of delivering them."""
+
+    def __init__(self, extensions: Optional[List[str]] = None):
+        """
+        Start the sink.
+
+        Args:
+            extensions: EHLO extensions to advertise (default: AUTH and PIPELINING)
+        """
+        self.extensions = extensions if extensions is not None else ["AUTH PLAIN LOGIN", "PIPELINING", "8BITMIME"]
+        self.messages: List[Dict] = []
+        self.commands: List[str] = []
+        self.connections = 0
+        # Replies forced by tests, e.g. {"RCPT": ["451 4.7.1 Try later"]}; each reply is used once.
+        # "DROP" closes the connection instead of replying (MAIL and DATA)
+        self.forced_replies: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with sink.lock:
+                    sink.connections += 1
+                sink._session(self.rfile, self.wfile)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """Stop the sink."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def command_count(self, verb: str) -> int:
+        """Return how many times a command was received."""
+        with self.lock:
+            return sum(1 for command in self.commands if command.split(" ", 1)[0].upper() == verb)
+
+    def _reply(self, verb: str, default: str) -> str:
+        with self.lock:
+            forced = self.forced_replies.get(verb)
+            if forced:
+                return forced.pop(0)
+        return default
+
+    def _session(self, rfile, wfile):
+        def send(line: str):
+            wfile.write(line.encode("utf-8") + b"\r\n")
+            wfile.flush()
+
+        send("220 localhost SMTP sink ready")
+        mail_from, rcpt_tos = None, []
+
+        while True:
+            raw = rfile.readline()
+            if not raw:
+                return
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            with self.lock:
+                self.commands.append(line)
+
+            if verb == "EHLO":
+                lines = ["localhost"] + self.extensions
+                for i, text in enumerate(lines):
+                    send(f"250{'-' if i < len(lines) - 1 else ' '}{text}")
+            elif verb == "HELO":
+                send("250 localhost")
+            elif verb == "AUTH":
+                if line.upper().startswith("AUTH LOGIN"):
+                    send("334 VXNlcm5hbWU6")
+                    rfile.readline()
+                    send("334 UGFzc3dvcmQ6")
+                    rfile.readline()
+                send("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                reply = self._reply("MAIL", "250 2.1.0 OK")
+                if reply == "DROP":
+                    return
+                if reply.startswith("250"):
+                    mail_from, rcpt_tos = line[10:].split(" ")[0].strip("<>"), []
+                send(reply)
+            elif verb == "RCPT":
+                reply = self._reply("RCPT", "250 2.1.5 OK")
+                if reply.startswith("250"):
+                    rcpt_tos.append(line[8:].split(" ")[0].strip("<>"))
+                send(reply)
+            elif verb == "DATA":
+                if mail_from is None or not rcpt_tos:
+                    send("503 5.5.1 No valid recipients")
+                    continue
+                send("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    chunk = rfile.readline()
+                    if chunk in (b".\r\n", b".\n", b""):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                with self.lock:
+                    self.messages.append({"mail_from": mail_from, "rcpt_tos": rcpt_tos, "data": b"".join(data)})
+                mail_from, rcpt_tos = None, []
+                reply = self._reply("DATA", "250 2.0.0 Queued")
+                if reply == "DROP":
+                    return
+                send(reply)
+            elif verb == "RSET":
+                mail_from, rcpt_tos = None, []
+                send("250 2.0.0 OK")
+            elif verb == "NOOP":
+                send(self._reply("NOOP", "250 2.0.0 OK"))
+            elif verb == "QUIT":
+                send("221 2.0.0 Bye")
+                return
+            else:
+                send("502 5.5.2 Command not implemented")
@@ -11,6 +11,8 @@ from mock_taskinity import mock_run_flow_from_dsl
 
 # Now we can safely import flow
 import flow
+from flow_runner import parse_flow_dsl, run_flow_locally, stream_email_flow
+from flow_planner import parse_dsl, plan_flow, record_durations
 
 class TestEmailFlow:
     """Test suite for the email processing flow."""
@@ -39,3 +41,126 @@ class TestEmailFlow:
         assert 'process_emails_with_attachments' in flow_dsl
         assert 'process_regular_emails' in flow_dsl
         assert 'send_responses' in flow_dsl
+
+    def test_parse_flow_dsl(self):
+        """Test that the email flow DSL is parsed into task dependencies."""
+        dependencies = parse_flow_dsl(flow.EMAIL_PROCESSING_DSL)
+
+        assert dependencies['fetch_emails'] == []
+        assert dependencies['process_support_emails'] == ['classify_emails']
+        assert dependencies['send_responses'] == [
+            'process_urgent_emails',
+            'process_emails_with_attachments',
+            'process_support_emails',
+            'process_order_emails',
+            'process_regular_emails'
+        ]
+
+    def test_run_flow_locally_runs_branches_concurrently(self):
+        """Test that independent branches run concurrently and are joined in declaration order."""
+        import time
+
+        def left(left):
+            time.sleep(0.3)
+            return [f"left:{item}" for item in left]
+
+        def right(right):
+            time.sleep(0.3)
+            return [f"right:{item}" for item in right]
+
+        task_functions = {
+            'load': lambda limit: {'left': list(range(limit)), 'right': ['x']},
+            'left': left,
+            'right': right,
+            'join': lambda left, right: left + right
+        }
+        dsl = """
+        flow Example:
+            load -> left
+            load -> right
+            left -> join
+            right -> join
+        """
+
+        start = time.time()
+        results = run_flow_locally(dsl, {'limit': 2, 'unused': True}, task_functions)
+
+        assert time.time() - start < 0.55
+        assert results['join'] == ['left:0', 'left:1', 'right:x']
+        assert results['status'] == 'success'
+        assert results['task_durations']['left'] >= 0.3
+
+    def test_stream_email_flow(self, monkeypatch):
+        """Test that streaming mode sends every response as soon as it is ready."""
+        monkeypatch.setenv('MOCK_EMAILS', 'true')
+        sent = []
+
+        results = stream_email_flow({'server': 'imap.example.com', 'username': 'user', 'password': 'secret'},
+                                    queue_size=1, send=lambda response: sent.append(response) or True)
+
+        assert results['total_attempted'] == len(sent) == 4
+        assert results['total_sent'] == 4
+        assert results['sent_urgent'] == 1 and results['sent_attachments'] == 1
+        assert results['first_reply_seconds'] <= results['duration']
+
+    def test_stream_email_flow_with_micro_batches(self, monkeypatch):
+        """Test that micro-batching runs the process_* tasks on batches of classified emails."""
+        monkeypatch.setenv('MOCK_EMAILS', 'true')
+        monkeypatch.setattr('time.sleep', lambda seconds: None)
+
+        results = stream_email_flow({'server': 'imap.example.com', 'username': 'user', 'password': 'secret'},
+                                    send=lambda response: True, batch_size=10, batch_delay_ms=1000)
+
+        assert results['total_sent'] == 4
+        assert results['batching']['batches'] == 1
+        assert results['batching']['flush_reasons']['close'] == 1
+
+    def test_stream_email_flow_closes_source_on_error(self, monkeypatch):
+        """Test that a failing consumer stops the producers and closes the fetch generator."""
+        import threading
+        closed = threading.Event()
+
+        def iter_emails(**kwargs):
+            try:
+                for index in range(100):
+                    yield {'id': str(index), 'subject': f'Hello {index}', 'body': '', 'from': 'a@example.com'}
+            finally:
+                closed.set()
+
+        def send(response):
+            raise RuntimeError("send failed")
+
+        monkeypatch.setattr(sys.modules['tasks.fetch_emails'], 'iter_emails', iter_emails)
+
+        with pytest.raises(RuntimeError):
+            stream_email_flow({'server': 'imap.example.com'}, queue_size=1, send=send)
+
+        assert closed.wait(2)
+
+    def test_plan_flow_dsl_formats_agree(self):
+        """Test that flow.dsl and EMAIL_PROCESSING_DSL produce the same plan."""
+        with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flow.dsl'), 'r') as f:
+            block_dependencies = parse_dsl(f.read())
+
+        assert block_dependencies == parse_dsl(flow.EMAIL_PROCESSING_DSL)
+
+        plan = plan_flow(flow.EMAIL_PROCESSING_DSL)
+        assert plan['parallelism'] == [1, 1, 1, 1, 5, 1]
+        assert plan['max_parallelism'] == 5
+        assert plan['levels'][4][0] == 'process_urgent_emails'
+        assert plan['critical_path_duration'] == 6.0
+
+    def test_plan_flow_critical_path_uses_durations(self, tmp_path):
+        """Test that the critical path follows the slowest branch and cycles are rejected."""
+        history = tmp_path / 'durations.json'
+        record_durations({'process_order_emails': 4.0, 'classify_emails': 2.0}, history)
+        durations = record_durations({'process_order_emails': 2.0}, history, alpha=0.5)
+
+        plan = plan_flow(flow.EMAIL_PROCESSING_DSL, durations)
+
+        assert plan['critical_path'][3:] == ['classify_emails', 'process_order_emails', 'send_responses']
+        assert plan['critical_path_duration'] == 3 * 1.0 + 2.0 + 3.0 + 1.0
+        assert 'process_order_emails' not in plan['estimated']
+
+        with pytest.raises(ValueError):
+            plan_flow("a -> b\nb -> c\nc -> a")
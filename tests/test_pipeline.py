@@ -0,0 +1,535 @@
+import pytest
+import json
+import sys
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import email_pipeline
+from config_watcher import ConfigWatcher
+from cooldown_cache import CooldownCache
+from email_workers import ShardLeases
+from flow_dispatch import FlowDispatcher, FlowRouter, FlowTimeout
+from inbound_ledger import BloomFilter, InboundLedger
+from poll_scheduler import PollScheduler
+from reply_history import ReplyHistory
+from fake_imap import make_message
+
+class TestEmailPipeline:
+    """Test suite for the email pipeline building blocks."""
+
+    def test_reply_history_cooldown_and_compaction(self, tmp_path):
+        """Test that the reply history tracks cooldowns per sender and drops expired entries."""
+        history = ReplyHistory(tmp_path / 'replied_to.db', cooldown_seconds=3600, compact_interval=0)
+        now = time.time()
+        history.record('old@example.com', now - 7200)
+        history.record('new@example.com', now - 60)
+        history.record('new@example.com', now - 600)  # an older write never wins
+
+        assert history.in_cooldown('new@example.com')
+        assert not history.in_cooldown('old@example.com')
+        assert history.active() == {'new@example.com': pytest.approx(now - 60)}
+        assert history.compact() == 1
+        assert history.last_reply('old@example.com') is None
+
+    def test_reply_history_claims_each_reply_once(self, tmp_path):
+        """Test that only one of several processes claims a reply to a sender within the cooldown."""
+        first = ReplyHistory(tmp_path / 'replied_to.db', cooldown_seconds=3600, compact_interval=0)
+        second = ReplyHistory(tmp_path / 'replied_to.db', cooldown_seconds=3600, compact_interval=0)
+        now = time.time()
+
+        assert first.claim('a@example.com', now)
+        assert not second.claim('a@example.com', now)
+        assert not second.claim('a@example.com', now + 60)
+
+        # A failed send releases the claim, so the reply can be retried
+        first.release('a@example.com', now)
+        assert second.claim('a@example.com', now + 60)
+
+        # After the cooldown the sender can be replied to again
+        assert first.claim('a@example.com', now + 60 + 3600)
+        assert first.last_reply('a@example.com') == pytest.approx(now + 60 + 3600)
+
+    def test_reply_history_is_shared_and_migrates_json(self, tmp_path):
+        """Test that separate instances see each other's replies and legacy JSON is imported once."""
+        legacy = tmp_path / 'replied_to.json'
+        legacy.write_text(json.dumps({
+            'recent@example.com': (datetime.now() - timedelta(minutes=5)).isoformat(),
+            'stale@example.com': (datetime.now() - timedelta(days=3)).isoformat()
+        }))
+        first = ReplyHistory(tmp_path / 'replied_to.db', compact_interval=0)
+        second = ReplyHistory(tmp_path / 'replied_to.db', compact_interval=0)
+
+        assert first.import_json(legacy) == 1
+        assert not legacy.exists()
+        first.record('a@example.com')
+
+        assert set(second.active()) == {'recent@example.com', 'a@example.com'}
+
+    def test_cooldown_cache_expiry_and_lru(self):
+        """Test that the cooldown cache expires senders by time and evicts the least recently used."""
+        cache = CooldownCache(cooldown_seconds=100, max_size=2)
+        now = time.time()
+        assert cache.load({'stale@example.com': now - 500, 'a@example.com': now - 50}, now) == 1
+
+        cache.add('b@example.com', now - 10)
+        assert cache.in_cooldown('a@example.com', now)  # a becomes the most recently used
+        cache.add('c@example.com', now)
+        assert 'b@example.com' not in cache
+        assert cache.evicted == 1
+
+        assert cache.get('a@example.com', now + 60) is None  # past its cooldown
+        assert cache.get('c@example.com', now + 60) == now
+
+    def test_cooldown_cache_reconfigure_applies_to_stored_senders(self):
+        """Test that a shorter cooldown and a smaller size take effect for senders already cached."""
+        cache = CooldownCache(cooldown_seconds=24 * 3600, max_size=10)
+        now = time.time()
+        for index, age in enumerate([7200, 1800, 600]):
+            cache.add(f'{index}@example.com', now - age)
+
+        cache.reconfigure(3600, 1, now)
+
+        assert not cache.in_cooldown('0@example.com', now)  # answered 2h ago, cooldown now 1h
+        assert not cache.in_cooldown('1@example.com', now)
+        assert len(cache) == 1 and cache.in_cooldown('2@example.com', now)
+        assert cache.evicted == 1
+
+    def test_config_watcher_reloads_changed_file(self, tmp_path):
+        """Test that config changes are compiled on the next poll and invalid files are ignored."""
+        config = {
+            'auto_reply': {
+                'criteria': {'from_domains': ['Example.com'], 'subject_contains': ['Pilne'],
+                             'priority_keywords': ['asap']},
+                'templates': {'default': 'Thanks.'},
+                'signature': '\n-- Team'
+            },
+            'flows': {'flow_mapping': {'order': 'order_processing.dsl'}}
+        }
+        path = tmp_path / 'email_config.json'
+        path.write_text(json.dumps(config))
+        watcher = ConfigWatcher(path)
+
+        compiled = watcher.poll()
+        assert compiled.from_domains == {'example.com'}
+        assert compiled.subject_matcher.search('re: pilne zamówienie')
+        assert compiled.reply_bodies == {'default': 'Thanks.\n-- Team'}
+        assert compiled.flow_mapping == (('order', 'order_processing.dsl'),)
+        assert watcher.poll() is None
+
+        config['auto_reply']['templates']['default'] = 'Thank you for your message.'
+        path.write_text(json.dumps(config))
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        assert watcher.poll().reply_bodies['default'] == 'Thank you for your message.\n-- Team'
+
+        path.write_text('{"auto_reply": ')
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 2 * 10**9))
+        assert watcher.poll() is None
+
+    def test_inbound_ledger_stages_only_advance(self, tmp_path):
+        """Test that ledger stages never move back and survive reopening."""
+        ledger = InboundLedger(tmp_path / 'inbound.db')
+        assert ledger.get('<a@example.com>') is None
+
+        ledger.advance('<a@example.com>', 'classified', 'support')
+        ledger.advance('<a@example.com>', 'replied')
+        ledger.advance('<a@example.com>', 'fetched')
+
+        reopened = InboundLedger(tmp_path / 'inbound.db')
+        assert reopened.get('<a@example.com>') == ('replied', 'support')
+        assert reopened.unfinished() == [('<a@example.com>', 'replied')]
+        assert not reopened.is_done('<a@example.com>')
+
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f'<{i}@example.com>')
+        assert all(f'<{i}@example.com>' in bloom for i in range(1000))
+        assert sum(f'<{i}@other.org>' in bloom for i in range(1000)) < 50
+
+    def test_inbound_ledger_compaction_resizes_bloom_filter(self, tmp_path):
+        """Test that the ledger grows its Bloom filter with the rows and drops old finished entries."""
+        ledger = InboundLedger(tmp_path / 'inbound.db', bloom_capacity=4, retention_seconds=3600,
+                               compact_interval=0)
+        for i in range(10):
+            ledger.advance(f'<{i}@example.com>', 'archived')
+        ledger.advance('<open@example.com>', 'classified', '')
+        assert ledger._bloom.capacity >= 11
+        assert all(ledger.is_done(f'<{i}@example.com>') for i in range(10))
+
+        assert ledger.compact(now=time.time() + 600) == 0
+        assert ledger.compact(now=time.time() + 7200) == 10
+        assert ledger._bloom.capacity == 4
+        assert ledger.get('<0@example.com>') is None
+        assert ledger.unfinished() == [('<open@example.com>', 'classified')]
+
+    def test_processor_resumes_after_crash_without_replying_twice(self, make_processor, fake_imap):
+        """Test that a restarted processor continues an interrupted email from the stage it reached."""
+        fake_imap.deliver(make_message('<1@example.com>', 'Pytanie o zamowienie'))
+        fake_imap.deliver(make_message('<2@example.com>', 'Newsletter', sender='news@other.org'))
+
+        class Crash(BaseException):
+            pass
+
+        replies = []
+
+        def send_auto_reply(email_data, template_key):
+            replies.append((email_data['message_id'], template_key))
+            return True
+
+        def crash(emails):
+            raise Crash()
+
+        first = make_processor()
+        first.send_auto_reply = send_auto_reply
+        first.trigger_flows = crash
+        with pytest.raises(Crash):
+            first.process_emails()
+        assert fake_imap.unseen() == 2
+
+        second = make_processor()
+        second.send_auto_reply = send_auto_reply
+        second.process_emails()
+
+        assert replies == [('<1@example.com>', 'default')]
+        assert fake_imap.unseen() == 0
+        assert len(fake_imap.folders['Processed']) == 2
+        assert second.ledger.is_done('<1@example.com>') and second.ledger.is_done('<2@example.com>')
+
+        # A redelivered copy is archived without being processed again
+        fake_imap.deliver(make_message('<1@example.com>', 'Pytanie o zamowienie'))
+        second.process_emails()
+        assert len(replies) == 1
+        assert fake_imap.unseen() == 0
+
+    def test_retried_email_is_not_saved_again(self, make_processor, fake_imap, tmp_path):
+        """Test that the message file of an email already FETCHED is not written again on retry."""
+        fake_imap.deliver(make_message('<1@example.com>', 'Pytanie'))
+        processor = make_processor()
+
+        def classify_and_reply(email_data):
+            raise RuntimeError('stage failed')
+
+        processor.classify_and_reply = classify_and_reply
+        assert processor.process_emails() == 0
+        assert processor.ledger.get('<1@example.com>')[0] == 'fetched'
+        saved = tmp_path / '1.eml'
+        assert saved.read_bytes() == make_message('<1@example.com>', 'Pytanie')
+        saved.unlink()
+
+        del processor.classify_and_reply
+        processor.send_auto_reply = lambda email_data, template_key: True
+        assert processor.process_emails() == 1
+        assert not saved.exists()
+        assert processor.ledger.is_done('<1@example.com>')
+
+    def test_reply_is_retried_until_sent_and_not_resent_after_cooldown(self, make_processor, fake_imap):
+        """Test that a failed auto-reply is retried next cycle and a stored decision respects the cooldown."""
+        fake_imap.deliver(make_message('<1@example.com>', 'Pytanie'))
+        outcomes = [False, True]
+        replies = []
+
+        def send_auto_reply(email_data, template_key):
+            replies.append(email_data['message_id'])
+            return outcomes.pop(0)
+
+        processor = make_processor()
+        processor.send_auto_reply = send_auto_reply
+        assert processor.process_emails() == 0
+        assert processor.ledger.get('<1@example.com>') == ('classified', 'default')
+        assert fake_imap.unseen() == 1
+
+        processor.process_emails()
+        assert replies == ['<1@example.com>', '<1@example.com>']
+        assert processor.ledger.is_done('<1@example.com>')
+
+        # Crash after the reply was claimed but before the stage was: the reply is not sent again
+        fake_imap.deliver(make_message('<2@example.com>', 'Pytanie', sender='other@example.com'))
+        processor.ledger.advance('<2@example.com>', 'classified', 'default')
+        assert processor.claim_reply('other@example.com') is not None
+        processor.process_emails()
+        assert len(replies) == 2
+        assert processor.ledger.is_done('<2@example.com>')
+
+    def test_poll_skips_unchanged_mailbox_and_backs_off(self, make_processor, fake_imap):
+        """Test that polling runs a full cycle only after the STATUS probe sees a change."""
+        processor = make_processor()
+        processor.send_auto_reply = lambda email_data, template_key: True
+        fake_imap.deliver(make_message('<1@example.com>', 'Pytanie'))
+
+        assert processor.poll()
+        assert not processor.poll()  # empty full cycle records the idle mailbox state
+        fake_imap.commands.clear()
+        assert not processor.poll()
+        assert fake_imap.commands == ['STATUS (UIDNEXT UNSEEN)']
+
+        fake_imap.deliver(make_message('<2@example.com>', 'Pytanie'))
+        assert processor.poll()
+        assert fake_imap.unseen() == 0
+
+        scheduler = PollScheduler(min_interval=10, max_interval=80, jitter=0.1, rng=random.Random(1))
+        delays = [scheduler.idle() for _ in range(5)]
+        assert scheduler.interval == 80
+        assert 18 <= delays[0] <= 22 and 72 <= delays[-1] <= 88
+        assert 9 <= scheduler.active() <= 11
+
+    def test_shard_leases_are_exclusive_until_expiry(self, tmp_path):
+        """Test that a shard lease has one owner and passes on after expiry or release."""
+        leases = ShardLeases(tmp_path / 'leases.db', ttl=0.2)
+        assert leases.acquire('worker-a', [0, 1]) == [0, 1]
+        assert leases.acquire('worker-b', [0, 1]) == []
+
+        assert leases.release('worker-a') == 2
+        assert leases.acquire('worker-b', [0]) == [0]
+
+        time.sleep(0.3)
+        assert leases.renew('worker-b') == []
+        assert leases.acquire('worker-c', [0]) == [0]
+
+    def test_sharded_processors_split_the_mailbox(self, make_processor, fake_imap):
+        """Test that processors handle only the UIDs of their own shard."""
+        for i in range(6):
+            fake_imap.deliver(make_message(f'<{i}@example.com>', 'Pytanie', sender=f'client{i}@example.com'))
+
+        handled = {}
+        for shard in (0, 1):
+            processor = make_processor()
+            processor.shards = (frozenset([shard]), 2)
+            processor.send_auto_reply = lambda email_data, template_key, shard=shard: \
+                handled.setdefault(shard, []).append(int(email_data['id'])) or True
+            processor.process_emails()
+
+        assert handled == {0: [2, 4, 6], 1: [1, 3, 5]}
+        assert fake_imap.unseen() == 0
+
+    def test_stages_overlap_with_bounded_queues(self, make_processor, fake_imap):
+        """Test that fetching overlaps with replying and is held back when the reply queue is full."""
+        for i in range(5):
+            fake_imap.deliver(make_message(f'<{i}@example.com>', 'Pytanie', sender=f'client{i}@example.com'))
+
+        processor = make_processor(processing={'stage_queue_size': 1})
+        events = []
+        threads = set()
+        parse = processor.process_email_message
+
+        def process_email_message(*args, **kwargs):
+            email_data = parse(*args, **kwargs)
+            events.append(('fetched', email_data['id']))
+            return email_data
+
+        def send_auto_reply(email_data, template_key):
+            threads.add(threading.current_thread().name)
+            time.sleep(0.05)
+            events.append(('replied', email_data['id']))
+            return True
+
+        def trigger_flows(emails):
+            threads.add(threading.current_thread().name)
+            events.extend(('triggered', email_data['id']) for email_data in emails)
+
+        processor.process_email_message = process_email_message
+        processor.send_auto_reply = send_auto_reply
+        processor.trigger_flows = trigger_flows
+
+        assert processor.process_emails() == 5
+        assert threads == {'email-reply', 'email-flow'}
+        assert fake_imap.unseen() == 0
+
+        # Message 2 is fetched while message 1 is being answered...
+        assert events.index(('fetched', '2')) < events.index(('replied', '1'))
+        # ...but with one queue slot, message 4 has to wait until message 1 has been answered
+        assert events.index(('replied', '1')) < events.index(('fetched', '4'))
+        assert [event for event in events if event[0] == 'triggered'] == [('triggered', str(i)) for i in range(1, 6)]
+
+    def test_flows_are_routed_cached_and_run_once_per_key(self, make_processor, tmp_path, monkeypatch):
+        """Test that each flow runs once per batch for all matching emails, from a cached definition."""
+        import flow_dispatch
+
+        router = FlowRouter({'support': 'support.dsl', 'order': 'order.dsl', 'port': 'port.dsl'})
+        assert router.route('Order status', 'need SUPPORT') == 'support'
+        assert router.route('Re: reorder', '') == 'order'
+        assert router.route('Report', 'transport') == 'port'
+        assert router.route('Hello', 'nothing here') is None
+
+        (tmp_path / 'support.dsl').write_text('flow Support: a -> b')
+        monkeypatch.setattr(email_pipeline, 'FLOWS_DIR', tmp_path)
+        reads = []
+        real_open = open
+        monkeypatch.setattr(flow_dispatch, 'open', lambda path, *args: reads.append(path) or real_open(path, *args),
+                            raising=False)
+        runs = []
+        monkeypatch.setattr(email_pipeline, 'get_flow_runner',
+                            lambda: lambda dsl, input_data: runs.append((dsl, [e['id'] for e in input_data['emails']])))
+
+        processor = make_processor(flows={'trigger_flow_on_email': True,
+                                          'flow_mapping': {'support': 'support.dsl', 'order': 'missing.dsl'}})
+        emails = [{'id': str(i), 'subject': subject, 'body': '', 'from': 'a@example.com', 'to': '', 'date': ''}
+                  for i, subject in enumerate(['Support needed', 'New order', 'support again', 'Hi'])]
+
+        processor.trigger_flows(emails)
+        processor.trigger_flows(emails[:1])
+        assert processor.flow_dispatcher.wait(timeout=5)
+        assert runs == [('flow Support: a -> b', ['0', '2']), ('flow Support: a -> b', ['0'])]
+        assert len(reads) == 1
+
+    def test_email_is_archived_only_after_its_flow_finishes(self, make_processor, fake_imap, tmp_path, monkeypatch):
+        """Test that TRIGGERED is recorded when the flow ends and a failed flow is run again."""
+        (tmp_path / 'support.dsl').write_text('flow Support: a -> b')
+        monkeypatch.setattr(email_pipeline, 'FLOWS_DIR', tmp_path)
+        release = threading.Event()
+        runs = []
+
+        def run(dsl, input_data):
+            runs.append([e['subject'] for e in input_data['emails']])
+            assert release.wait(timeout=5)
+            if len(runs) == 1:
+                raise RuntimeError('flow failed')
+
+        monkeypatch.setattr(email_pipeline, 'get_flow_runner', lambda: run)
+        processor = make_processor(flows={'trigger_flow_on_email': True, 'flow_mapping': {'support': 'support.dsl'}})
+        processor.send_auto_reply = lambda email_data, template_key: True
+        fake_imap.deliver(make_message('<1@example.com>', 'Support needed'))
+
+        assert not processor.poll()
+        assert processor.ledger.get('<1@example.com>')[0] == 'replied'
+        assert fake_imap.unseen() == 1
+        assert not processor.poll()  # still running: not triggered again
+        release.set()
+        assert processor.flow_dispatcher.wait(timeout=5)
+        assert processor.ledger.get('<1@example.com>')[0] == 'replied'
+
+        # The failed flow is submitted again although the mailbox has not changed
+        processor.poll()
+        assert processor.flow_dispatcher.wait(timeout=5)
+        assert processor.ledger.get('<1@example.com>')[0] in ('triggered', 'archived')
+        processor.poll()
+        assert processor.ledger.is_done('<1@example.com>')
+        assert fake_imap.unseen() == 0
+        assert runs == [['Support needed'], ['Support needed']]
+
+    def test_emails_in_flight_are_not_fetched_again(self, make_processor, fake_imap, tmp_path, monkeypatch):
+        """Test that an email waiting for its flow takes no batch slot and is archived without a new fetch."""
+        (tmp_path / 'support.dsl').write_text('flow Support: a -> b')
+        monkeypatch.setattr(email_pipeline, 'FLOWS_DIR', tmp_path)
+        release = threading.Event()
+        monkeypatch.setattr(email_pipeline, 'get_flow_runner', lambda: lambda dsl, input_data: release.wait(timeout=5))
+        processor = make_processor(flows={'trigger_flow_on_email': True, 'flow_mapping': {'support': 'support.dsl'}},
+                                   processing={'max_emails_per_batch': 1})
+        processor.send_auto_reply = lambda email_data, template_key: True
+        fake_imap.deliver(make_message('<1@example.com>', 'Support needed'))
+        fake_imap.deliver(make_message('<2@example.com>', 'Pytanie'))
+
+        assert processor.process_emails(keep_imap=True) == 0
+        assert '<1@example.com>' in processor.flows_in_flight
+        fake_imap.commands.clear()
+        assert processor.process_emails(keep_imap=True) == 1
+        assert fake_imap.commands.count('FETCH (BODY.PEEK[])') == 1
+        assert processor.ledger.is_done('<2@example.com>')
+
+        release.set()
+        assert processor.flow_dispatcher.wait(timeout=5)
+        fake_imap.commands.clear()
+        assert processor.process_emails(keep_imap=True) == 1
+        assert 'FETCH (BODY.PEEK[])' not in fake_imap.commands
+        assert processor.ledger.is_done('<1@example.com>')
+        assert fake_imap.unseen() == 0
+
+    def test_timed_out_flow_is_not_submitted_again_while_running(self, make_processor, fake_imap, tmp_path,
+                                                                  monkeypatch):
+        """Test that emails of a timed-out flow stay in flight until the flow really returns."""
+        (tmp_path / 'support.dsl').write_text('flow Support: a -> b')
+        monkeypatch.setattr(email_pipeline, 'FLOWS_DIR', tmp_path)
+        release = threading.Event()
+        runs = []
+
+        def run(dsl, input_data):
+            runs.append([e['subject'] for e in input_data['emails']])
+            assert release.wait(timeout=5)
+
+        monkeypatch.setattr(email_pipeline, 'get_flow_runner', lambda: run)
+        processor = make_processor(flows={'trigger_flow_on_email': True, 'flow_mapping': {'support': 'support.dsl'},
+                                          'timeout_seconds': 0.05})
+        processor.send_auto_reply = lambda email_data, template_key: True
+        fake_imap.deliver(make_message('<1@example.com>', 'Support needed'))
+
+        assert processor.process_emails(keep_imap=True) == 0
+        time.sleep(0.2)  # past the timeout, the flow is still running
+        assert '<1@example.com>' in processor.flows_in_flight
+        assert processor.process_emails(keep_imap=True) == 0
+        assert len(runs) == 1
+
+        release.set()
+        assert processor.flow_dispatcher.wait(timeout=5)
+        assert processor.ledger.get('<1@example.com>')[0] == 'triggered'
+        assert processor.process_emails(keep_imap=True) == 1
+        assert fake_imap.unseen() == 0
+        assert runs == [['Support needed']]
+
+    def test_flow_dispatcher_limits_concurrency_and_times_out(self):
+        """Test that flows run off the caller's thread within per-flow limits and report timeouts."""
+        dispatcher = FlowDispatcher(max_workers=4, default_limit=1, limits={'support': 2}, timeout=0.3)
+        active = {'support': 0, 'order': 0, 'slow': 0}
+        peak = {'support': 0, 'order': 0, 'slow': 0}
+        lock = threading.Lock()
+        release = threading.Event()
+        results = []
+
+        def flow(key, seconds):
+            with lock:
+                active[key] += 1
+                peak[key] = max(peak[key], active[key])
+            release.wait(seconds)
+            with lock:
+                active[key] -= 1
+            return key
+
+        started = time.time()
+        futures = [dispatcher.submit(key, flow, key, 0.1, callback=lambda *args: results.append(args))
+                   for key in ['support'] * 4 + ['order'] * 2]
+        slow = dispatcher.submit('slow', flow, 'slow', 5, callback=lambda *args: results.append(args))
+        assert time.time() - started < 0.1
+
+        assert [future.result(timeout=5) for future in futures] == ['support'] * 4 + ['order'] * 2
+        with pytest.raises(FlowTimeout):
+            slow.result(timeout=5)
+        assert peak == {'support': 2, 'order': 1, 'slow': 1}
+        assert ('slow', None) == results[-1][:2] and isinstance(results[-1][2], FlowTimeout)
+
+        release.set()
+        assert dispatcher.wait(timeout=5)
+        dispatcher.shutdown()
+
+    def test_auto_reply_uses_shared_delivery_path(self, make_processor, smtp_sink, monkeypatch):
+        """Test that auto-replies go through the relay pool and rate limiter of tasks.send_emails."""
+        import email as email_module
+        from tasks.rate_limit import AdaptiveRateLimiter
+        limiter = AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000)
+        monkeypatch.setattr('tasks.rate_limit._limiter', limiter)
+        monkeypatch.delenv('SMTP_RELAYS', raising=False)
+        processor = make_processor(smtp={'server': smtp_sink.host, 'port': smtp_sink.port, 'username': '',
+                                         'password': '', 'use_tls': False, 'from_email': 'inbox@example.org'})
+        raw = make_message('<1@example.com>', 'Pytanie', sender='client@example.com')
+        email_data = {'from': 'client@example.com', 'subject': 'Pytanie', 'date': '', 'body': 'Hello',
+                      'raw_email': email_module.message_from_bytes(raw)}
+
+        assert processor.send_auto_reply(email_data, 'default')
+
+        assert [message['rcpt_tos'] for message in smtp_sink.messages] == [['client@example.com']]
+        assert f'{smtp_sink.host}:{smtp_sink.port}' in limiter.metrics()['relays']
+
+    def test_helper_module_logs_reach_pipeline_logger(self):
+        """Test that stdlib logging from the helper modules is forwarded to the pipeline logger."""
+        import config_watcher
+        messages = []
+        sink = email_pipeline.logger.add(lambda message: messages.append(message.record), level='DEBUG')
+        try:
+            config_watcher.logger.warning('Nieprawidłowa konfiguracja')
+        finally:
+            email_pipeline.logger.remove(sink)
+
+        assert [(record['level'].name, record['message']) for record in messages] == \
+            [('WARNING', '[config_watcher] Nieprawidłowa konfiguracja')]
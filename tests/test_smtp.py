@@ -0,0 +1,285 @@
+import pytest
+import smtplib
+import sys
+import os
+
+# Add the parent directory to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Import our mock Taskinity module first
+from mock_taskinity import mock_task
+
+from tasks.smtp_pool import SMTPConnectionPool, SMTPDeliveryUncertain
+from tasks.send_emails import send_bulk_emails, send_email
+from tasks.rate_limit import AdaptiveRateLimiter, TokenBucket
+from tasks.async_smtp import AsyncSMTPPool
+
+class TestSMTPDelivery:
+    """Test suite for SMTP delivery against a local SMTP sink."""
+    
+    def test_pool_reuses_sessions(self, smtp_sink):
+        """Test that consecutive sends share one authenticated session reset with RSET."""
+        pool = SMTPConnectionPool(smtp_sink.host, smtp_sink.port, 'user', 'secret', use_tls=False)
+        
+        for i in range(3):
+            pool.sendmail('noreply@example.com', [f'user{i}@example.com'], f'Subject: {i}\r\n\r\nBody {i}')
+        pool.close()
+        
+        assert len(smtp_sink.messages) == 3
+        assert smtp_sink.connections == 1
+        assert smtp_sink.command_count('AUTH') == 1
+        assert smtp_sink.command_count('RSET') == 3
+        assert pool.stats()['reused'] == 2
+    
+    def test_pool_replaces_dead_sessions(self, smtp_sink):
+        """Test that a session failing NOOP is replaced transparently."""
+        pool = SMTPConnectionPool(smtp_sink.host, smtp_sink.port, use_tls=False, noop_after=0)
+        
+        pool.sendmail('noreply@example.com', ['a@example.com'], 'Subject: a\r\n\r\nA')
+        smtp_sink.forced_replies['NOOP'] = ['421 4.4.2 Timeout']
+        pool.sendmail('noreply@example.com', ['b@example.com'], 'Subject: b\r\n\r\nB')
+        pool.close()
+        
+        assert len(smtp_sink.messages) == 2
+        assert smtp_sink.connections == 2
+        assert pool.stats()['replaced'] == 1
+    
+    def test_pool_resends_only_before_message_data(self, smtp_sink):
+        """Test that a drop before DATA is retried, but a drop after the message data is not."""
+        import asyncio
+        pool = SMTPConnectionPool(smtp_sink.host, smtp_sink.port, use_tls=False)
+        
+        smtp_sink.forced_replies['MAIL'] = ['DROP']
+        pool.sendmail('noreply@example.com', ['a@example.com'], 'Subject: a\r\n\r\nA')
+        smtp_sink.forced_replies['DATA'] = ['DROP']
+        with pytest.raises(SMTPDeliveryUncertain):
+            pool.sendmail('noreply@example.com', ['b@example.com'], 'Subject: b\r\n\r\nB')
+        pool.close()
+        
+        async def send_async():
+            async_pool = AsyncSMTPPool(smtp_sink.host, smtp_sink.port, use_tls=False)
+            try:
+                await async_pool.sendmail('noreply@example.com', ['c@example.com'], 'Subject: c\r\n\r\nC')
+            finally:
+                await async_pool.close()
+        
+        smtp_sink.forced_replies['DATA'] = ['DROP']
+        with pytest.raises(SMTPDeliveryUncertain):
+            asyncio.run(send_async())
+        
+        # Every message reached the server exactly once
+        assert [m['rcpt_tos'] for m in smtp_sink.messages] == [['a@example.com'], ['b@example.com'], ['c@example.com']]
+        assert smtp_sink.command_count('DATA') == 3
+    
+    def test_send_bulk_emails_concurrently(self, smtp_sink, monkeypatch):
+        """Test that bulk sends run concurrently within the per-relay connection limit."""
+        monkeypatch.setenv('SMTP_SERVER', smtp_sink.host)
+        monkeypatch.setenv('SMTP_PORT', str(smtp_sink.port))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('SMTP_POOL_SIZE', '2')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        monkeypatch.setattr('tasks.rate_limit._limiter', AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000))
+        recipients = [f'user{i}@example.com' for i in range(8)]
+        
+        result = send_bulk_emails(recipients, 'Hello {name}', 'Hi {name}', 'noreply@example.com',
+                                  max_workers=4)
+        
+        assert result == {'total_recipients': 8, 'sent': 8, 'failed': 0}
+        assert sorted(m['rcpt_tos'][0] for m in smtp_sink.messages) == sorted(recipients)
+        assert smtp_sink.connections <= 2
+    
+    def test_token_bucket_limits_rate(self):
+        """Test that a token bucket lets a burst through and then paces acquisitions."""
+        import time
+        bucket = TokenBucket(rate=20, capacity=2)
+        
+        start = time.monotonic()
+        for _ in range(4):
+            bucket.acquire()
+        
+        assert 0.08 <= time.monotonic() - start < 0.5
+    
+    def test_token_bucket_capacity_follows_rate(self):
+        """Test that slowing down also shrinks the burst a full bucket can send."""
+        bucket = TokenBucket(rate=20)
+        
+        bucket.set_rate(10)
+        assert bucket.capacity == 10 and bucket._tokens <= 10
+        bucket.set_rate(0.1)
+        assert bucket.capacity == 1
+        bucket.set_rate(20)
+        assert bucket.capacity == 20
+    
+    def test_rate_limiter_adapts_to_smtp_replies(self, smtp_sink, monkeypatch):
+        """Test that throttling replies halve the rates and sustained success restores them."""
+        limiter = AdaptiveRateLimiter(relay_rate=100, domain_rate=100, domain_rates={'gmail.com': 40},
+                                      recovery=2.0, recovery_after=2)
+        monkeypatch.setattr('tasks.rate_limit._limiter', limiter)
+        monkeypatch.setenv('SMTP_SERVER', smtp_sink.host)
+        monkeypatch.setenv('SMTP_PORT', str(smtp_sink.port))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        smtp_sink.forced_replies['RCPT'] = ['451 4.7.1 Try again later']
+        
+        assert send_email('a@gmail.com', 'Hi', 'Body', 'noreply@example.com') is False
+        throttled = limiter.metrics()
+        assert throttled['domains']['gmail.com']['rate'] == 20
+        assert throttled['relays'][f'{smtp_sink.host}:{smtp_sink.port}']['throttled'] == 1
+        
+        assert send_email('b@gmail.com', 'Hi', 'Body', 'noreply@example.com') is True
+        assert send_email('c@gmail.com', 'Hi', 'Body', 'noreply@example.com') is True
+        assert limiter.metrics()['domains']['gmail.com'] == {'rate': 40, 'configured_rate': 40, 'throttled': 1}
+    
+    def test_send_bulk_emails_groups_identical_messages(self, smtp_sink, monkeypatch):
+        """Test that unpersonalized bulk mail shares transactions per domain and reports refused recipients."""
+        monkeypatch.setenv('SMTP_SERVER', smtp_sink.host)
+        monkeypatch.setenv('SMTP_PORT', str(smtp_sink.port))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('SMTP_MAX_RECIPIENTS', '2')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        monkeypatch.setattr('tasks.rate_limit._limiter', AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000))
+        smtp_sink.forced_replies['RCPT'] = ['550 5.1.1 No such user']
+        recipients = ['a@example.com', 'b@other.org', 'c@example.com', 'd@example.com', 'e@other.org']
+        
+        result = send_bulk_emails(recipients, 'Notice', 'Maintenance tonight', 'noreply@example.com',
+                                  personalize=False, max_workers=1)
+        
+        assert result == {'total_recipients': 5, 'sent': 4, 'failed': 1}
+        assert [m['rcpt_tos'] for m in smtp_sink.messages] == [['c@example.com'], ['d@example.com'],
+                                                               ['b@other.org', 'e@other.org']]
+        assert smtp_sink.command_count('DATA') == 3
+    
+    @pytest.mark.parametrize('extensions', [['PIPELINING'], []])
+    def test_pool_sends_multiple_recipients(self, extensions):
+        """Test multi-recipient transactions with and without PIPELINING."""
+        from smtp_sink import SMTPSink
+        sink = SMTPSink(extensions=extensions)
+        pool = SMTPConnectionPool(sink.host, sink.port, use_tls=False)
+        try:
+            refused = pool.sendmail('noreply@example.com', ['a@example.com', 'b@example.com'],
+                                    'Subject: hi\n\n.hidden dot\n')
+            with pytest.raises(smtplib.SMTPRecipientsRefused):
+                sink.forced_replies['RCPT'] = ['550 5.1.1 No such user']
+                pool.sendmail('noreply@example.com', ['x@example.com'], 'Subject: x\r\n\r\nX')
+            pool.sendmail('noreply@example.com', ['c@example.com'], 'Subject: c\r\n\r\nC')
+        finally:
+            pool.close()
+            sink.close()
+        
+        assert refused == {}
+        assert [m['rcpt_tos'] for m in sink.messages] == [['a@example.com', 'b@example.com'], ['c@example.com']]
+        assert sink.messages[0]['data'] == b'Subject: hi\r\n\r\n.hidden dot\r\n'
+        assert sink.connections == 1
+    
+    def test_async_pool_keeps_many_deliveries_in_flight(self, smtp_sink):
+        """Test that concurrent asyncio sends share a bounded set of authenticated sessions."""
+        import asyncio
+        
+        async def send_all():
+            pool = AsyncSMTPPool(smtp_sink.host, smtp_sink.port, 'user', 'secret', use_tls=False, max_size=3)
+            await asyncio.gather(*[
+                pool.sendmail('noreply@example.com', [f'user{i}@example.com'], f'Subject: {i}\r\n\r\nBody {i}')
+                for i in range(12)
+            ])
+            stats = pool.stats()
+            await pool.close()
+            return stats
+        
+        stats = asyncio.run(send_all())
+        
+        assert len(smtp_sink.messages) == 12
+        assert smtp_sink.connections == stats['created'] <= 3
+        assert smtp_sink.command_count('AUTH') == stats['created']
+        assert stats['reused'] == 12 - stats['created']
+    
+    def test_run_sync_cancels_coroutine_on_timeout(self):
+        """Test that a timed-out coroutine is cancelled instead of running on in the background."""
+        import asyncio
+        import concurrent.futures
+        import threading
+        from tasks.async_smtp import run_sync
+        cancelled = threading.Event()
+        
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        
+        with pytest.raises(concurrent.futures.TimeoutError):
+            run_sync(slow(), timeout=0.05)
+        assert cancelled.wait(1)
+    
+    def test_send_email_with_asyncio_backend(self, smtp_sink, monkeypatch):
+        """Test that the synchronous send_email wrapper delivers through the asyncio backend."""
+        monkeypatch.setenv('SMTP_BACKEND', 'asyncio')
+        monkeypatch.setenv('SMTP_SERVER', smtp_sink.host)
+        monkeypatch.setenv('SMTP_PORT', str(smtp_sink.port))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        monkeypatch.setattr('tasks.rate_limit._limiter', AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000))
+        
+        assert send_email('a@example.com', 'Hi', 'Body', 'noreply@example.com', bcc=['b@example.com']) is True
+        smtp_sink.forced_replies['RCPT'] = ['550 5.1.1 No such user']
+        assert send_email('x@example.com', 'Hi', 'Body', 'noreply@example.com') is False
+        
+        assert [m['rcpt_tos'] for m in smtp_sink.messages] == [['a@example.com', 'b@example.com']]
+        assert b'Subject: Hi' in smtp_sink.messages[0]['data']
+    
+    def test_send_bulk_emails_as_one_asyncio_batch(self, smtp_sink, monkeypatch):
+        """Test that the asyncio backend keeps the whole bulk send in flight without worker threads."""
+        monkeypatch.setenv('SMTP_BACKEND', 'asyncio')
+        monkeypatch.setenv('SMTP_SERVER', smtp_sink.host)
+        monkeypatch.setenv('SMTP_PORT', str(smtp_sink.port))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('SMTP_POOL_SIZE', '3')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        monkeypatch.setattr('tasks.rate_limit._limiter', AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000))
+        recipients = [f'user{i}@example.com' for i in range(8)]
+        smtp_sink.forced_replies['RCPT'] = ['550 5.1.1 No such user']
+        
+        result = send_bulk_emails(recipients, 'Hello {name}', 'Hi {name}', 'noreply@example.com',
+                                  max_workers=1)
+        
+        assert result == {'total_recipients': 8, 'sent': 7, 'failed': 1}
+        assert len(smtp_sink.messages) == 7
+        # A single worker thread would have needed only one session
+        assert 1 < smtp_sink.connections <= 3
+    
+    def test_relays_share_load_by_weight_and_fail_over(self, monkeypatch):
+        """Test weighted balancing over local relays, failover on 421 and background recovery."""
+        import time
+        from smtp_sink import SMTPSink
+        from tasks.smtp_relays import RelayPool, Relay
+        primary, secondary = SMTPSink(), SMTPSink()
+        relays = RelayPool([Relay(primary.host, primary.port, 3), Relay(secondary.host, secondary.port, 1)],
+                           failure_threshold=2, probe_interval=0.05)
+        monkeypatch.setattr('tasks.send_emails.get_relay_pool', lambda *args: relays)
+        monkeypatch.setattr('tasks.rate_limit._limiter', AdaptiveRateLimiter(relay_rate=1000, domain_rate=1000))
+        monkeypatch.setenv('SMTP_USE_TLS', 'false')
+        monkeypatch.setenv('MOCK_EMAILS', 'false')
+        
+        try:
+            for i in range(8):
+                assert send_email(f'user{i}@example.com', 'Hi', 'Body', 'noreply@example.com') is True
+            assert (len(primary.messages), len(secondary.messages)) == (6, 2)
+            
+            # The primary relay drops out of rotation; every message still goes out
+            reachable = []
+            probe = relays.probe
+            monkeypatch.setattr(relays, 'probe', lambda relay: bool(reachable) and probe(relay))
+            primary.forced_replies['MAIL'] = ['421 4.3.2 Service not available'] * 2
+            for i in range(4):
+                assert send_email(f'late{i}@example.com', 'Hi', 'Body', 'noreply@example.com') is True
+            assert relays.stats()[f'{primary.host}:{primary.port}']['healthy'] is False
+            assert (len(primary.messages), len(secondary.messages)) == (6, 6)
+            
+            reachable.append(True)
+            deadline = time.monotonic() + 2
+            while not relays.stats()[f'{primary.host}:{primary.port}']['healthy'] and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert relays.stats()[f'{primary.host}:{primary.port}']['healthy'] is True
+        finally:
+            primary.close()
+            secondary.close()
@@ -11,9 +11,16 @@ from mock_taskinity import mock_task
 
 # Now we can safely import the tasks
 from tasks.fetch_emails import fetch_emails
+from tasks.group_threads import group_threads
+from tasks.deduplicate_emails import deduplicate_emails, NearDuplicateIndex
 from tasks.classify_emails import classify_emails
-from tasks.process_emails import process_urgent_emails, process_emails_with_attachments, process_regular_emails
-from tasks.send_emails import send_email
+from tasks.process_emails import process_urgent_emails, process_emails_with_attachments, process_regular_emails, process_support_emails
+from tasks.response_templates import CompiledTemplate, load_templates
+from tasks.extract_fields import extract_fields
+from tasks.micro_batch import MicroBatcher
+from tasks.send_emails import send_email, send_responses
+from tasks.outbound_spool import OutboundSpool, drain_spool
+from tasks.mime_skeleton import MessageSkeleton
 
 class TestEmailTasks:
     """Test suite for the email processing tasks."""
@@ -39,6 +46,65 @@ class TestEmailTasks:
         mock_instance.close.assert_called_once()
         mock_instance.logout.assert_called_once()
     
+    def test_group_threads(self):
+        """Test that follow-ups in one conversation collapse into a single thread."""
+        emails = [
+            {'id': '1', 'subject': 'Problem with login', 'body': 'I cannot log in', 'from': 'anna@example.com',
+             'date': 'Thu, 24 May 2025 10:00:00 +0200', 'message_id': '<a1@example.com>'},
+            {'id': '2', 'subject': 'Re: Problem with login', 'body': 'Still broken', 'from': 'anna@example.com',
+             'date': 'Thu, 24 May 2025 11:00:00 +0200', 'message_id': '<a2@example.com>',
+             'in_reply_to': '<a1@example.com>', 'references': '<a1@example.com>'},
+            {'id': '3', 'subject': 'RE: problem with  login', 'body': 'Any update?', 'from': 'Anna <anna@example.com>',
+             'date': 'Thu, 24 May 2025 12:00:00 +0200', 'message_id': '<a3@example.com>'},
+            {'id': '4', 'subject': 'Problem with login', 'body': 'Me too', 'from': 'bob@example.com',
+             'date': 'Thu, 24 May 2025 12:30:00 +0200', 'message_id': '<b1@example.com>'}
+        ]
+
+        threads = group_threads(emails)
+
+        assert len(threads) == 2
+        anna_thread = next(t for t in threads if t['thread_size'] == 3)
+        assert anna_thread['id'] == '3'
+        assert anna_thread['thread_ids'] == ['1', '2', '3']
+    
+    def test_deduplicate_emails(self):
+        """Test that near-identical bodies reuse the classification of their cluster."""
+        body = ("Congratulations! You have been selected for our exclusive spring offer. "
+                "Click the link below to claim your discount before the end of the week.")
+        first = {'id': '1', 'subject': 'Spring offer', 'body': body, 'from': 'promo@example.com',
+                 'message_id': '<offer-1@example.com>'}
+        second = {'id': '1', 'subject': 'Spring offer', 'body': body + " Reference 42.", 'from': 'promo@example.com',
+                  'message_id': '<offer-2@example.com>'}
+        other = {'id': '3', 'subject': 'Quarterly report', 'from': 'reports@example.com',
+                 'body': 'Please find attached the quarterly report with revenue and cost figures for Q2 2025.'}
+        index = NearDuplicateIndex()
+
+        first_batch = deduplicate_emails([first, other], index=index)
+        classify_emails(first_batch)
+        second_batch = deduplicate_emails([second], index=index)
+
+        assert first_batch == [first, other]
+        # IMAP ids restart with every run, so the cluster is identified by Message-ID
+        assert second_batch[0]['duplicate_of'] == '<offer-1@example.com>'
+        assert second_batch[0]['categories'] == first['categories']
+        assert deduplicate_emails([dict(second, id='4')], suppress=True, index=index) == []
+
+    def test_deduplicate_emails_within_batch(self):
+        """Test that a duplicate of an email in the same batch reuses its classification."""
+        body = ("Your order has been shipped and will arrive within three business days. "
+                "Track the parcel with the link in your account.")
+        first = {'id': '1', 'subject': 'Order shipped', 'body': body, 'from': 'shop@example.com'}
+        second = {'id': '2', 'subject': 'Order shipped', 'body': body + " Thank you.", 'from': 'shop@example.com'}
+
+        batch = deduplicate_emails([first, second], index=NearDuplicateIndex())
+        with patch('tasks.classify_emails._categorize', return_value=['order']) as categorize:
+            classified = classify_emails(batch)
+
+        assert categorize.call_count == 1
+        assert second['duplicate_of'] == '1'
+        assert second['categories'] == ['order']
+        assert classified['order_emails'] == [first, second]
+    
     def test_classify_emails(self):
         """Test that emails are correctly classified."""
         # Sample emails
@@ -69,11 +135,11 @@ class TestEmailTasks:
                len(classified['support_emails']) + \
                len(classified['order_emails']) > 0
     
-    @patch('tasks.process_emails._generate_urgent_response')
-    def test_process_urgent_emails(self, mock_generate):
+    @patch('tasks.process_emails.get_template')
+    def test_process_urgent_emails(self, mock_get_template):
         """Test processing of urgent emails."""
         # Setup mock
-        mock_generate.return_value = "Urgent response"
+        mock_get_template.return_value.render_batch.return_value = ["Urgent response", "Urgent response"]
         
         # Sample urgent emails
         urgent_emails = [
@@ -86,10 +152,186 @@ class TestEmailTasks:
         
         # Assertions
         assert len(responses) == 2
-        assert mock_generate.call_count == 2
+        mock_get_template.assert_called_once_with('urgent')
+        assert len(mock_get_template.return_value.render_batch.call_args[0][0]) == 2
+        assert responses[1]['response_body'] == "Urgent response"
         assert responses[0]['response_subject'] == 'Re: URGENT: Action required'
         assert responses[0]['priority'] == 'high'
     
+    def test_process_support_emails_ticket_number(self):
+        """Test that the ticket number in the response body matches the response record."""
+        support_emails = [{'id': '7', 'subject': 'Help needed', 'body': 'It is broken', 'from': 'Jan Kowalski <jan@example.com>'}]
+        
+        responses = process_support_emails(support_emails)
+        
+        assert responses[0]['ticket_number'].startswith('SUP-')
+        assert responses[0]['ticket_number'] in responses[0]['response_body']
+        assert responses[0]['response_body'].startswith('Dear Jan,')
+    
+    def test_extract_fields(self):
+        """Test that structured fields are extracted once and kept on the email record."""
+        email = {'id': '5', 'subject': 'Invoice #99999 for order #12345',
+                 'body': 'Regarding ticket SUP-1716543210-3, see invoice no. FV/2025/17.'}
+        
+        fields = extract_fields(email)
+        
+        assert fields['order_number'] == '#12345'
+        assert fields['ticket_id'] == 'SUP-1716543210-3'
+        assert fields['invoice_number'] == '99999'
+        assert fields['order_number_offset'] == 8  # "#99999", before the preferred "order #12345"
+        assert email['fields'] is fields
+        assert extract_fields({'subject': 'Zamówienie nr 777', 'body': ''})['order_number'] == '#777'
+        assert extract_fields({'subject': 'Hello', 'body': 'No numbers here'})['order_number'] is None
+    
+    def test_order_number_next_to_ticket_and_invoice(self):
+        """Test that "#12345" after a ticket or invoice keyword still counts as an order number."""
+        from tasks.classify_emails import _is_order_related
+        from tasks.process_emails import _extract_order_number
+        
+        ticket = {'id': '1', 'subject': 'Ticket #12345 still open', 'body': 'Any news?'}
+        invoice = {'id': '2', 'subject': 'Invoice #99999', 'body': ''}
+        
+        assert _is_order_related(ticket) and _is_order_related(invoice)
+        assert _extract_order_number(ticket) == '#12345'
+        assert _extract_order_number(invoice) == '#99999'
+        assert extract_fields(ticket)['ticket_id'] == '12345'
+        
+        # Only the first 200 characters of the body are checked for classification
+        late = {'id': '3', 'subject': 'Hello', 'body': 'x' * 500 + ' #12345'}
+        assert not _is_order_related(late)
+    
+    def test_response_templates(self, tmp_path):
+        """Test template compilation and reloading after the config file changes."""
+        template = CompiledTemplate("Dear {name}, {{literal}} re: {subject}")
+        assert template.placeholders == {'name', 'subject'}
+        assert template.render_batch([{'name': 'Ann', 'subject': 'A'}, {'name': 'Bob', 'subject': 'B'}]) == \
+            ['Dear Ann, {literal} re: A', 'Dear Bob, {literal} re: B']
+        
+        text = "{name!r:>8}|{count:03d}|{ratio:.1%}|{name}"
+        values = {'name': 'Ann', 'count': 7, 'ratio': 0.25}
+        assert CompiledTemplate(text).render(values) == text.format(**values)
+        for unsupported in ("{0}", "{user.name}", "{name:{width}}", "{name!x}"):
+            with pytest.raises(ValueError):
+                CompiledTemplate(unsupported)
+        
+        templates_file = tmp_path / 'templates.json'
+        templates_file.write_text('{"regular": "Hello {name}"}')
+        assert load_templates(str(templates_file))['regular'].render({'name': 'Ann'}) == 'Hello Ann'
+        templates_file.write_text('{"regular": "Good morning {name}"}')
+        assert load_templates(str(templates_file))['regular'].render({'name': 'Ann'}) == 'Good morning Ann'
+    
+    def test_micro_batcher_flushes_by_size_and_time(self):
+        """Test that batches are flushed when full or when the oldest item is too old."""
+        import time
+        batches = []
+        
+        with MicroBatcher(batches.append, max_size=3, max_delay_ms=50) as batcher:
+            for item in range(4):
+                batcher.add(item)
+            time.sleep(0.2)
+            batcher.add(4)
+        
+        stats = batcher.stats()
+        assert batches == [[0, 1, 2], [3], [4]]
+        assert stats['flush_reasons'] == {'size': 1, 'time': 1, 'close': 1}
+        assert stats['items'] == 5 and stats['max_batch_size'] == 3
+    
+    def test_outbound_spool_backoff_and_dead_letters(self, tmp_path):
+        """Test that failed attempts back off exponentially and end in the dead-letter state."""
+        spool = OutboundSpool(str(tmp_path / 'outbound.db'), max_attempts=3, base_delay=10)
+        spool_id = spool.enqueue({'original_from': 'a@example.com'})
+        
+        assert spool.claim() == [(spool_id, {'original_from': 'a@example.com'})]
+        assert spool.claim() == []  # leased while being sent
+        assert spool.mark_failed(spool_id, 'timeout') == 'pending'
+        assert spool.claim() == []  # waiting for the retry delay
+        
+        assert spool.mark_failed(spool_id, 'timeout') == 'pending'
+        assert spool.mark_failed(spool_id, 'timeout') == 'dead'
+        assert spool.stats() == {'pending': 0, 'sending': 0, 'sent': 0, 'dead': 1}
+        assert spool.dead_letters()[0]['attempts'] == 3
+        
+        spool.requeue(spool_id)
+        assert spool.claim() == [(spool_id, {'original_from': 'a@example.com'})]
+    
+    def test_send_responses_spools_failed_responses(self, tmp_path, monkeypatch):
+        """Test that responses failing in the flow are spooled and sent later by the drainer."""
+        spool = OutboundSpool(str(tmp_path / 'outbound.db'), base_delay=0)
+        monkeypatch.setattr('tasks.outbound_spool._spool', spool)
+        import smtplib
+        
+        def refuse(response):
+            raise smtplib.SMTPDataError(451, b'Try again later')
+        
+        monkeypatch.setattr('tasks.send_emails._deliver_response', refuse)
+        responses = [{'original_from': 'a@example.com', 'response_subject': 'Re: A', 'response_body': 'A'}]
+        
+        result = send_responses(regular_responses=responses, max_workers=1)
+        assert result['total_sent'] == 0 and result['total_spooled'] == 1
+        last_error = spool._connection().execute("SELECT last_error FROM outbound").fetchone()[0]
+        assert last_error == "SMTPDataError: (451, b'Try again later')"
+        
+        attempts = []
+        drained = drain_spool(spool, send=lambda response: attempts.append(response) or len(attempts) > 1)
+        assert drained == {'sent': 1, 'retried': 1, 'dead': 0}
+        assert attempts == responses * 2
+        assert spool.stats()['sent'] == 1
+    
+    def test_permanent_failures_become_dead_letters(self, tmp_path, monkeypatch):
+        """Test that 5xx replies and invalid input are not retried, unlike 4xx and connection errors."""
+        import smtplib
+        from tasks.outbound_spool import is_permanent_failure
+        from tasks.smtp_pool import SMTPDeliveryUncertain
+        spool = OutboundSpool(str(tmp_path / 'outbound.db'), base_delay=0)
+        monkeypatch.setattr('tasks.outbound_spool._spool', spool)
+        
+        def refuse(response):
+            raise smtplib.SMTPRecipientsRefused({'a@example.com': (550, b'No such user')})
+        
+        monkeypatch.setattr('tasks.send_emails._deliver_response', refuse)
+        responses = [{'original_from': 'a@example.com', 'response_subject': 'Re: A', 'response_body': 'A'}]
+        result = send_responses(regular_responses=responses, max_workers=1)
+        assert result['total_sent'] == 0 and result['total_spooled'] == 0
+        assert spool.stats()['dead'] == 1
+        
+        def reject(response):
+            raise smtplib.SMTPDataError(554, b'Rejected')
+        
+        spool.enqueue(responses[0], error='timeout')
+        drained = drain_spool(spool, send=reject)
+        assert drained == {'sent': 0, 'retried': 0, 'dead': 1}
+        
+        assert is_permanent_failure(ValueError('bad address'))
+        assert is_permanent_failure(SMTPDeliveryUncertain('lost after data'))
+        assert not is_permanent_failure(smtplib.SMTPDataError(451, b'Try again later'))
+        assert not is_permanent_failure(smtplib.SMTPRecipientsRefused({'a@example.com': (550, b''),
+                                                                      'b@example.com': (452, b'')}))
+        assert not is_permanent_failure(smtplib.SMTPServerDisconnected('gone'))
+        assert not is_permanent_failure(ConnectionRefusedError())
+    
+    def test_message_skeleton(self):
+        """Test that skeletons render valid single-part and multipart messages per recipient."""
+        import email
+        skeleton = MessageSkeleton('Hello {name}', 'Dear {name},\nyour domain is {domain}.\n', 'noreply@example.com',
+                                   reply_to='help@example.com')
+        
+        message = email.message_from_bytes(skeleton.render('john.doe@example.com'))
+        assert not message.is_multipart()
+        assert message['To'] == 'john.doe@example.com'
+        assert message['Subject'] == 'Hello John'
+        assert message['Reply-To'] == 'help@example.com'
+        assert message['Content-Transfer-Encoding'] == '7bit'
+        assert message.get_payload(decode=True) == b'Dear John,\r\nyour domain is example.com.\r\n'
+        
+        unicode_skeleton = MessageSkeleton('Zażółć {x}', 'Gęślą {email}', 'noreply@example.com',
+                                           html_body='<p>Gęślą</p>', personalize=False)
+        message = email.message_from_bytes(unicode_skeleton.render('anna@example.com'))
+        assert message.get_content_type() == 'multipart/alternative'
+        assert str(email.header.make_header(email.header.decode_header(message['Subject']))) == 'Zażółć {x}'
+        plain, html = message.get_payload()
+        assert plain.get_payload(decode=True).decode('utf-8') == 'Gęślą {email}'
+        assert html.get_content_type() == 'text/html'
+    
     @patch('tasks.send_emails.smtplib.SMTP')
     @patch('tasks.send_emails.os.getenv')
     def test_send_email(self, mock_getenv, mock_smtp):